@@ -7,9 +7,11 @@ AI 模型推論模組。
 3. 管理模型的隨需載入（Lazy Loading）
 
 設計模式：
-- Singleton 模式：全域共用單一模型實例
-- 隨需載入：第一次呼叫時才載入模型，避免啟動時的資源消耗
+- 模型由 model_registry 載入與快取：同一模型只載入一次，best.pt 被覆寫時自動重新載入
+- 隨需載入：第一次呼叫時才載入模型 (Celery worker 啟動時另會預先載入，見 tasks.preload_models)
 - 容錯機制：模型不存在時不會中斷程式執行
+- 執行緒安全：YOLO predictor 保存批次狀態，推論時取得該模型的鎖；
+  處理音檔時由 inference_stage 收集片段後以 run_inference_batch 批次推論
 
 模型部署流程：
 1. 使用平台訓練功能產生 best.pt 模型檔案
@@ -24,9 +26,11 @@ AI 模型推論模組。
 - 運算裝置：自動偵測 CUDA GPU，否則使用 CPU
 """
 
-from ultralytics import YOLO
 import torch
 import os
+import numpy as np
+
+from .model_registry import model_registry
 
 # ============================================================================
 # 全域配置
@@ -40,20 +44,46 @@ print(f"AI 模型將使用運算裝置: {DEVICE}")
 # 注意：需要手動將訓練好的 best.pt 檔案放在此路徑
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "best.pt")
 
-# 全域模型實例（初始為 None，採用隨需載入）
-model = None
 
 
 # ============================================================================
 # 推論函式
 # ============================================================================
 
+def get_model():
+    """
+    取得 MODEL_PATH 的模型 (由 model_registry 快取，首次呼叫時載入)。
+
+    Returns:
+        LoadedModel | None: 模型檔案不存在或載入失敗時回傳 None
+    """
+    if not os.path.exists(MODEL_PATH):
+        return None
+    try:
+        return model_registry.get(MODEL_PATH, DEVICE, 'yolo')
+    except Exception as e:
+        print(f"AI 模型載入失敗: {e}")
+        return None
+
+
+def _top1(model, result):
+    """將單張影像的分類結果轉為 [{'label', 'confidence'}]（只取 Top-1）"""
+    if result.probs is None:
+        return []
+    top1_index = result.probs.top1                   # 最高信心度的類別索引
+    top1_confidence = result.probs.top1conf.item()   # 信心度值
+    return [{
+        "label": model.names[top1_index],
+        "confidence": round(top1_confidence, 4)
+    }]
+
+
 def run_inference(image_path):
     """
     對指定的頻譜圖影像執行 YOLOv8 分類推論。
     
     採用隨需載入機制：
-    - 首次呼叫時載入模型到記憶體
+    - 首次呼叫時載入模型到記憶體 (model_registry)
     - 後續呼叫重用已載入的模型
     - 模型檔案不存在時返回空結果（不中斷程式）
     
@@ -76,60 +106,49 @@ def run_inference(image_path):
         - verbose=False 避免在 console 印出過多日誌
         - 只返回 Top-1 預測結果（信心度最高的類別）
     """
-    global model
-
-    # ------------------------------------------------------------------------
-    # 模型隨需載入
-    # ------------------------------------------------------------------------
-    if model is None and os.path.exists(MODEL_PATH):
-        try:
-            print(f"正在載入 AI 模型: {MODEL_PATH}")
-            model = YOLO(MODEL_PATH)
-            model.to(DEVICE)
-            print("AI 模型載入成功")
-        except Exception as e:
-            print(f"AI 模型載入失敗: {e}")
-            return []
-
-    # ------------------------------------------------------------------------
-    # 檢查模型可用性
-    # ------------------------------------------------------------------------
-    if model is None:
+    entry = get_model()
+    if entry is None:
         # 模型檔案不存在，靜默返回空結果
-        # 註解此行以避免日誌過多
-        # print("AI 模型不可用，跳過推論")
         return []
 
-    # ------------------------------------------------------------------------
-    # 執行推論
-    # ------------------------------------------------------------------------
     try:
         # 執行預測（verbose=False 避免 console 輸出）
-        results = model(image_path, verbose=False)
-        
-        # 處理分類模型的預測結果
-        if results:
-            result = results[0]  # 取得第一張圖片的結果
-            
-            if result.probs is not None:
-                # 提取 Top-1 預測
-                top1_index = result.probs.top1          # 最高信心度的類別索引
-                top1_confidence = result.probs.top1conf.item()  # 信心度值
-                label = model.names[top1_index]         # 類別名稱
-                
-                # 返回格式化的結果
-                return [{
-                    "label": label,
-                    "confidence": round(top1_confidence, 4)
-                }]
-        
-        return []
+        with entry.lock:
+            results = entry.model(image_path, verbose=False)
+        return _top1(entry.model, results[0]) if results else []
         
     except Exception as e:
         print(f"推論過程發生錯誤 (影像: '{image_path}'): {e}")
         return []
 
 
+def run_inference_batch(images):
+    """
+    對多張已在記憶體中的頻譜圖執行一次批次推論。
+
+    Args:
+        images (list[np.ndarray]): RGB uint8 影像 [height, width, 3]
+
+    Returns:
+        list[list]: 與 images 順序相同的預測結果 (格式同 run_inference)；無模型或失敗時皆為 []
+
+    Note:
+        - ultralytics 將 numpy 影像視為 BGR (與 cv2.imread 相同)，此處先轉換，結果與讀取圖檔推論一致
+        - 整個 list 於同一次前向運算處理 (batch size = len(images))
+    """
+    entry = get_model() if images else None
+    if entry is None:
+        return [[] for _ in images]
+    try:
+        sources = [np.ascontiguousarray(image[..., ::-1]) for image in images]
+        with entry.lock:
+            results = entry.model(sources, verbose=False)
+        return [_top1(entry.model, result) for result in results]
+    except Exception as e:
+        print(f"批次推論過程發生錯誤 ({len(images)} 張影像): {e}")
+        return [[] for _ in images]
+
+
 # ============================================================================
 # 啟動檢查
 # ============================================================================
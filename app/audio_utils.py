@@ -5,20 +5,28 @@ import matplotlib
 # 使用非互動式後端，這在伺服器環境下至關重要
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib import mlab
 import numpy as np
 from scipy.io import wavfile
 from datetime import datetime
-from .ai_model import run_inference
+from .spectrogram_engine import create_engine, segment_frames, mel_from_magnitude, envelope_spectrum, ENVELOPE_MAX_FREQ
+from .spectrogram_engine import BandLimitedStft
+from .spectrogram_render import save_training_image, pop_training_image, centers_to_edges, YAMNET_TRAINING_SIZE, default_cmap
+from .spectrogram_store import SpectrogramStoreWriter, ENVELOPE_DB_EPS
+from .image_encoder import get_encoder, encoding_stats
+from .tile_pyramid import TilePyramidBuilder
+from .inference_stage import InferenceStage
+from .cpu_budget import cpu_budget
+from .spectrogram_render import get_display_template, ImageDisplayTemplate, LineDisplayTemplate, set_time_axis, set_mel_axis
+from .dsp_cache import dsp_cache, get_butter_sos, get_mel_transform, get_mel_filterbank
+from .dsp_cache import get_window as get_cached_window
 import soundfile as sf
 import torch
-import torchaudio
 import gc  # 垃圾回收模組
 import concurrent.futures
+import contextlib
 
-from scipy.signal import butter, sosfiltfilt, decimate, get_window, lfilter, hilbert
-from numpy.fft import fft, fftfreq
+from scipy.signal import sosfiltfilt, decimate
 
 # --- 偵測 GPU 裝置 ---
 _TORCH_DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -38,6 +46,14 @@ class YAMNetParams:
     patch_hop_seconds: float = 0.48
     tflite_compatible: bool = False
 
+def yamnet_params_from_spec_params(spec_params=None):
+    """依使用者的 window_overlap 設定調整 YAMNet 的 STFT hop"""
+    params = YAMNetParams()
+    if spec_params and 'window_overlap' in spec_params:
+        overlap_ratio = spec_params.get('window_overlap', 0.6)  # Default YAMNet overlap is 60% (15ms / 25ms)
+        params.stft_hop_seconds = params.stft_window_seconds * (1.0 - overlap_ratio)
+    return params
+
 def waveform_to_log_mel_spectrogram_patches(waveform, params):
     """
     使用 PyTorch (torchaudio) 計算 Log Mel 頻譜圖，支援 GPU 加速。
@@ -47,17 +63,11 @@ def waveform_to_log_mel_spectrogram_patches(waveform, params):
     hop_length_samples = int(round(params.sample_rate * params.stft_hop_seconds))
     fft_length = 2 ** int(np.ceil(np.log(window_length_samples) / np.log(2.0)))
 
-    # 建立 MelSpectrogram 轉換器 (在目標裝置上運行)
-    mel_transform = torchaudio.transforms.MelSpectrogram(
-        sample_rate=int(params.sample_rate),
-        n_fft=fft_length,
-        win_length=window_length_samples,
-        hop_length=hop_length_samples,
-        n_mels=params.mel_bands,
-        f_min=params.mel_min_hz,
-        f_max=params.mel_max_hz,
-        power=1.0,  # 幅度頻譜 (非功率頻譜)
-    ).to(_TORCH_DEVICE)
+    # 取得快取的 MelSpectrogram 轉換器 (在目標裝置上運行，power=1.0 為幅度頻譜)
+    mel_transform = get_mel_transform(
+        params.sample_rate, fft_length, window_length_samples, hop_length_samples,
+        params.mel_bands, params.mel_min_hz, params.mel_max_hz, 1.0, _TORCH_DEVICE
+    )
 
     # 將 waveform 轉為 PyTorch tensor 並移至 GPU
     if isinstance(waveform, np.ndarray):
@@ -65,22 +75,24 @@ def waveform_to_log_mel_spectrogram_patches(waveform, params):
     else:
         waveform_tensor = torch.tensor(waveform, dtype=torch.float32)
 
-    if waveform_tensor.dim() == 1:
+    # 支援 [samples] 或批次 [n_segments, samples] 輸入
+    is_batch = waveform_tensor.dim() > 1
+    if not is_batch:
         waveform_tensor = waveform_tensor.unsqueeze(0)  # [1, samples]
 
     waveform_tensor = waveform_tensor.to(_TORCH_DEVICE)
 
     # GPU 加速運算：STFT + Mel 濾波 + Log
-    mel_spec = mel_transform(waveform_tensor)  # [1, n_mels, time]
+    mel_spec = mel_transform(waveform_tensor)  # [batch, n_mels, time]
     log_mel_spec = torch.log(mel_spec + params.log_offset)
 
-    # 轉回 NumPy (移回 CPU)
-    result = log_mel_spec.squeeze(0).T.cpu().numpy()  # [time, n_mels] 與原本 TF 版本相同
+    # 轉回 NumPy (移回 CPU)，[time, n_mels] 與原本 TF 版本相同
+    result = log_mel_spec.transpose(-1, -2).cpu().numpy()
+    if not is_batch:
+        result = result[0]
 
-    # 釋放 GPU 記憶體
+    # 釋放張量參考；不在每個片段呼叫 empty_cache，由 PyTorch 快取分配器重用 GPU 記憶體
     del waveform_tensor, mel_spec, log_mel_spec
-    if _TORCH_DEVICE.type == 'cuda':
-        torch.cuda.empty_cache()
 
     return result
 
@@ -93,10 +105,7 @@ CLASSIC_DEMON_PARAMS = {
 }
 
 def _bandpass_filter(signal, fs, lowcut, highcut, order=5):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    sos = butter(order, [low, high], btype='band', output='sos')
+    sos = get_butter_sos(order, lowcut, highcut, fs)
     return sosfiltfilt(sos, signal)
 
 def _square_law_demodulate(signal):
@@ -104,15 +113,15 @@ def _square_law_demodulate(signal):
 
 # --- 核心繪圖函式 (已加入記憶體保護) ---
 
-def save_spectrogram(y, sr, out_path_display, out_path_training, spec_type='mel', spec_params=None):
+def save_spectrogram(y, sr, out_path_display, out_path_training, spec_type='mel', spec_params=None, precomputed=None, stored=None):
     """
     儲存頻譜圖。
     
     參數:
         y: 音訊資料
         sr: 取樣率
-        out_path_display: 顯示用頻譜圖路徑
-        out_path_training: 訓練用頻譜圖路徑
+        out_path_display: 顯示用頻譜圖路徑 (None 表示不輸出，改由顯示端點隨需繪製)
+        out_path_training: 訓練用頻譜圖路徑 (None 表示不輸出)
         spec_type: 頻譜圖類型 ('mel', 'stft', 'classic_demon', 'envelope_spectrum', 'yamnet_log_mel')
         spec_params: 頻譜圖參數字典，包含:
             - n_fft: FFT window size (預設 1024)
@@ -120,8 +129,17 @@ def save_spectrogram(y, sr, out_path_display, out_path_training, spec_type='mel'
             - window_type: 窗函數類型 (預設 'hann')
             - n_mels: Mel 濾波器數量 (預設 128)
             - f_min: 最低頻率 (預設 0)
-            - f_max: 最高頻率 (預設 sr/2)
+            - f_max: 最高頻率 (預設 sr/2)，STFT 會依此降取樣並裁切頻率 bin
+            - stft_method: STFT 頻帶運算方式 ('fft' 或 'zoom'，預設 'fft')
+            - zoom_bins: Zoom FFT 在頻帶內的頻率點數 (預設 n_fft // 2 + 1)
             - power: 功率指數 (預設 2.0)
+            - image_format: 訓練用圖格式 ('png_fast', 'png', 'webp'，預設見 image_encoder)
+        precomputed: 由區塊引擎切出的頻譜或 DEMON 降取樣訊號 (可選)，提供時略過逐片段運算
+        stored: spectrogram_store 保存的矩陣 (可選，僅 STORE_DISPLAY_TYPES)，提供時直接繪製顯示用圖，
+            y 可為 None (片段長度由 spec_params 的 time_start / time_end 換算)
+    
+    回傳:
+        訓練用圖所繪製的矩陣 (供 spectrogram_store 儲存)；繪圖失敗時回傳 None
     """
     # 預設參數
     if spec_params is None:
@@ -141,285 +159,499 @@ def save_spectrogram(y, sr, out_path_display, out_path_training, spec_type='mel'
     
     # 分流處理特殊圖形
     if spec_type == 'classic_demon':
-        save_classic_demon_plot(y, sr, out_path_display, out_path_training, spec_params)
-        return
+        return save_classic_demon_plot(y, sr, out_path_display, out_path_training, spec_params, precomputed)
     elif spec_type == 'envelope_spectrum':
-        save_envelope_spectrum_plot(y, sr, out_path_display, out_path_training, spec_params)
-        return
+        return save_envelope_spectrum_plot(y, sr, out_path_display, out_path_training, spec_params, precomputed)
     elif spec_type == 'yamnet_log_mel':
-        save_yamnet_log_mel_plot(y, sr, out_path_display, out_path_training, spec_params)
-        return
+        return save_yamnet_log_mel_plot(y, sr, out_path_display, out_path_training, spec_params, precomputed, stored)
 
-    # 標準 STFT 處理
-    fig = None
+    # 標準 STFT / Mel 處理
     try:
-        fig = Figure(figsize=(6, 4))
-        canvas = FigureCanvas(fig)
-        ax = fig.add_subplot(111)
-        
         time_str = ""
         if 'time_start' in spec_params and 'time_end' in spec_params:
             time_str = f" ({spec_params['time_start']:.1f}s - {spec_params['time_end']:.1f}s)"
         
         if spec_type == 'stft':
-            D = librosa.stft(
-                y, 
-                n_fft=n_fft, 
-                hop_length=hop_length,
-                win_length=n_fft,
-                window=window_type
-            )
-            if power == 2.0:
-                S_db = librosa.power_to_db(np.abs(D)**2, ref=np.max)
+            # 依 f_min / f_max 降取樣並只保留頻帶內的 bin (未設定頻帶時等同完整 STFT)
+            band = BandLimitedStft.create(sr, spec_params)
+            display_sr, hop_length = band.sr, band.hop_length
+            if band.is_full_band:
+                y_extent = (0, sr / 2)
             else:
-                S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
-            display_data = S_db
+                # 頻帶內 bin 的中心頻率往外延伸半格作為影像邊界
+                half_bin = (band.freqs[1] - band.freqs[0]) / 2 if len(band.freqs) > 1 else 0.5
+                y_extent = (max(0.0, band.freqs[0] - half_bin), band.freqs[-1] + half_bin)
+            if stored is None:
+                S = precomputed if precomputed is not None else band.magnitude(y)
+                if power == 2.0:
+                    display_data = librosa.power_to_db(S**2, ref=np.max)
+                else:
+                    display_data = librosa.amplitude_to_db(S, ref=np.max)
+            y_axis = 'hz'
+            title = 'STFT Spectrogram'
+        elif spec_type == 'mel':
+            if stored is None:
+                if precomputed is not None:
+                    M = precomputed
+                else:
+                    S = np.abs(librosa.stft(
+                        y,
+                        n_fft=n_fft,
+                        hop_length=hop_length,
+                        win_length=n_fft,
+                        window=window_type
+                    ))
+                    M = mel_from_magnitude(S, get_mel_filterbank(sr, n_fft, n_mels, f_min, f_max), power)
+                # power=2.0 為功率 Mel 頻譜，其餘視為幅度
+                if power == 2.0:
+                    display_data = librosa.power_to_db(M, ref=np.max)
+                else:
+                    display_data = librosa.amplitude_to_db(M, ref=np.max)
+            y_axis = 'mel'
+            title = 'Mel Spectrogram'
+            display_sr = sr
+            y_extent = (librosa.hz_to_mel(f_min), librosa.hz_to_mel(f_max))
         else:
             return
 
-        specshow_kwargs = {
-            'sr': sr,
-            'x_axis': 'time',
-            'ax': ax,
-            'y_axis': 'hz'
-        }
-
         # 預防 Matplotlib 繪製極度密集的數據矩陣時引發 OOM (Signal 9 SIGKILL)
         # 對時間軸進行 Max Pooling 降採樣
-        if display_data.shape[1] > 2000:
+        if stored is not None:
+            # 存檔的矩陣已池化：由片段長度換算池化前的欄數 (center=True 的 frame 數)，以取得相同的 hop
+            display_data = stored
+            n_samples = int(round((spec_params['time_end'] - spec_params['time_start']) * sr))
+            n_columns = 1 + -(-n_samples // int(round(sr / display_sr))) // hop_length
+            if n_columns > 2000:
+                hop_length = hop_length * (n_columns // 1000)
+        elif display_data.shape[1] > 2000:
             factor = display_data.shape[1] // 1000
             trunc_len = (display_data.shape[1] // factor) * factor
             display_data = display_data[:, :trunc_len].reshape(display_data.shape[0], -1, factor).max(axis=2)
             hop_length = hop_length * factor
 
-        specshow_kwargs['hop_length'] = hop_length
-
-        # 1. 繪製顯示用圖 (包含座標軸與標題)
-        librosa.display.specshow(display_data, **specshow_kwargs)
-        ax.set_title(f'STFT Spectrogram{time_str}')
-        fig.colorbar(ax.collections[0], ax=ax, format='%+2.0f dB')
-        fig.tight_layout()
-        fig.savefig(out_path_display, dpi=100)
+        # 1. 顯示用圖：沿用本執行緒已排版的 figure 樣板，只替換影像與標題
+        if out_path_display:
+            if y_axis == 'mel':
+                key = ('mel', float(f_min), float(f_max))
+                setup_axes = lambda ax: (set_time_axis(ax), set_mel_axis(ax, f_min, f_max))
+            else:
+                key = ('stft',)
+                setup_axes = lambda ax: (set_time_axis(ax), ax.set_ylabel('Hz'))
+            template = get_display_template(key, lambda: ImageDisplayTemplate(
+                (6, 4), colorbar_format='%+2.0f dB', setup_axes=setup_axes
+            ))
+            duration = display_data.shape[1] * hop_length / display_sr
+            template.render(
+                display_data, (0, duration) + tuple(y_extent), f'{title}{time_str}', out_path_display,
+                cmap=default_cmap(display_data)
+            )
         
-        # 2. 清除內容並繪製訓練用圖 (無座標軸純圖)
-        fig.clear()
-        ax = fig.add_subplot(111)
-        librosa.display.specshow(display_data, sr=sr, ax=ax, hop_length=hop_length)
-        ax.axis('off')
-        fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
-        fig.savefig(out_path_training, bbox_inches='tight', pad_inches=0, dpi=100)
+        # 2. 訓練用圖 (無座標軸純圖) 以 LUT 直接輸出，不經 matplotlib
+        if out_path_training:
+            save_training_image(display_data, out_path_training, encoder=get_encoder(spec_params.get('image_format')))
+        return display_data
     
     except Exception as e:
         print(f"繪圖失敗 ({spec_type}): {e}")
-    finally:
-        # 強制關閉圖表釋放記憶體
-        if fig:
-            fig.clf()
-
-def save_yamnet_log_mel_plot(y, sr, out_path_display, out_path_training, spec_params=None):
-    """繪製 YAMNet 格式的 Log Mel 頻譜圖"""
-    fig = None
+
+def save_yamnet_log_mel_plot(y, sr, out_path_display, out_path_training, spec_params=None, precomputed=None, stored=None):
+    """繪製 YAMNet 格式的 Log Mel 頻譜圖 (precomputed 為共用矩陣切出的 [time, n_mels]；stored 為存檔的 [n_mels, time])"""
     try:
-        params = YAMNetParams()
-        if spec_params and 'window_overlap' in spec_params:
-            overlap_ratio = spec_params.get('window_overlap', 0.6)  # Default YAMNet overlap is 60% (15ms / 25ms)
-            params.stft_hop_seconds = params.stft_window_seconds * (1.0 - overlap_ratio)
+        params = yamnet_params_from_spec_params(spec_params)
         
-        # 確保取樣率為 16000 Hz (YAMNet 要求)
-        if sr != params.sample_rate:
-            y = librosa.resample(y, orig_sr=sr, target_sr=int(params.sample_rate))
-        
-        log_mel_spectrogram = waveform_to_log_mel_spectrogram_patches(y, params)
-        data_to_plot = np.array(log_mel_spectrogram).T
+        if stored is not None:
+            data_to_plot = stored
+        else:
+            if precomputed is not None:
+                log_mel_spectrogram = precomputed
+            else:
+                # 確保取樣率為 16000 Hz (YAMNet 要求)
+                if sr != params.sample_rate:
+                    y = librosa.resample(y, orig_sr=sr, target_sr=int(params.sample_rate))
+                log_mel_spectrogram = waveform_to_log_mel_spectrogram_patches(y, params)
+            data_to_plot = np.array(log_mel_spectrogram).T
 
-        fig = Figure(figsize=(9.69, 3.7))
-        canvas = FigureCanvas(fig)
-        ax = fig.add_subplot(111)
         hop_length = int(params.sample_rate * params.stft_hop_seconds)
         
-        img = librosa.display.specshow(
-            data_to_plot, 
-            sr=params.sample_rate, 
-            hop_length=hop_length, 
-            x_axis='time', 
-            y_axis='mel', 
-            fmin=params.mel_min_hz, 
-            fmax=params.mel_max_hz,
-            ax=ax,
-            cmap='viridis'
-        )
-        
-        time_str = ""
-        if spec_params and 'time_start' in spec_params and 'time_end' in spec_params:
-            time_str = f" ({spec_params['time_start']:.1f}s - {spec_params['time_end']:.1f}s)"
-        ax.set_title(f"Mel Spectrogram{time_str}")
-        fig.colorbar(img, ax=ax, format='%+2.0f dB')
-        fig.tight_layout()
-        fig.savefig(out_path_display, dpi=100)
+        if out_path_display:
+            time_str = ""
+            if spec_params and 'time_start' in spec_params and 'time_end' in spec_params:
+                time_str = f" ({spec_params['time_start']:.1f}s - {spec_params['time_end']:.1f}s)"
+            template = get_display_template(
+                ('yamnet_log_mel', params.mel_min_hz, params.mel_max_hz),
+                lambda: ImageDisplayTemplate(
+                    (9.69, 3.7), cmap='viridis', colorbar_format='%+2.0f dB',
+                    setup_axes=lambda ax: (set_time_axis(ax), set_mel_axis(ax, params.mel_min_hz, params.mel_max_hz))
+                )
+            )
+            duration = data_to_plot.shape[1] * hop_length / params.sample_rate
+            extent = (0, duration, librosa.hz_to_mel(params.mel_min_hz), librosa.hz_to_mel(params.mel_max_hz))
+            template.render(data_to_plot, extent, f"Mel Spectrogram{time_str}", out_path_display)
         
-        fig.clear()
-        ax = fig.add_subplot(111)
-        librosa.display.specshow(
-            data_to_plot, 
-            sr=params.sample_rate, 
-            hop_length=hop_length,
-            ax=ax,
-            cmap='viridis'
-        )
-        ax.axis('off')
-        fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
-        fig.savefig(out_path_training, dpi=100, bbox_inches='tight', pad_inches=0)
+        if out_path_training:
+            save_training_image(
+                data_to_plot, out_path_training, YAMNET_TRAINING_SIZE, cmap='viridis',
+                encoder=get_encoder((spec_params or {}).get('image_format'))
+            )
+        return data_to_plot
     except Exception as e:
         print(f"繪製 YAMNet Log Mel 頻譜圖時發生錯誤: {e}")
-    finally:
-        if fig: fig.clf()
 
-def save_classic_demon_plot(segment, sr, out_path_display, out_path_training, spec_params=None):
-    fig = None
-    try:
-        params = CLASSIC_DEMON_PARAMS
-        nyquist = sr / 2
-        bandpass_high = min(params['BANDPASS_HIGH'], nyquist * 0.99)
-        if params['BANDPASS_LOW'] >= bandpass_high: return
+def save_classic_demon_plot(segment, sr, out_path_display, out_path_training, spec_params=None, precomputed=None):
+    """繪製 DEMON 頻譜圖 (precomputed 為 DemonEngine 整檔處理後切出的降取樣訊號)"""
+    params = CLASSIC_DEMON_PARAMS
+    nyquist = sr / 2
+    bandpass_high = min(params['BANDPASS_HIGH'], nyquist * 0.99)
+    if params['BANDPASS_LOW'] >= bandpass_high: return
+    decimation_factor = max(1, int(sr / params['DOWNSAMPLE_RATE']))
+    if precomputed is not None:
+        decimated_signal = precomputed
+    else:
         filtered = _bandpass_filter(segment, sr, params['BANDPASS_LOW'], bandpass_high)
         demodulated = _square_law_demodulate(filtered)
-        decimation_factor = max(1, int(sr / params['DOWNSAMPLE_RATE']))
         decimated_signal = decimate(demodulated, decimation_factor)
-        processed_signal = decimated_signal - np.mean(decimated_signal)
-        fs_demo = sr // decimation_factor
-        window = get_window(params['WINDOW_TYPE'], params['WINDOW_SIZE'])
-        fig = Figure(figsize=(6, 4))
-        canvas = FigureCanvas(fig)
-        ax = fig.add_subplot(111)
-        
-        S, freqs, times, _ = ax.specgram(processed_signal, NFFT=params['WINDOW_SIZE'], Fs=fs_demo, window=window, noverlap=int(params['WINDOW_SIZE'] * params['WINDOW_OVERLAP_RATIO']))
-        S_db = 10 * np.log10(S + 1e-9)
+    processed_signal = decimated_signal - np.mean(decimated_signal)
+    fs_demo = sr // decimation_factor
+    window = get_cached_window(params['WINDOW_TYPE'], params['WINDOW_SIZE'])
+    nfft = params['WINDOW_SIZE']
+    noverlap = int(nfft * params['WINDOW_OVERLAP_RATIO'])
 
-        ax.pcolormesh(times, freqs, S_db, cmap='viridis', shading='auto')
-        ax.set_ylim(0, params['FREQ_YLIM'])
-        ax.set_ylabel('Modulation Frequency (Hz)')
-        ax.set_xlabel('Time (s)')
-        
+    # 與 Axes.specgram 相同的運算 (mlab.specgram)，但不需建立圖表
+    S, freqs, times = mlab.specgram(processed_signal, NFFT=nfft, Fs=fs_demo, window=window, noverlap=noverlap)
+    S_db = 10 * np.log10(S + 1e-9)
+
+    if out_path_display:
         time_str = ""
         if spec_params and 'time_start' in spec_params and 'time_end' in spec_params:
             time_str = f" ({spec_params['time_start']:.1f}s - {spec_params['time_end']:.1f}s)"
-        ax.set_title(f"Classic DEMON Spectrogram (2D){time_str}")
-        fig.colorbar(ax.collections[0], ax=ax, label='Amplitude (dB)')
-        fig.tight_layout()
-        fig.savefig(out_path_display, dpi=100)
-        
-        fig.clear()
-        ax = fig.add_subplot(111)
-        ax.pcolormesh(times, freqs, S_db, cmap='viridis', shading='auto')
-        ax.set_ylim(0, params['FREQ_YLIM'])
-        ax.axis('off')
-        fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
-        fig.savefig(out_path_training, bbox_inches='tight', pad_inches=0, dpi=100)
-    finally:
-        if fig: fig.clf()
-
-def save_envelope_spectrum_plot(segment, sr, out_path_display, out_path_training, spec_params=None):
-    fig = None
+        template = get_display_template(('classic_demon',), lambda: ImageDisplayTemplate(
+            (6, 4), cmap='viridis', colorbar_label='Amplitude (dB)',
+            setup_axes=lambda ax: (ax.set_xlabel('Time (s)'), ax.set_ylabel('Modulation Frequency (Hz)'))
+        ))
+        # 時間範圍與 Axes.specgram 的影像相同：前後各延伸半個 hop
+        pad = (nfft - noverlap) / fs_demo / 2
+        extent = (-pad, np.max(times) + pad, freqs[0], freqs[-1])
+        template.render(
+            S_db, extent, f"Classic DEMON Spectrogram (2D){time_str}", out_path_display,
+            ylim=(0, params['FREQ_YLIM'])
+        )
+
+    if out_path_training:
+        save_training_image(
+            S_db, out_path_training, cmap='viridis',
+            x_edges=centers_to_edges(times), y_edges=centers_to_edges(freqs), ylim=(0, params['FREQ_YLIM']),
+            encoder=get_encoder((spec_params or {}).get('image_format'))
+        )
+    return S_db
+
+def save_envelope_spectrum_plot(segment, sr, out_path_display, out_path_training, spec_params=None, precomputed=None):
+    """繪製包絡線頻譜 (precomputed 為 EnvelopeEngine 批次算出的 (freqs, magnitude))"""
     try:
         nyquist = sr / 2
         bp_low, bp_high = 2000, min(20000, nyquist * 0.99)
         if bp_low >= bp_high: return
         
-        b, a = butter(4, [bp_low, bp_high], btype='band', fs=sr)
-        segment_filt = lfilter(b, a, segment)
-        envelope = np.abs(hilbert(segment_filt))
-        
-        N = len(envelope)
-        if N == 0: return
-        
-        yf = fft(envelope - np.mean(envelope))
-        xf = fftfreq(N, 1 / sr)
-        half_N = N // 2
-        xf_positive, yf_positive = xf[:half_N], 2.0/N * np.abs(yf[:half_N])
-        
-        fig = Figure(figsize=(6, 4))
-        canvas = FigureCanvas(fig)
-        ax = fig.add_subplot(111)
-        ax.plot(xf_positive, yf_positive)
+        if precomputed is not None:
+            xf_positive, yf_positive = precomputed
+        else:
+            if len(segment) == 0: return
+            xf_positive, yf_positive = envelope_spectrum(segment, sr, decimate=bool((spec_params or {}).get('envelope_decimate')))
         
-        time_str = ""
-        if spec_params and 'time_start' in spec_params and 'time_end' in spec_params:
-            time_str = f" ({spec_params['time_start']:.1f}s - {spec_params['time_end']:.1f}s)"
-        ax.set_title(f'Envelope Spectrum (DEMON 1D){time_str}')
-        ax.set_xlabel('Modulation Frequency (Hz)')
-        ax.set_ylabel('Magnitude')
-        ax.grid(True)
-        ax.set_xlim(0, 300)
-        fig.tight_layout()
-        fig.savefig(out_path_display, dpi=100)
-
-        fig.clear()
-        ax = fig.add_subplot(111)
-        ax.plot(xf_positive, yf_positive)
-        ax.set_xlim(0, 300)
-        ax.axis('off')
-        fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
-        fig.savefig(out_path_training, bbox_inches='tight', pad_inches=0, dpi=100)
+        if out_path_display:
+            time_str = ""
+            if spec_params and 'time_start' in spec_params and 'time_end' in spec_params:
+                time_str = f" ({spec_params['time_start']:.1f}s - {spec_params['time_end']:.1f}s)"
+            display = get_display_template(('envelope_spectrum', 'display'), lambda: LineDisplayTemplate(
+                (6, 4), (0, ENVELOPE_MAX_FREQ), xlabel='Modulation Frequency (Hz)', ylabel='Magnitude'
+            ))
+            display.render(xf_positive, yf_positive, out_path_display, title=f'Envelope Spectrum (DEMON 1D){time_str}')
+
+        if out_path_training:
+            training = get_display_template(('envelope_spectrum', 'training'), lambda: LineDisplayTemplate(
+                (6, 4), (0, ENVELOPE_MAX_FREQ), axis_off=True
+            ))
+            training.render(xf_positive, yf_positive, out_path_training, encoder=get_encoder((spec_params or {}).get('image_format')))
+        # 回傳 dB 值供 spectrogram_store 儲存：幅度約 1e-3 – 1e-6，float16 會落入次正規範圍或歸零
+        return 20 * np.log10(yf_positive + ENVELOPE_DB_EPS)
     except Exception as e:
         print(f"處理包絡線頻譜時發生錯誤: {e}")
-    finally:
-        if fig: fig.clf()
+
+# 存檔矩陣即為顯示資料、可直接繪製顯示用圖的頻譜類型
+# (classic_demon 未裁切頻率範圍、envelope_spectrum 存的是 dB 值，仍由片段音訊繪製)
+STORE_DISPLAY_TYPES = ('stft', 'mel', 'yamnet_log_mel')
+
+def render_display_spectrogram(y, sr, out_path, spec_type, spec_params=None, time_start=0.0):
+    """
+    由片段音訊隨需繪製單一片段的顯示用頻譜圖 (供顯示端點使用，不輸出訓練用圖)。
+
+    Args:
+        y (np.ndarray): 片段音訊 (處理時的取樣率)，多聲道時為 [samples, channels]
+
+    Returns:
+        bool: 是否成功輸出
+    """
+    if y.ndim > 1:
+        y = y.mean(axis=1)
+    current_spec_params = {} if spec_params is None else spec_params.copy()
+    current_spec_params['time_start'] = time_start
+    current_spec_params['time_end'] = time_start + len(y) / sr
+    save_spectrogram(y, sr, out_path, None, spec_type, current_spec_params)
+    return os.path.exists(out_path)
+
+def render_display_from_store(matrix, sr, n_samples, out_path, spec_type, spec_params=None, time_start=0.0):
+    """
+    由 spectrogram_store 保存的矩陣繪製顯示用頻譜圖，略過解碼與頻譜運算 (供顯示端點使用)。
+
+    座標軸與由片段音訊繪製者相同；矩陣為 float16，色彩可能有些微差異。
+
+    Args:
+        matrix (np.ndarray): SpectrogramStore.get() 取得的矩陣
+        sr (int): 處理時的取樣率
+        n_samples (int): 片段長度 (樣本數)
+
+    Returns:
+        bool: 是否成功輸出 (spec_type 不在 STORE_DISPLAY_TYPES 時回傳 False)
+    """
+    if spec_type not in STORE_DISPLAY_TYPES:
+        return False
+    current_spec_params = {} if spec_params is None else spec_params.copy()
+    current_spec_params['time_start'] = time_start
+    current_spec_params['time_end'] = time_start + n_samples / sr
+    save_spectrogram(None, sr, out_path, None, spec_type, current_spec_params, stored=matrix)
+    return os.path.exists(out_path)
 
 # --- 記憶體優化處理流程 ---
 
-def _process_single_segment(i, start_s, y_segment, sr, basename, result_dir, spec_type, spec_params, training_spec_path, is_mono):
-    import os
-    import numpy as np
-    from scipy.io import wavfile
-    from .ai_model import run_inference
-    
+def _process_single_segment(i, start_s, y_segment, sr, basename, result_dir, spec_type, spec_params, training_spec_path, is_mono, precomputed=None, render_display=False, store=None, write_audio=False):
+    """執行緒模式：輸出片段並存入頻譜矩陣 (推論由 InferenceStage 批次執行)"""
+    result, matrix = _render_segment(i, start_s, y_segment, sr, basename, result_dir, spec_type, spec_params, training_spec_path, is_mono, precomputed, render_display, write_audio)
+    if store is not None and matrix is not None:
+        store.write(i, matrix)
+    return result
+
+def _render_segment(i, start_s, y_segment, sr, basename, result_dir, spec_type, spec_params, training_spec_path, is_mono, precomputed=None, render_display=False, write_audio=False):
+    """
+    輸出片段的頻譜圖 (不含存檔與推論，可於 worker 行程中執行)。
+
+    write_audio 為 False (預設) 時不寫出切割音檔，audio 仍回傳片段檔名，
+    播放與匯出時由原始上傳檔讀取 (見 segment_audio)。
+
+    Returns:
+        tuple: (結果 dict (不含 detections；'image' 為記憶體中的訓練用圖，見 pop_training_image), 頻譜矩陣)
+    """
     audio_filename = f"{basename}_part{i}.wav"
-    display_spec_filename = f"{basename}_spec_display_{i}.png"
-    training_spec_filename = f"{basename}_spec_training_{i}.png"
+    display_spec_filename = f"{basename}_spec_display_{i}{get_encoder(kind='display').extension}"
+    training_spec_filename = os.path.basename(training_spec_path)
     
     audio_path = os.path.join(result_dir, audio_filename)
-    display_spec_path = os.path.join(result_dir, display_spec_filename)
+    # 顯示用圖預設不在處理時輸出，由 /results/<id>/spectrogram 端點於首次瀏覽時繪製並快取
+    display_spec_path = os.path.join(result_dir, display_spec_filename) if render_display else None
+
+    # 記憶體映射的 16-bit 單聲道片段可直接寫出，不需經過浮點轉換與複製
+    if y_segment.dtype == np.int16 and y_segment.ndim == 1:
+        if write_audio:
+            wavfile.write(audio_path, sr, y_segment)
+        y_segment = _pcm_to_float(y_segment)
+    else:
+        y_segment = _pcm_to_float(y_segment)
+        if is_mono and y_segment.ndim > 1:
+            y_segment = y_segment.mean(axis=0)
+
+        # 切割音檔與頻譜圖皆使用單聲道 (確保正確處理多聲道)
+        if y_segment.ndim > 1:
+            y_mono = librosa.to_mono(y_segment)
+            if np.max(np.abs(y_mono)) < 1e-4 and np.max(np.abs(y_segment)) > 1e-3:
+                y_segment = y_segment[0]
+            else:
+                y_segment = y_mono
 
-    # 儲存切割音檔 (確保正確處理多聲道)
-    if y_segment.ndim > 1:
-        y_mono = librosa.to_mono(y_segment)
-        if np.max(np.abs(y_mono)) < 1e-4 and np.max(np.abs(y_segment)) > 1e-3:
-            y_segment = y_segment[0]
-        else:
-            y_segment = y_mono
-            
-    audio_int16 = (y_segment * 32767).astype(np.int16)
-    wavfile.write(audio_path, sr, audio_int16)
+        if write_audio:
+            audio_int16 = (y_segment * 32767).astype(np.int16)
+            wavfile.write(audio_path, sr, audio_int16)
     
     mono_segment = y_segment
     current_spec_params = {} if spec_params is None else spec_params.copy()
     current_spec_params['time_start'] = start_s
     current_spec_params['time_end'] = start_s + (len(y_segment) / sr)
     
-    save_spectrogram(mono_segment, sr, display_spec_path, training_spec_path, spec_type, current_spec_params)
-    
+    pop_training_image()
+    matrix = save_spectrogram(mono_segment, sr, display_spec_path, training_spec_path, spec_type, current_spec_params, precomputed)
+
     return {
         'audio': audio_filename,
         'display_spectrogram': display_spec_filename,
         'training_spectrogram': training_spec_filename,
-        'detections': run_inference(training_spec_path)
-    }
+        'image': pop_training_image()
+    }, matrix
+
+def _finish_pooled_segment(i, result, store=None):
+    """多行程模式下，於本行程完成 worker 回傳的片段：併入編碼統計並存入頻譜矩陣"""
+    matrix = result.pop('matrix', None)
+    encoding_stats.merge(result.pop('encoding', {}))
+    if store is not None and matrix is not None:
+        store.write(i, matrix)
+    return result
+
+# --- 音訊區塊來源 (完整載入 / 串流解碼) ---
+
+# 每個處理區塊的長度 (秒)。串流模式下峰值記憶體只與此值及 worker 數量有關，與錄音總長度無關
+STREAM_BLOCK_SECONDS = 60.0
+
+def _count_segments(n_samples, frame_length, step_samples):
+    """計算長度為 n_samples 的音訊可切出幾個完整片段"""
+    if n_samples < frame_length:
+        return 0
+    return (n_samples - frame_length) // step_samples + 1
 
-def process_large_audio(filepath, result_dir, spec_type, segment_duration=2.0, overlap_ratio=0.5, target_sr=None, is_mono=True, progress_callback=None, spec_params=None):
+def _pad_short_audio(y, frame_length):
+    """音訊長度不足一個片段時，於尾端補零"""
+    pad_width = [(0, 0)] * y.ndim
+    pad_width[-1] = (0, frame_length - y.shape[-1])
+    return np.pad(y, pad_width)
+
+def _iter_memory_blocks(full_audio, sr, frame_length, step_samples, block_seconds=STREAM_BLOCK_SECONDS):
+    """
+    將已完整載入的音訊依片段邊界切成區塊 (view，不複製資料)。
+    產生 (first_idx, block)，block 內含從 first_idx 開始的數個完整片段。
+    """
+    actual_total_samples = full_audio.shape[-1]
+    if actual_total_samples < frame_length:
+        print("警告：音訊檔案總長度小於設定的單一片段長度。")
+        yield 0, _pad_short_audio(full_audio, frame_length)
+        return
+
+    total_segments = _count_segments(actual_total_samples, frame_length, step_samples)
+    segments_per_block = max(1, int(block_seconds * sr) // step_samples)
+    for first_idx in range(0, total_segments, segments_per_block):
+        n = min(segments_per_block, total_segments - first_idx)
+        start_sample = first_idx * step_samples
+        yield first_idx, full_audio[..., start_sample:start_sample + (n - 1) * step_samples + frame_length]
+
+def _pcm_to_float(y):
+    """將整數 PCM 樣本正規化為 float32 (與 soundfile/librosa 讀取時的縮放方式相同)"""
+    if y.dtype.kind == 'f':
+        return y.astype(np.float32, copy=False)
+    if y.dtype == np.uint8:
+        return (y.astype(np.float32) - 128.0) / 128.0
+    return y.astype(np.float32) / float(-np.iinfo(y.dtype).min)
+
+def _open_pcm_memmap(filepath):
+    """
+    以記憶體映射開啟未壓縮 PCM WAV，回傳 (samplerate, view)。
+    view 為 (channels, samples) 或單聲道 1-D 的 strided view，資料由 OS page cache 提供。
+    不支援的格式 (非 WAV、24-bit PCM、壓縮編碼等) 回傳 None。
+    """
+    if not filepath.lower().endswith('.wav'):
+        return None
+    try:
+        rate, data = wavfile.read(filepath, mmap=True)
+    except Exception as e:
+        print(f"無法以記憶體映射開啟 {filepath}，改用解碼模式。原因: {e}")
+        return None
+    return rate, (data.T if data.ndim > 1 else data)
+
+def _mono_float_block(block, is_mono):
+    """將區塊轉為單聲道 float32 供共用頻譜運算使用；保留多聲道時回傳原區塊"""
+    block = _pcm_to_float(block)
+    if is_mono and block.ndim > 1:
+        block = block.mean(axis=0)
+    return block
+
+def _decode_stream_block(raw, is_mono, resampler, last=False):
+    """將 soundfile 讀出的 (frames, channels) 區塊轉為 librosa 慣用的排列，必要時串流重取樣"""
+    if is_mono or raw.shape[1] == 1:
+        x = raw.mean(axis=1) if raw.shape[1] > 1 else raw[:, 0]
+    else:
+        x = raw
+    if resampler is not None:
+        x = resampler.resample_chunk(np.ascontiguousarray(x), last=last)
+    # 多聲道轉為 (channels, samples)，與 librosa.load(mono=False) 一致
+    return x.T if x.ndim > 1 else x
+
+def _iter_stream_blocks(filepath, sr, is_mono, frame_length, step_samples, block_seconds=STREAM_BLOCK_SECONDS):
+    """
+    以 soundfile 逐區塊串流解碼音訊，邊讀邊切片段。
+    每個產出的區塊都從片段起點開始，並保留與下一區塊重疊的尾端樣本 (carry-over)，
+    因此片段內容與完整載入後切割的結果一致。
     """
-    以一次性完整載入並切分的方式處理大型音訊檔案，搭配 ThreadPool 平行處理加速。
+    next_idx = 0
+    pending = None
+
+    with sf.SoundFile(filepath) as f:
+        original_sr = f.samplerate
+        out_channels = 1 if (is_mono or f.channels == 1) else f.channels
+        resampler = None
+        if sr != original_sr:
+            # 與 librosa.load 預設的 soxr_hq 相同品質，但保留跨區塊的濾波器狀態
+            # (每個音檔各自建立，不放入 dsp_cache，見該模組說明)
+            import soxr
+            resampler = soxr.ResampleStream(original_sr, sr, out_channels, dtype='float32', quality='HQ')
+
+        read_frames = max(1, int(block_seconds * original_sr))
+        raw_blocks = f.blocks(blocksize=read_frames, dtype='float32', always_2d=True)
+        finished = False
+        while not finished:
+            raw = next(raw_blocks, None)
+            if raw is None:
+                finished = True
+                if resampler is None:
+                    break
+                # 取出重取樣器內殘留的樣本
+                empty = np.zeros((0, out_channels) if out_channels > 1 else (0, 1), dtype=np.float32)
+                x = _decode_stream_block(empty, is_mono, resampler, last=True)
+            else:
+                x = _decode_stream_block(raw, is_mono, resampler)
+
+            pending = x if pending is None else np.concatenate([pending, x], axis=-1)
+            n_ready = _count_segments(pending.shape[-1], frame_length, step_samples)
+            if n_ready:
+                yield next_idx, pending[..., :(n_ready - 1) * step_samples + frame_length]
+                # 只保留下一個片段起點之後的尾端，讓已產出的區塊可被回收
+                pending = pending[..., n_ready * step_samples:].copy()
+                next_idx += n_ready
+
+    if next_idx == 0 and pending is not None and pending.shape[-1] > 0:
+        print("警告：音訊檔案總長度小於設定的單一片段長度。")
+        yield 0, _pad_short_audio(pending, frame_length)
+
+def process_large_audio(filepath, result_dir, spec_type, segment_duration=2.0, overlap_ratio=0.5, target_sr=None, is_mono=True, progress_callback=None, spec_params=None, decode_mode='auto', render_display=False, save_tensors=False, tile_pyramid=False, executor=None, write_segment_audio=False, inference_batch_size=None):
+    """
+    處理大型音訊檔案：依區塊切出片段，搭配 ThreadPool 平行處理加速。
+
+    render_display 為 False (預設) 時只輸出訓練用圖與切割音檔，顯示用圖改為隨需繪製。
+    save_tensors 為 True 時另將各片段的頻譜矩陣存入 result_dir/spectrograms.npy (見 spectrogram_store)；
+    預設不儲存 (每片段約 數十 KB，長錄音可達數 GB)，由上傳表單選用。
+    tile_pyramid 為 True 時另對整個錄音做一次 STFT，輸出供整檔瀏覽的多解析度圖磚 (見 tile_pyramid)。
+    write_segment_audio 為 True 時沿用舊行為輸出每個片段的 *_partN.wav；預設不輸出，
+    片段音訊由 /results/<id>/audio 端點自原始上傳檔讀取 (見 segment_audio)。
+
+    decode_mode:
+        - 'auto': 不需重取樣的 PCM WAV 使用記憶體映射；soundfile 可讀取時使用串流模式；否則完整載入
+        - 'mmap': 記憶體映射 PCM WAV，每個片段僅取得 strided view (需不重取樣)
+        - 'stream': 以 soundfile 逐區塊解碼，峰值記憶體與錄音長度無關
+        - 'full': 以 librosa 一次性完整載入 (舊行為，適用 soundfile 無法解碼的格式)
+
+    executor (預設取環境變數 SEGMENT_EXECUTOR，未設定時為 'thread'):
+        - 'thread': 以 ThreadPool 處理片段 (最多 16 個執行緒)
+        - 'process': 以共用行程池處理片段，區塊音訊經由 shared memory 傳遞 (見 segment_pool)，
+          繪圖不受 GIL 限制；頻譜矩陣存檔與模型推論仍於本行程執行
+
+    模型推論由專用的推論執行緒以批次執行 (見 inference_stage)，片段繪圖完成後直接傳入記憶體中的訓練用圖；
+    inference_batch_size 為每次前向運算的片段數 (預設取環境變數 INFERENCE_BATCH_SIZE，未設定時為 32)。
     """
-    all_results = []
+    all_results = {}
     basename = f"{os.path.splitext(os.path.basename(filepath))[0]}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
     
     try:
         # 新增容錯讀取機制
+        sf_readable = True
         try:
             info = sf.info(filepath)
             original_sr = info.samplerate
             total_samples = info.frames
         except Exception as e:
             print(f"SoundFile 無法讀取 {filepath}，嘗試使用 Librosa Fallback。錯誤: {e}")
+            sf_readable = False
             original_sr = librosa.get_samplerate(filepath)
             total_duration = librosa.get_duration(path=filepath)
             total_samples = int(total_duration * original_sr)
@@ -430,63 +662,161 @@ def process_large_audio(filepath, result_dir, spec_type, segment_duration=2.0, o
         else:
             sr = target_sr if target_sr else original_sr
 
-        # 一次性完整載入音訊，大幅減少 I/O 等待 (O(N^2) seek issues in MP3)
-        print(f"正在完整載入音訊: {filepath} ({total_samples} samples)")
-        full_audio, _ = librosa.load(filepath, sr=sr, mono=is_mono)
-        print("音訊載入完成。")
-
         frame_length = int(segment_duration * sr)
-        actual_total_samples = full_audio.shape[-1]
-
-        if actual_total_samples < frame_length:
-            print("警告：音訊檔案總長度小於設定的單一片段長度。")
-            y_segment = full_audio
-            pad_width = [(0, 0)] * y_segment.ndim
-            pad_width[-1] = (0, frame_length - actual_total_samples)
-            y_segment = np.pad(y_segment, pad_width)
-            segments_to_process = [(0, 0.0, y_segment)]
+        step_samples = max(1, int(frame_length * (1 - overlap_ratio)))
+
+        mapped = None
+        if decode_mode in ('auto', 'mmap') and sr == original_sr:
+            mapped = _open_pcm_memmap(filepath)
+            if mapped is not None and mapped[0] != sr:
+                mapped = None
+        elif decode_mode == 'mmap':
+            print("警告：需要重取樣的音訊無法使用記憶體映射，改為串流解碼。")
+
+        use_stream = mapped is None and decode_mode in ('auto', 'stream', 'mmap') and sf_readable
+        if decode_mode == 'stream' and not sf_readable:
+            print("警告：此格式無法以 SoundFile 串流解碼，改為完整載入。")
+
+        full_audio = None
+        if mapped is not None:
+            print(f"以記憶體映射存取 PCM 音訊: {filepath} ({total_samples} samples)")
+            full_audio = mapped[1]
+            blocks = _iter_memory_blocks(full_audio, sr, frame_length, step_samples)
+        elif use_stream:
+            print(f"以串流模式解碼音訊: {filepath} ({total_samples} samples, 區塊 {STREAM_BLOCK_SECONDS:.0f}s)")
+            blocks = _iter_stream_blocks(filepath, sr, is_mono, frame_length, step_samples)
         else:
-            step_samples = int(frame_length * (1 - overlap_ratio))
-            segments_to_process = []
-            start_sample = 0
-            idx = 0
-            while start_sample <= actual_total_samples - frame_length:
-                start_s = start_sample / sr
-                y_segment = full_audio[..., start_sample:start_sample + frame_length]
-                segments_to_process.append((idx, start_s, y_segment))
-                start_sample += step_samples
-                idx += 1
-
-        total_segments = len(segments_to_process)
+            # 一次性完整載入音訊，大幅減少 I/O 等待 (O(N^2) seek issues in MP3)
+            print(f"正在完整載入音訊: {filepath} ({total_samples} samples)")
+            full_audio, _ = librosa.load(filepath, sr=sr, mono=is_mono)
+            print("音訊載入完成。")
+            blocks = _iter_memory_blocks(full_audio, sr, frame_length, step_samples)
+
+        # 串流模式下無法事先得知確切片段數，以檔頭資訊估算進度分母
+        expected_samples = int(np.ceil(total_samples * sr / original_sr)) if original_sr else total_samples
+        total_segments = max(1, _count_segments(expected_samples, frame_length, step_samples))
         completed_tasks = 0
-        
-        # 準備結果的 list (保持順序)
-        all_results = [None] * total_segments
-        
-        print(f"開始平行處理 {total_segments} 個音訊片段...")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, os.cpu_count() or 4)) as executor:
-            futures = {}
-            for idx, start_s, y_seg in segments_to_process:
-                training_spec_path = os.path.join(result_dir, f"{basename}_spec_training_{idx}.png")
-                fut = executor.submit(
-                    _process_single_segment, 
-                    idx, start_s, y_seg, sr, basename, result_dir, spec_type, spec_params, training_spec_path, is_mono
-                )
-                futures[fut] = idx
-                
-            for fut in concurrent.futures.as_completed(futures):
-                idx = futures[fut]
+
+        # 區塊頻譜引擎：預設對區塊內所有片段批次計算 (與逐片段相同)；選用 shared_stft 時每個區塊只計算一次 STFT 再切欄位
+        engine = create_engine(spec_type, sr, spec_params, frame_length, step_samples)
+
+        # 訓練用圖的副檔名依上傳參數 image_format 決定
+        training_ext = get_encoder((spec_params or {}).get('image_format')).extension
+        # 編碼統計取本次處理前後的差值 (同一行程同時處理多個音檔時為合計值)
+        encoding_before = encoding_stats.snapshot()
+
+        store = None
+        if save_tensors:
+            store = SpectrogramStoreWriter(result_dir, total_segments, {
+                'spec_type': spec_type,
+                'sr': sr,
+                'segment_duration': frame_length / sr,
+                'step_duration': step_samples / sr,
+                'spec_params': spec_params or {},
+            })
+
+        pyramid = TilePyramidBuilder(result_dir, sr, spec_params) if tile_pyramid else None
+
+        # 同時執行的片段數受 worker 的 CPU 預算限制 (見 cpu_budget)，多個任務同時處理時平均分配核心
+        lease = cpu_budget.current()
+        pool = None
+        if (executor or os.environ.get('SEGMENT_EXECUTOR', 'thread')) == 'process':
+            from .segment_pool import get_process_pool, BlockArena, run_segment
+            pool = get_process_pool()
+        max_workers = min(16, cpu_budget.total)
+        # 限制同時在途的片段數，避免解碼速度快於處理速度時片段在記憶體中堆積。
+        # 執行緒模式下實際執行數由 lease.slot() 限制；行程池為所有任務共用，以在途數限制
+        def pending_limit():
+            return max_workers * 4 if pool is None else lease.cores
+
+        def collect(done_futures):
+            nonlocal completed_tasks
+            for fut in done_futures:
+                idx, arena = futures.pop(fut)
+                if arena is not None:
+                    arena.release()
                 try:
-                    res = fut.result()
-                    all_results[idx] = res
+                    result = fut.result()
+                    if arena is not None:
+                        result = _finish_pooled_segment(idx, result, store)
+                    inference.submit(idx, result.pop('image', None), os.path.join(result_dir, result['training_spectrogram']))
+                    all_results[idx] = result
                     completed_tasks += 1
                     if progress_callback:
-                        progress_callback(completed_tasks, total_segments)
+                        progress_callback(min(completed_tasks, total_segments), total_segments)
                 except Exception as exc:
                     print(f"片段 {idx} 處理發生錯誤: {exc}")
-                    
-        # 過濾異常片段
-        all_results = [r for r in all_results if r is not None]
+
+        print(f"開始平行處理約 {total_segments} 個音訊片段...")
+        futures = {}
+        executor_context = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) if pool is None else contextlib.nullcontext(pool)
+        # 片段完成後送入推論執行緒，批次推論與後續片段的繪圖同時進行
+        inference = InferenceStage(inference_batch_size, lease)
+        try:
+            with executor_context as executor:
+                for first_idx, block in blocks:
+                    block_start = first_idx * step_samples
+                    mono_block = _mono_float_block(block, is_mono) if (engine or pyramid) else None
+                    shared = engine.compute_block(mono_block, block_start) if engine else None
+                    if pyramid is not None:
+                        pyramid.feed(mono_block, block_start)
+                    # [..., n_segments, frame_length] 的 strided view，取代逐一切片
+                    frames = segment_frames(block, frame_length, step_samples)
+                    # 多行程模式：區塊音訊與共用頻譜只複製一次到 shared memory，worker 依偏移量取用
+                    arena = BlockArena(block, shared, frames.shape[-2]) if pool is not None else None
+                    for j in range(frames.shape[-2]):
+                        if len(futures) >= pending_limit():
+                            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                            collect(done)
+
+                        idx = first_idx + j
+                        offset = j * step_samples
+                        start_s = (idx * step_samples) / sr
+                        training_spec_path = os.path.join(result_dir, f"{basename}_spec_training_{idx}{training_ext}")
+                        if arena is not None:
+                            fut = executor.submit(
+                                run_segment, arena.spec, offset, frame_length,
+                                dict(i=idx, start_s=start_s, sr=sr, basename=basename, result_dir=result_dir,
+                                     spec_type=spec_type, spec_params=spec_params, training_spec_path=training_spec_path,
+                                     is_mono=is_mono, render_display=render_display, write_audio=write_segment_audio),
+                                store is not None
+                            )
+                        else:
+                            fut = executor.submit(
+                                lease.run, _process_single_segment,
+                                idx, start_s, frames[..., j, :], sr, basename, result_dir, spec_type, spec_params, training_spec_path, is_mono,
+                                shared.segment(offset) if shared else None, render_display, store, write_segment_audio
+                            )
+                        futures[fut] = (idx, arena)
+                    del block, frames, shared, mono_block, arena
+
+                collect(concurrent.futures.wait(futures)[0])
+        finally:
+            detections = inference.close()
+            # 發生錯誤時釋放尚未完成之區塊的 shared memory
+            for _, arena in futures.values():
+                if arena is not None:
+                    arena.close()
+
+        # 依片段編號併回推論結果
+        for idx, result in all_results.items():
+            result['detections'] = detections.get(idx, [])
+        if inference.batches:
+            print(f"批次推論完成: {len(detections)} 個片段，{inference.batches} 個批次")
+
+        if progress_callback and completed_tasks:
+            progress_callback(total_segments, total_segments)
+        print(f"DSP 物件快取統計: {dsp_cache.stats()}")
+        print(f"影像編碼統計: {encoding_stats.stats(since=encoding_before)}")
+        if store is not None and store.close():
+            print(f"頻譜矩陣已儲存: {store.path}")
+        if pyramid is not None:
+            pyramid_index = pyramid.close()
+            if pyramid_index:
+                print(f"整檔頻譜圖磚已建立: {pyramid_index['levels']} 層，原始解析度 {pyramid_index['columns'][0]} 欄")
+
+        # 過濾異常片段並依片段順序排列
+        all_results = [all_results[idx] for idx in sorted(all_results)]
         del full_audio
         gc.collect()
         
@@ -494,4 +824,4 @@ def process_large_audio(filepath, result_dir, spec_type, segment_duration=2.0, o
         print(f"處理大型音訊檔案時發生錯誤: {e}")
         raise e
         
-    return all_results
\ No newline at end of file
+    return all_results
@@ -0,0 +1,91 @@
+"""
+影像編碼格式效能比較。
+
+以某次分析結果中的實際訓練用頻譜圖，逐一用各編碼器 (image_encoder.ENCODERS) 重新編碼寫入暫存目錄，
+比較平均編碼時間、檔案大小、解碼時間，並確認無損格式解碼後像素與原圖一致。
+
+用法:
+    python -m app.benchmark_encoders <upload_id 或結果資料夾路徑> [最多張數, 預設 50]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from .image_encoder import ENCODERS, encoding_stats
+
+
+def _load_images(result_dir, limit):
+    names = sorted(f for f in os.listdir(result_dir) if '_spec_training_' in f)[:limit]
+    images = []
+    for name in names:
+        with Image.open(os.path.join(result_dir, name)) as img:
+            images.append(np.asarray(img.convert('RGB')))
+    return images
+
+
+def benchmark(result_dir, limit=50):
+    """
+    回傳各格式的比較結果列表。
+
+    Returns:
+        list[dict]: name, avg_ms (編碼), avg_kb, decode_ms, lossless_ok
+    """
+    images = _load_images(result_dir, limit)
+    if not images:
+        raise ValueError(f"{result_dir} 中找不到訓練用頻譜圖")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, encoder in ENCODERS.items():
+            before = encoding_stats.snapshot()
+            paths = []
+            for i, image in enumerate(images):
+                path = os.path.join(tmp_dir, f"{name}_{i}{encoder.extension}")
+                encoder.save_array(image, path, 'benchmark')
+                paths.append(path)
+            stats = encoding_stats.stats(since=before)[f"benchmark/{name}"]
+
+            identical = True
+            start = time.perf_counter()
+            for image, path in zip(images, paths):
+                with Image.open(path) as img:
+                    decoded = np.asarray(img.convert('RGB'))
+                identical = identical and np.array_equal(decoded, image)
+            decode_ms = (time.perf_counter() - start) / len(paths) * 1000
+
+            rows.append({
+                'name': name,
+                'avg_ms': stats['avg_ms'],
+                'avg_kb': stats['avg_kb'],
+                'decode_ms': round(decode_ms, 2),
+                'lossless_ok': identical if encoder.lossless else None
+            })
+    return rows
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    target = argv[1]
+    if target.isdigit():
+        target = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'results', target)
+    limit = int(argv[2]) if len(argv) > 2 else 50
+
+    rows = benchmark(target, limit)
+    baseline = next(r for r in rows if r['name'] == 'png')
+    print(f"{'格式':<10}{'編碼 ms':>10}{'大小 KB':>10}{'相對 png':>10}{'解碼 ms':>10}  無損")
+    for r in rows:
+        ratio = r['avg_kb'] / baseline['avg_kb'] if baseline['avg_kb'] else 0
+        lossless = '-' if r['lossless_ok'] is None else ('OK' if r['lossless_ok'] else '不一致')
+        print(f"{r['name']:<10}{r['avg_ms']:>10.2f}{r['avg_kb']:>10.1f}{ratio:>10.2f}{r['decode_ms']:>10.2f}  {lossless}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
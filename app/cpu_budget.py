@@ -0,0 +1,148 @@
+"""
+Worker 全域 CPU 核心預算模組。
+
+此模組負責：
+1. 將固定的核心預算平均分配給同時執行的 Celery 任務 (--pool=threads 下共用同一行程)
+2. 限制任務內部平行區段 (片段處理執行緒、行程池) 同時執行的工作數不超過分得的核心數
+3. 依目前的分配調整 PyTorch 的 intra-op 執行緒數 (torch.set_num_threads)
+
+設計模式：
+- 行程內全域單例 (與 dsp_cache、encoding_stats 相同)，任務以 cpu_budget.lease() 取得租約
+- 分配為動態平均：任務開始或結束時重新分配，進行中的任務於下一個工作取得 slot 時即套用新的核心數
+- 租約綁定於呼叫的執行緒，內層函式以 cpu_budget.current() 取得；
+  不在任何租約內呼叫時 (如命令列工具) 取得不計入分配、可使用全部預算的租約
+- torch.set_num_threads 為行程全域設定，設為每個租約分得的核心數；
+  任務內只有推論執行緒 (見 inference_stage) 呼叫 PyTorch，片段執行緒不會同時開啟 intra-op 執行緒
+
+環境變數：
+- CPU_BUDGET: 可分配的核心數 (預設為 CPU 核心數)
+"""
+
+import os
+import sys
+import threading
+import contextlib
+
+
+class CpuLease:
+    """
+    單一任務的核心租約。
+
+    Attributes:
+        name (str): 任務名稱 (統計用)
+    """
+
+    def __init__(self, budget, name='', registered=True):
+        self.budget = budget
+        self.name = name
+        self.registered = registered
+        self._running = 0
+
+    @property
+    def cores(self):
+        """目前分得的核心數 (隨同時執行的任務數變動)"""
+        return self.budget.share() if self.registered else self.budget.total
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        取得一個執行 slot；同時執行的工作數已達 cores 時等待。
+
+        Example:
+            >>> with lease.slot():
+            ...     render_segment(...)
+        """
+        condition = self.budget.condition
+        with condition:
+            while self._running >= self.cores:
+                condition.wait()
+            self._running += 1
+        try:
+            yield
+        finally:
+            with condition:
+                self._running -= 1
+                condition.notify_all()
+
+    def run(self, fn, *args, **kwargs):
+        """於 slot 內執行 fn (供 executor.submit 使用)"""
+        with self.slot():
+            return fn(*args, **kwargs)
+
+
+class CpuBudget:
+    """
+    執行緒安全的核心預算。
+
+    Attributes:
+        total (int): 可分配的核心數
+
+    Example:
+        >>> with cpu_budget.lease('process_audio') as lease:
+        ...     workers = lease.cores
+    """
+
+    def __init__(self, total):
+        self.total = max(1, int(total))
+        self.condition = threading.Condition()
+        self._leases = []
+        self._local = threading.local()
+        self._torch_threads = None
+
+    def share(self):
+        """每個租約目前分得的核心數"""
+        return max(1, self.total // max(1, len(self._leases)))
+
+    @contextlib.contextmanager
+    def lease(self, name=''):
+        """
+        取得租約 (context manager)；同一執行緒內巢狀呼叫時沿用外層租約。
+        """
+        current = getattr(self._local, 'lease', None)
+        if current is not None:
+            yield current
+            return
+
+        lease = CpuLease(self, name)
+        with self.condition:
+            self._leases.append(lease)
+        self._local.lease = lease
+        self.rebalance()
+        try:
+            yield lease
+        finally:
+            self._local.lease = None
+            with self.condition:
+                self._leases.remove(lease)
+            self.rebalance()
+
+    def current(self):
+        """取得目前執行緒的租約；不在租約內時回傳不計入分配的租約"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is None:
+            lease = CpuLease(self, 'unmanaged', registered=False)
+        return lease
+
+    def rebalance(self):
+        """重新分配後喚醒等待 slot 的執行緒，並更新 torch 執行緒數"""
+        with self.condition:
+            threads = self.share()
+            self.condition.notify_all()
+            # 只在 PyTorch 已載入時設定，避免為此載入 torch
+            torch = sys.modules.get('torch')
+            if torch is not None and threads != self._torch_threads:
+                self._torch_threads = threads
+                torch.set_num_threads(threads)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'total': self.total,
+                'share': self.share(),
+                'leases': [(lease.name, lease._running) for lease in self._leases],
+                'torch_threads': self._torch_threads
+            }
+
+
+# 全域預算實例
+cpu_budget = CpuBudget(int(os.environ.get('CPU_BUDGET', 0)) or os.cpu_count() or 4)
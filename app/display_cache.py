@@ -0,0 +1,147 @@
+"""
+顯示用頻譜圖的磁碟快取模組。
+
+此模組負責：
+1. 保存由顯示端點隨需繪製的 *_spec_display_* 顯示用圖 (格式見 image_encoder)
+2. 以檔案修改時間 (命中時更新) 實作 LRU，總容量超過上限時淘汰最久未使用的檔案
+3. 刪除分析紀錄時一併清除該音檔的快取
+
+設計模式：
+- 行程內單例，由 get_display_cache() 於第一次使用時建立
+- 快取目錄結構：<root>/<upload_id>/<spectrogram_filename>
+- 寫入時先輸出到暫存檔再以 os.replace 換名，並行請求不會讀到寫到一半的檔案
+- 總容量只在寫入時累加；超過上限時重新掃描目錄並淘汰到上限的 90%
+
+環境變數：
+- DISPLAY_CACHE_DIR: 快取目錄 (預設 <DATA_DIR>/display_cache，見 create_app)
+- DISPLAY_CACHE_MAX_MB: 容量上限 (預設 2048 MB)
+"""
+
+import os
+import shutil
+import threading
+import uuid
+
+
+class DisplayCache:
+    """
+    具容量上限的顯示用頻譜圖磁碟快取。
+
+    render 需自行決定輸出格式 (暫存檔副檔名為 .tmp，不可依副檔名判斷格式)。
+
+    Attributes:
+        root (str): 快取根目錄
+        max_bytes (int): 容量上限 (bytes)
+
+    Example:
+        >>> cache = DisplayCache('/tmp/display_cache', 512 * 1024 * 1024)
+        >>> path = cache.get(12, 'a_spec_display_3.png')
+        >>> if path is None:
+        ...     path = cache.put(12, 'a_spec_display_3.png', lambda out: render(out))
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, upload_id, filename):
+        return os.path.join(self.root, str(int(upload_id)), os.path.basename(filename))
+
+    def get(self, upload_id, filename):
+        """命中時更新檔案時間 (LRU) 並回傳路徑，否則回傳 None"""
+        path = self._path(upload_id, filename)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, upload_id, filename, render):
+        """
+        呼叫 render(tmp_path) 產生檔案並放入快取。
+
+        Args:
+            render (callable): 將圖輸出到指定路徑的函式
+
+        Returns:
+            str | None: 快取檔案路徑；render 未產生檔案時回傳 None
+        """
+        path = self._path(upload_id, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            render(tmp_path)
+            if not os.path.exists(tmp_path):
+                return None
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def remove_upload(self, upload_id):
+        """刪除某個音檔的所有快取圖"""
+        shutil.rmtree(os.path.join(self.root, str(int(upload_id))), ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """淘汰最久未使用的檔案，直到總容量低於上限的 90%"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._size = total
+        print(f"[display_cache] 淘汰 {removed} 張顯示用頻譜圖，目前容量 {total / 1024 / 1024:.1f} MB")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_display_cache():
+    """取得全域顯示快取 (需在 Flask 應用程式上下文中第一次呼叫)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from flask import current_app
+            root = os.environ.get('DISPLAY_CACHE_DIR') or os.path.join(current_app.config['DATA_DIR'], 'display_cache')
+            max_bytes = int(float(os.environ.get('DISPLAY_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+            _cache = DisplayCache(root, max_bytes)
+    return _cache
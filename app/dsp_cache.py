@@ -0,0 +1,153 @@
+"""
+DSP 物件快取模組。
+
+此模組負責：
+1. 快取 Mel 濾波器組 / torchaudio MelSpectrogram 轉換器
+2. 快取 STFT 窗函數、Butterworth 濾波器係數 (SOS / BA)
+3. 提供命中 / 未命中次數統計
+
+設計模式：
+- 行程內全域單例，所有 worker 執行緒共用
+- 以參數 tuple 為 key，例如 (sr, n_fft, n_mels, f_min, f_max, ...)
+- LRU 淘汰，容量上限可由環境變數 DSP_CACHE_SIZE 設定
+- 回傳的物件為共用實例，呼叫端不得原地修改
+  (不設為唯讀，因 scipy 的 sosfilt 等 Cython 函式要求可寫入的緩衝區)
+- 不快取重取樣器：串流解碼的 soxr.ResampleStream 帶有單一音檔的濾波器狀態，
+  建立成本約 0.1 ms，重複使用沒有可量測的效益；YAMNet 逐片段重取樣沿用 librosa.resample
+
+環境變數：
+- DSP_CACHE_SIZE: 快取項目上限 (預設 128)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class DSPCache:
+    """
+    執行緒安全、具容量上限的 LRU 快取。
+
+    Attributes:
+        maxsize (int): 最多保留的項目數
+        hits (int): 命中次數
+        misses (int): 未命中次數
+
+    Example:
+        >>> cache = DSPCache(maxsize=32)
+        >>> window = cache.get(('window', 'hann', 2048), lambda: get_window('hann', 2048))
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """
+        取得快取物件，不存在時呼叫 factory 建立。
+
+        factory 在鎖外執行，避免耗時的建立過程阻塞其他執行緒；
+        若兩個執行緒同時建立同一個 key，保留先寫入者。
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        value = factory()
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def stats(self):
+        """回傳快取統計 (項目數、命中、未命中、命中率)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+    def clear(self):
+        """清空快取與統計"""
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 全域快取實例
+dsp_cache = DSPCache(maxsize=int(os.environ.get('DSP_CACHE_SIZE', 128)))
+
+
+# ============================================================================
+# 常用 DSP 物件
+# ============================================================================
+
+def get_window(window_type, n_fft):
+    """取得 STFT 窗函數 (scipy.signal.get_window)"""
+    from scipy.signal import get_window as _get_window
+    return dsp_cache.get(('window', window_type, n_fft), lambda: _get_window(window_type, n_fft))
+
+
+def get_butter_sos(order, low, high, fs):
+    """取得帶通 Butterworth 濾波器的 SOS 係數"""
+    from scipy.signal import butter
+    return dsp_cache.get(
+        ('butter_sos', order, float(low), float(high), float(fs)),
+        lambda: butter(order, [low, high], btype='band', fs=fs, output='sos')
+    )
+
+
+def get_butter_ba(order, low, high, fs):
+    """取得帶通 Butterworth 濾波器的 (b, a) 係數"""
+    from scipy.signal import butter
+    return dsp_cache.get(
+        ('butter_ba', order, float(low), float(high), float(fs)),
+        lambda: butter(order, [low, high], btype='band', fs=fs)
+    )
+
+
+def get_mel_filterbank(sr, n_fft, n_mels, f_min, f_max):
+    """取得 librosa Mel 濾波器組矩陣 [n_mels, 1 + n_fft // 2]"""
+    import librosa
+    return dsp_cache.get(
+        ('mel_fb', int(sr), n_fft, n_mels, float(f_min), float(f_max)),
+        lambda: librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=f_min, fmax=f_max)
+    )
+
+
+def get_mel_transform(sample_rate, n_fft, win_length, hop_length, n_mels, f_min, f_max, power, device):
+    """
+    取得已移至指定裝置的 torchaudio MelSpectrogram 轉換器。
+
+    轉換器不含可變狀態，多個執行緒可安全地同時呼叫 forward。
+    """
+    import torchaudio
+
+    key = ('mel_transform', int(sample_rate), n_fft, win_length, hop_length,
+           n_mels, float(f_min), float(f_max), float(power), str(device))
+    return dsp_cache.get(key, lambda: torchaudio.transforms.MelSpectrogram(
+        sample_rate=int(sample_rate),
+        n_fft=n_fft,
+        win_length=win_length,
+        hop_length=hop_length,
+        n_mels=n_mels,
+        f_min=f_min,
+        f_max=f_max,
+        power=power,
+    ).to(device))
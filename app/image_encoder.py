@@ -0,0 +1,179 @@
+"""
+頻譜圖影像編碼模組。
+
+此模組負責：
+1. 提供可切換的影像編碼器 (PNG 快速壓縮 / PNG 標準壓縮 / WebP 無損 / JPEG)
+2. 統一訓練用圖 (uint8 RGB 陣列) 與顯示用圖 (matplotlib Figure) 的輸出
+3. 記錄每張圖的編碼時間與檔案大小，依「用途/格式」彙總
+
+設計模式：
+- 編碼器為無狀態的共用實例，以名稱查詢 (get_encoder)
+- 訓練用圖必須為無損格式 (模型以像素值訓練)；JPEG 只可用於顯示用圖，
+  指定給訓練用圖時改用預設格式
+- 統計為行程內全域單例 (與 dsp_cache 相同)，由 encoding_stats.stats() 取得
+
+環境變數：
+- TRAINING_IMAGE_FORMAT: 訓練用圖預設格式 (預設 png_fast，可被上傳參數 image_format 覆寫)
+- DISPLAY_IMAGE_FORMAT: 顯示用圖格式 (預設 png_fast)
+"""
+
+import os
+import time
+import threading
+
+
+class ImageEncoder:
+    """
+    單一影像格式的編碼設定。
+
+    Attributes:
+        name (str): 編碼器名稱 (上傳參數 image_format 的值)
+        extension (str): 副檔名 (含 '.')
+        mimetype (str): HTTP Content-Type
+        lossless (bool): 是否為無損格式
+    """
+
+    def __init__(self, name, extension, mimetype, pil_format, pil_kwargs, lossless=True):
+        self.name = name
+        self.extension = extension
+        self.mimetype = mimetype
+        self.pil_format = pil_format
+        self.pil_kwargs = pil_kwargs
+        self.lossless = lossless
+
+    def save_array(self, image, out_path, kind='training'):
+        """將 uint8 RGB 陣列 [height, width, 3] 編碼寫出 (out_path 可為路徑或檔案物件)"""
+        from PIL import Image
+        start = time.perf_counter()
+        Image.fromarray(image, 'RGB').save(out_path, format=self.pil_format, **self.pil_kwargs)
+        self._record(kind, start, out_path)
+
+    def save_figure(self, fig, out_path, kind='display', **savefig_kwargs):
+        """以 fig.savefig 編碼寫出 (dpi 等版面參數由呼叫端提供)"""
+        start = time.perf_counter()
+        fig.savefig(out_path, format=self.pil_format.lower(), pil_kwargs=self.pil_kwargs, **savefig_kwargs)
+        self._record(kind, start, out_path)
+
+    def _record(self, kind, start, out_path):
+        # savefig 包含 Agg 繪製時間，此處記錄的是「輸出一張圖」的總時間
+        elapsed = time.perf_counter() - start
+        if hasattr(out_path, 'tell'):
+            # 寫入記憶體緩衝區 (如 io.BytesIO) 時以目前位置為檔案大小
+            size = out_path.tell()
+        else:
+            try:
+                size = os.path.getsize(out_path)
+            except OSError:
+                size = 0
+        encoding_stats.record(kind, self.name, elapsed, size)
+
+
+ENCODERS = {
+    # PNG 等級 1：編碼速度約為預設等級 6 的 2-3 倍，檔案約大 10-20%
+    'png_fast': ImageEncoder('png_fast', '.png', 'image/png', 'PNG', {'compress_level': 1}),
+    'png': ImageEncoder('png', '.png', 'image/png', 'PNG', {'compress_level': 6}),
+    # WebP 無損 method=1：編碼時間與 png_fast 相近，頻譜圖檔案約小 30-70%
+    'webp': ImageEncoder('webp', '.webp', 'image/webp', 'WEBP', {'lossless': True, 'method': 1, 'quality': 0}),
+    'jpeg': ImageEncoder('jpeg', '.jpg', 'image/jpeg', 'JPEG', {'quality': 90}, lossless=False),
+}
+
+DEFAULT_FORMATS = {
+    'training': os.environ.get('TRAINING_IMAGE_FORMAT', 'png_fast'),
+    'display': os.environ.get('DISPLAY_IMAGE_FORMAT', 'png_fast'),
+}
+
+# 已提示過的無效格式 (每個片段都會查詢編碼器，同一個警告只印一次)
+_warned = set()
+
+
+def _warn_once(key, message):
+    if key not in _warned:
+        _warned.add(key)
+        print(message)
+
+
+def get_encoder(name=None, kind='training'):
+    """
+    取得編碼器。
+
+    Args:
+        name (str | None): 編碼器名稱，None 或空字串時使用該用途的預設格式
+        kind (str): 'training' 或 'display'
+
+    Returns:
+        ImageEncoder: 未知名稱或訓練用圖指定有損格式時，回傳預設格式的編碼器
+    """
+    default = ENCODERS.get(DEFAULT_FORMATS[kind], ENCODERS['png_fast'])
+    if not name:
+        return default
+    encoder = ENCODERS.get(name)
+    if encoder is None:
+        _warn_once((name, kind), f"[image_encoder] 未知的影像格式 '{name}'，改用 {default.name}")
+        return default
+    if kind == 'training' and not encoder.lossless:
+        _warn_once((name, kind), f"[image_encoder] 訓練用圖不可使用有損格式 '{name}'，改用 {default.name}")
+        return default
+    return encoder
+
+
+class EncodingStats:
+    """
+    執行緒安全的編碼統計 (張數、總時間、總位元組)。
+
+    Example:
+        >>> encoding_stats.stats()
+        {'training/png_fast': {'count': 120, 'avg_ms': 9.8, 'avg_kb': 81.2, 'total_mb': 9.5, ...}}
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, seconds, nbytes):
+        key = f"{kind}/{name}"
+        with self._lock:
+            count, total_seconds, total_bytes = self._items.get(key, (0, 0.0, 0))
+            self._items[key] = (count + 1, total_seconds + seconds, total_bytes + nbytes)
+
+    def merge(self, items):
+        """併入其他行程的累計值 {key: (count, seconds, bytes)} (如多行程模式下 worker 回傳的差值)"""
+        with self._lock:
+            for key, (count, seconds, nbytes) in items.items():
+                base_count, base_seconds, base_bytes = self._items.get(key, (0, 0.0, 0))
+                self._items[key] = (base_count + count, base_seconds + seconds, base_bytes + nbytes)
+
+    def snapshot(self):
+        """回傳原始累計值 {key: (count, seconds, bytes)}，可與之後的 stats(since=...) 相減"""
+        with self._lock:
+            return dict(self._items)
+
+    def stats(self, since=None):
+        """
+        回傳各「用途/格式」的統計。
+
+        Args:
+            since (dict | None): snapshot() 的結果，提供時只統計其後新增的部分
+        """
+        since = since or {}
+        result = {}
+        for key, (count, seconds, nbytes) in self.snapshot().items():
+            base_count, base_seconds, base_bytes = since.get(key, (0, 0.0, 0))
+            count, seconds, nbytes = count - base_count, seconds - base_seconds, nbytes - base_bytes
+            if count <= 0:
+                continue
+            result[key] = {
+                'count': count,
+                'total_seconds': round(seconds, 3),
+                'total_mb': round(nbytes / 1024 / 1024, 2),
+                'avg_ms': round(seconds / count * 1000, 2),
+                'avg_kb': round(nbytes / count / 1024, 1)
+            }
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# 全域統計實例
+encoding_stats = EncodingStats()
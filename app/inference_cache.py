@@ -0,0 +1,237 @@
+"""
+自動標記推論結果快取模組。
+
+此模組負責：
+1. 以 (模型檔內容雜湊, 訓練用圖內容雜湊) 為 key，保存每張影像的 Top-k 類別索引與模型輸出分數
+2. 重複對同一份音檔、同一個訓練紀錄執行自動標記時直接讀取快取，只有內容改變的影像需要重新推論
+3. 以最後使用時間實作 LRU，項目數超過上限時淘汰最久未使用者
+
+設計模式：
+- 行程內單例，由 get_inference_cache() 於第一次使用時建立 (與 display_cache 相同)
+- 儲存於 SQLite 檔案 (WAL 模式)：同一台機器上的多個 worker 行程共用，worker 重啟後仍有效
+- 每次操作開啟獨立連線 (sqlite3 連線不可跨執行緒共用)
+- 模型檔雜湊以 (路徑, 修改時間, 大小) 記憶，同一個模型檔只計算一次
+- 分數為模型的原始輸出 (torchvision 為 logits；YOLO Classify 層輸出為機率)
+
+環境變數：
+- INFERENCE_CACHE_PATH: SQLite 檔案路徑 (預設 <DATA_DIR>/inference_cache.sqlite，見 create_app)
+- INFERENCE_CACHE_MAX_ENTRIES: 項目數上限 (預設 1000000；0 表示停用快取)
+- INFERENCE_CACHE_TOPK: 每張影像保存的類別數 (預設 5)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 每個 SELECT ... WHERE image_hash IN 的最大筆數 (低於 SQLite 的參數數量上限)
+QUERY_CHUNK_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inference_cache (
+    model_hash TEXT NOT NULL,
+    image_hash TEXT NOT NULL,
+    top_indices TEXT NOT NULL,
+    top_scores TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model_hash, image_hash)
+)
+"""
+
+
+class InferenceCache:
+    """
+    Top-k 推論結果的 SQLite 快取。
+
+    Attributes:
+        path (str): SQLite 檔案路徑
+        max_entries (int): 項目數上限
+        top_k (int): 每張影像保存的類別數
+        hits (int): 命中次數
+        misses (int): 未命中次數
+
+    Example:
+        >>> cache = InferenceCache('/tmp/inference_cache.sqlite', 100000)
+        >>> found = cache.get_many(model_hash, image_hashes)   # {image_hash: ([索引], [分數])}
+        >>> cache.put_many(model_hash, [(image_hash, [3, 1], [4.2, 0.7])])
+    """
+
+    def __init__(self, path, max_entries, top_k=5):
+        self.path = path
+        self.max_entries = max_entries
+        self.top_k = max(1, top_k)
+        self.hits = 0
+        self.misses = 0
+        self._count = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """開啟連線，區塊結束時提交 (例外時回滾) 並關閉"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, model_hash, image_hashes):
+        """
+        查詢多張影像的快取結果，命中的項目更新最後使用時間。
+
+        Returns:
+            dict: image_hash -> ([類別索引], [分數])，依分數由高到低
+        """
+        found = {}
+        keys = list(dict.fromkeys(image_hashes))
+        with self._connect() as conn:
+            for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+                chunk = keys[start:start + QUERY_CHUNK_SIZE]
+                rows = conn.execute(
+                    f"SELECT image_hash, top_indices, top_scores FROM inference_cache "
+                    f"WHERE model_hash = ? AND image_hash IN ({','.join('?' * len(chunk))})",
+                    [model_hash, *chunk]
+                ).fetchall()
+                for image_hash, indices, scores in rows:
+                    found[image_hash] = (json.loads(indices), json.loads(scores))
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE inference_cache SET last_used = ? WHERE model_hash = ? AND image_hash = ?",
+                    [(now, model_hash, image_hash) for image_hash in found]
+                )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model_hash, items):
+        """
+        寫入推論結果。
+
+        Args:
+            items (list[tuple]): [(image_hash, [類別索引], [分數])]
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO inference_cache "
+                "(model_hash, image_hash, top_indices, top_scores, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(model_hash, image_hash, json.dumps(list(indices)), json.dumps(list(scores)), now)
+                 for image_hash, indices, scores in items]
+            )
+            with self._lock:
+                if self._count is None:
+                    self._count = conn.execute("SELECT COUNT(*) FROM inference_cache").fetchone()[0]
+                else:
+                    self._count += len(items)
+                if self._count > self.max_entries:
+                    self._evict(conn)
+
+    def _evict(self, conn):
+        """淘汰最久未使用的項目，直到項目數低於上限的 90%"""
+        total = conn.execute("SELECT COUNT(*) FROM inference_cache").fetchone()[0]
+        excess = total - int(self.max_entries * 0.9)
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM inference_cache WHERE rowid IN "
+                "(SELECT rowid FROM inference_cache ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            total -= excess
+            print(f"[inference_cache] 淘汰 {excess} 筆推論結果，目前 {total} 筆")
+        self._count = total
+
+    def stats(self):
+        """回傳快取統計 (項目數、命中、未命中、命中率)"""
+        with self._connect() as conn:
+            size = conn.execute("SELECT COUNT(*) FROM inference_cache").fetchone()[0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': size,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM inference_cache")
+        with self._lock:
+            self._count = 0
+
+
+def file_digest(path):
+    """檔案內容的 BLAKE2b 雜湊 (hex)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_model_digests = {}
+_model_digests_lock = threading.Lock()
+
+
+def model_digest(path):
+    """模型檔的內容雜湊，以 (路徑, 修改時間, 大小) 記憶，模型檔被覆寫時重新計算"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _model_digests_lock:
+        digest = _model_digests.get(key)
+    if digest is None:
+        digest = file_digest(path)
+        with _model_digests_lock:
+            _model_digests[key] = digest
+    return digest
+
+
+def image_digests(paths, workers=4):
+    """平行計算多張影像的內容雜湊 (hashlib 計算時釋放 GIL)；無法讀取的影像為 None"""
+    def digest_or_none(path):
+        try:
+            return file_digest(path)
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(digest_or_none, paths))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_inference_cache():
+    """
+    取得全域推論快取 (需在 Flask 應用程式上下文中第一次呼叫)。
+
+    Returns:
+        InferenceCache | None: INFERENCE_CACHE_MAX_ENTRIES 為 0 時回傳 None (停用)
+    """
+    global _cache
+    max_entries = int(os.environ.get('INFERENCE_CACHE_MAX_ENTRIES', 1000000))
+    if max_entries <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = os.environ.get('INFERENCE_CACHE_PATH')
+            if not path:
+                from flask import current_app
+                path = os.path.join(current_app.config['DATA_DIR'], 'inference_cache.sqlite')
+            _cache = InferenceCache(path, max_entries, int(os.environ.get('INFERENCE_CACHE_TOPK', 5)))
+    return _cache
@@ -0,0 +1,124 @@
+"""
+片段批次推論階段。
+
+此模組負責：
+1. 收集處理完成之片段的訓練用圖 (記憶體中的 RGB 影像)，湊成批次
+2. 於專用的推論執行緒上以一次前向運算處理整個批次 (ai_model.run_inference_batch)
+3. 依片段編號回傳推論結果，由 process_large_audio 併回各片段
+
+設計模式：
+- 片段執行緒 (或行程) 只負責繪圖，PyTorch 只在推論執行緒中呼叫
+- 佇列有上限：推論速度跟不上時 submit 會等待，片段影像不會在記憶體中無限堆積
+- 批次湊滿 batch_size 或等待 BATCH_WAIT_SECONDS 仍無新片段時即送出，尾端不足一批的片段不會延遲
+- 非無損格式 (JPEG) 或無記憶體影像的片段改讀取存檔，與模型訓練時讀到的影像一致
+- 模型不存在時不啟動執行緒，所有片段結果為 []
+
+環境變數：
+- INFERENCE_BATCH_SIZE: 每次前向運算的片段數 (預設 32)
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+
+# 等待下一個片段湊批次的最長秒數
+BATCH_WAIT_SECONDS = 0.05
+
+DEFAULT_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', 32))
+
+_STOP = object()
+
+
+class InferenceStage:
+    """
+    單次音檔處理的批次推論階段。
+
+    Attributes:
+        batch_size (int): 每次前向運算的片段數
+        results (dict): 片段編號 -> 推論結果 ([{'label', 'confidence'}] 或 [])
+
+    Example:
+        >>> stage = InferenceStage(batch_size=32, lease=lease)
+        >>> stage.submit(0, image, training_spec_path)
+        >>> detections = stage.close()  # {0: [{'label': ..., 'confidence': ...}]}
+    """
+
+    def __init__(self, batch_size=None, lease=None):
+        from .ai_model import get_model
+
+        self.batch_size = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+        self.lease = lease
+        self.results = {}
+        self.batches = 0
+        self._queue = queue.Queue(maxsize=self.batch_size * 2)
+        self._thread = None
+        if get_model() is not None:
+            self._thread = threading.Thread(target=self._run, name='inference-stage', daemon=True)
+            self._thread.start()
+
+    def submit(self, index, image=None, path=None):
+        """
+        加入一個片段。
+
+        Args:
+            index (int): 片段編號
+            image (np.ndarray | None): RGB uint8 訓練用圖；None 時讀取 path
+            path (str): 訓練用圖的檔案路徑
+        """
+        if self._thread is None:
+            self.results[index] = []
+            return
+        self._queue.put((index, image, path))
+
+    def close(self):
+        """等待佇列中的片段推論完成並結束推論執行緒 (可重複呼叫)，回傳 results"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        return self.results
+
+    def _next_batch(self):
+        """取得下一個批次；收到結束訊號時回傳 (批次, True)"""
+        batch = []
+        item = self._queue.get()
+        while item is not _STOP:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self._queue.get(timeout=BATCH_WAIT_SECONDS)
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def _run(self):
+        from .ai_model import run_inference_batch
+
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            indices = [index for index, _, _ in batch]
+            try:
+                images = [image if image is not None else _load_image(path) for _, image, path in batch]
+                if self.lease is not None:
+                    with self.lease.slot():
+                        detections = run_inference_batch(images)
+                else:
+                    detections = run_inference_batch(images)
+            except Exception as e:
+                print(f"批次推論發生錯誤 (片段 {indices[0]}-{indices[-1]}): {e}")
+                detections = [[] for _ in batch]
+            self.results.update(zip(indices, detections))
+            self.batches += 1
+
+
+def _load_image(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
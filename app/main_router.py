@@ -4,4 +4,4 @@ from flask import Blueprint
 main_bp = Blueprint('main', __name__)
 
 # 引入所有的子路由設定，這樣它們就會自動註冊到這個 main_bp 上
-from .routers import pages, upload, status, training, labels, download, api
+from .routers import pages, upload, status, training, labels, download, api, display, browse, playback
@@ -0,0 +1,274 @@
+"""
+批次影像推論模組 (自動標記用)。
+
+此模組負責：
+1. 以 DataLoader 平行解碼片段的訓練用圖 (多個子行程)，組成批次
+2. 以 torch.inference_mode() 對每個批次執行一次前向運算，回傳每張影像的 Top-1 類別索引
+3. YOLOv8 分類模型同樣直接呼叫其底層 torch 模組，不經過 ultralytics predictor 逐張處理
+4. 訓練時匯出的 TorchScript 模型 (見 model_export) 使用相同的前處理與批次流程
+5. 以 inference_cache 略過模型與影像內容皆未改變的影像 (重複執行自動標記時只推論有變動的片段)
+
+設計模式：
+- YOLO 的前處理使用 ultralytics 的 classify_transforms (與 predictor 相同)，輸入影像尺寸取自訓練參數；
+  ultralytics 版本不支援時改為將整個批次的 PIL 影像交給 predictor (仍為一次呼叫)
+- YOLO 模組於推論時取得 model_registry 的鎖 (predictor 初始化時會原地融合 Conv+BN)
+- 無法讀取的影像結果為 None，不中斷其餘批次
+
+環境變數：
+- AUTO_LABEL_BATCH_SIZE: 每批次影像數 (預設 64)
+"""
+
+import os
+import contextlib
+
+AUTO_LABEL_BATCH_SIZE = int(os.environ.get('AUTO_LABEL_BATCH_SIZE', 64))
+
+
+class SegmentImageDataset:
+    """
+    片段訓練用圖的 map-style Dataset (DataLoader 只需 __len__ 與 __getitem__)。
+
+    每個項目回傳 (影像 tensor, 是否成功讀取)；讀取失敗時回傳全零 tensor。
+    """
+
+    def __init__(self, paths, transform, image_shape):
+        self.paths = paths
+        self.transform = transform
+        self.image_shape = image_shape
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        import torch
+        from PIL import Image
+
+        try:
+            with Image.open(self.paths[index]) as image:
+                return self.transform(image.convert('RGB')), True
+        except Exception as e:
+            print(f"影像讀取失敗 ({self.paths[index]}): {e}")
+            return torch.zeros(self.image_shape), False
+
+
+# torchvision 模型 (CnnTrainer) 推論時的輸入尺寸
+CNN_IMAGE_SIZE = 224
+
+
+def cnn_transform(image_size=CNN_IMAGE_SIZE):
+    """torchvision 模型的前處理 (ImageNet 正規化)"""
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+
+
+def yolo_transform(imgsz):
+    """與 ultralytics ClassificationPredictor 相同的前處理"""
+    from PIL import Image
+    from ultralytics.data.augment import classify_transforms
+
+    transform = classify_transforms(size=imgsz)
+    # 舊版 ultralytics 的 classify_transforms 只接受 numpy 影像，先確認可處理 PIL 影像
+    transform(Image.new('RGB', (imgsz, imgsz)))
+    return transform
+
+
+def model_input(entry, is_yolo):
+    """
+    取得模型的前處理、輸入形狀與實際執行的 torch 模組。
+
+    entry 可為原始權重 (YOLO / torchvision) 或 model_export 輸出的 TorchScript 模型 (meta['backend'] == 'torchscript')。
+
+    Returns:
+        tuple: (transform, (3, 高, 寬), torch 模組)
+    """
+    scripted = entry.meta.get('backend') == 'torchscript'
+    if is_yolo:
+        if scripted:
+            imgsz = entry.meta['imgsz']
+        else:
+            imgsz = (getattr(entry.model.model, 'args', None) or {}).get('imgsz', 224)
+            if isinstance(imgsz, (list, tuple)):
+                imgsz = imgsz[0]
+        module = entry.model if scripted else entry.model.model
+        return yolo_transform(imgsz), (3, imgsz, imgsz), module
+    image_size = entry.meta.get('image_size', CNN_IMAGE_SIZE)
+    return cnn_transform(image_size), (3, image_size, image_size), entry.model
+
+
+def forward_top1(module, images, channels_last=False):
+    """前向運算並回傳 Top-1 索引 tensor (YOLO Classify 層部分版本回傳 (機率, logits))"""
+    import torch
+
+    if channels_last:
+        images = images.contiguous(memory_format=torch.channels_last)
+    outputs = module(images)
+    if isinstance(outputs, (list, tuple)):
+        outputs = outputs[0]
+    return outputs.argmax(dim=1)
+
+
+def forward_topk(module, images, k, channels_last=False):
+    """前向運算並回傳 (Top-k 分數, Top-k 索引) tensor，k 不超過類別數"""
+    import torch
+
+    if channels_last:
+        images = images.contiguous(memory_format=torch.channels_last)
+    outputs = module(images)
+    if isinstance(outputs, (list, tuple)):
+        outputs = outputs[0]
+    return torch.topk(outputs.float(), k=min(k, outputs.shape[1]), dim=1)
+
+
+def predict_top1(entry, paths, is_yolo, batch_size=None, progress_callback=None, use_cache=True):
+    """
+    對 paths 的影像批次推論。
+
+    use_cache 時先以 (模型檔雜湊, 影像內容雜湊) 查詢 inference_cache，只推論未命中的影像，
+    推論結果 (Top-k 索引與分數) 寫回快取。
+
+    Args:
+        entry (LoadedModel): model_registry 回傳的模型 (原始權重或 TorchScript)
+        paths (list[str]): 影像路徑
+        is_yolo (bool): 是否為 YOLOv8 分類模型
+        batch_size (int): 每批次影像數，None 時使用 AUTO_LABEL_BATCH_SIZE
+        progress_callback (callable): progress_callback(已完成數, 總數)，每個批次後呼叫
+        use_cache (bool): 是否使用推論快取
+
+    Returns:
+        list: 與 paths 對應的 Top-1 類別索引 (int)；讀取或推論失敗為 None
+    """
+    batch_size = max(1, int(batch_size or AUTO_LABEL_BATCH_SIZE))
+    results = [None] * len(paths)
+    if not paths:
+        return results
+
+    cache = model_hash = None
+    hashes = [None] * len(paths)
+    if use_cache and entry.path:
+        try:
+            from ..cpu_budget import cpu_budget
+            from ..inference_cache import get_inference_cache, model_digest, image_digests
+
+            cache = get_inference_cache()
+            if cache is not None:
+                model_hash = model_digest(entry.path)
+                hashes = image_digests(paths, workers=cpu_budget.current().cores)
+                found = cache.get_many(model_hash, [h for h in hashes if h])
+                for i, image_hash in enumerate(hashes):
+                    if image_hash in found:
+                        results[i] = found[image_hash][0][0]
+        except Exception as e:
+            print(f"推論快取無法使用，改為全部推論: {e}")
+            cache = None
+
+    pending = [i for i, top1 in enumerate(results) if top1 is None]
+    cached = len(paths) - len(pending)
+    if cached:
+        print(f"推論快取命中 {cached}/{len(paths)} 張影像")
+        if progress_callback:
+            progress_callback(cached, len(paths))
+    if not pending:
+        return results
+
+    completed = [cached]
+
+    def on_batch(batch_indices, topk):
+        """一個批次推論完成：填入結果並寫回快取"""
+        items = []
+        for i, top in zip(batch_indices, topk):
+            if top is None:
+                continue
+            results[i] = top[0][0]
+            if hashes[i]:
+                items.append((hashes[i], top[0], top[1]))
+        if cache is not None:
+            try:
+                cache.put_many(model_hash, items)
+            except Exception as e:
+                print(f"推論快取寫入失敗: {e}")
+        completed[0] += len(batch_indices)
+        if progress_callback:
+            progress_callback(completed[0], len(paths))
+
+    top_k = cache.top_k if cache is not None else 1
+    try:
+        transform, image_shape, module = model_input(entry, is_yolo)
+    except Exception as e:
+        if not is_yolo or entry.meta.get('backend') == 'torchscript':
+            raise
+        print(f"無法直接使用 YOLO 底層模組 ({e})，改以 predictor 批次推論")
+        _predict_topk_predictor(entry, paths, pending, batch_size, top_k, on_batch)
+        return results
+    _predict_topk(entry, module, transform, image_shape, is_yolo, paths, pending, batch_size, top_k, on_batch)
+    return results
+
+
+def _predict_topk(entry, module, transform, image_shape, is_yolo, paths, indices, batch_size, top_k, on_batch):
+    """以 DataLoader 推論 paths 中 indices 的影像，每個批次以 on_batch(批次索引, [(Top-k 索引, 分數) 或 None]) 回報"""
+    import torch
+    from torch.utils.data import DataLoader
+    from ..cpu_budget import cpu_budget
+
+    # 原始 YOLO 模組可能正由 predictor 使用 (初始化時會原地融合 Conv+BN)，推論時取得鎖
+    lock = entry.lock if (is_yolo and entry.meta.get('backend') != 'torchscript') else contextlib.nullcontext()
+    channels_last = entry.meta.get('channels_last', False)
+
+    device = next(iter(module.parameters()), torch.empty(0)).device
+    dataset = SegmentImageDataset([paths[i] for i in indices], transform, image_shape)
+    # 解碼子行程數依任務分得的 CPU 核心數調整 (保留一核給前向運算)，與 CnnTrainer 相同
+    num_workers = max(0, min(4, cpu_budget.current().cores - 1))
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        pin_memory=device.type == 'cuda')
+
+    done = 0
+    with torch.inference_mode():
+        for images, valid in loader:
+            batch_indices = indices[done:done + len(valid)]
+            topk = [None] * len(valid)
+            try:
+                images = images.to(device, non_blocking=True)
+                with lock:
+                    module.eval()
+                    scores, top_indices = forward_topk(module, images, top_k, channels_last)
+                for offset, (row_indices, row_scores, ok) in enumerate(
+                        zip(top_indices.tolist(), scores.tolist(), valid.tolist())):
+                    if ok:
+                        topk[offset] = (row_indices, row_scores)
+            except Exception as e:
+                print(f"批次推論錯誤 (影像 {done}-{done + len(valid) - 1}): {e}")
+            done += len(valid)
+            on_batch(batch_indices, topk)
+
+
+def _predict_topk_predictor(entry, paths, indices, batch_size, top_k, on_batch):
+    """以 ultralytics predictor 推論 (每個批次一次呼叫)，分數為 predictor 輸出的機率"""
+    from PIL import Image
+
+    for start in range(0, len(indices), batch_size):
+        batch_indices = indices[start:start + batch_size]
+        topk = [None] * len(batch_indices)
+        batch = []
+        loaded = []
+        for offset, i in enumerate(batch_indices):
+            try:
+                with Image.open(paths[i]) as image:
+                    batch.append(image.convert('RGB'))
+                loaded.append(offset)
+            except Exception as e:
+                print(f"影像讀取失敗 ({paths[i]}): {e}")
+        try:
+            if batch:
+                with entry.lock:
+                    preds = entry.model(batch, verbose=False)
+                for offset, pred in zip(loaded, preds):
+                    if pred.probs is not None:
+                        k = min(top_k, len(pred.probs.top5))
+                        topk[offset] = (pred.probs.top5[:k], [float(v) for v in pred.probs.top5conf[:k]])
+        except Exception as e:
+            print(f"批次推論錯誤 (影像 {batch_indices[0]}-{batch_indices[-1]}): {e}")
+        on_batch(batch_indices, topk)
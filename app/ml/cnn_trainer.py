@@ -137,8 +137,11 @@ class CnnTrainer:
             train_dataset = datasets.ImageFolder(os.path.join(dataset_dir, 'train'), transform=transform)
             val_dataset = datasets.ImageFolder(os.path.join(dataset_dir, 'val'), transform=transform)
             
-            train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=4, pin_memory=True)
-            val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=4, pin_memory=True)
+            # DataLoader 子行程數依任務分得的 CPU 核心數調整 (保留一核給訓練迴圈)
+            from ..cpu_budget import cpu_budget
+            num_workers = max(0, min(4, cpu_budget.current().cores - 1))
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers, pin_memory=True)
+            val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, pin_memory=True)
             
             num_classes = len(train_dataset.classes)
             class_names = train_dataset.classes
@@ -395,12 +398,28 @@ class CnnTrainer:
             plt.savefig(os.path.join(train_results_dir, 'results.png'))
             plt.close()
             
-            # 9. 儲存指標
+            # 9. 匯出 CPU 推論用 TorchScript (以驗證集檢查與原始模型的 Top-1 一致性，見 model_export)
+            from .model_export import export_cpu_artifact
+            cpu_artifact = export_cpu_artifact(
+                os.path.join(weights_dir, 'best.pt'), model_name, [path for path, _ in val_dataset.samples]
+            )
+            
+            # 10. (選用) 以驗證集校正的 INT8 量化模型，記錄量化前後的準確率差異
+            int8_artifact = None
+            if train_params.get('quantize_int8'):
+                from .model_export import export_int8_artifact
+                int8_artifact = export_int8_artifact(
+                    os.path.join(weights_dir, 'best.pt'), model_name, list(val_dataset.samples)
+                )
+            
+            # 11. 儲存指標
             now = datetime.now()
             duration_sec = (now - training_run.timestamp.replace(tzinfo=None)).total_seconds() if training_run.timestamp else 0
             metrics_dict = {
                 'accuracy_top1': round(best_acc, 4),
                 'per_class_list': per_class_list,
+                'cpu_artifact': cpu_artifact,
+                'int8_artifact': int8_artifact,
                 'end_time': now.strftime('%Y-%m-%d %H:%M:%S'),
                 'duration_seconds': round(duration_sec, 1)
             }
@@ -1,8 +1,95 @@
 import os
 import traceback
+from collections import defaultdict
 from flask import current_app
+from sqlalchemy import bindparam
 from .. import db
 from ..models import AudioInfo, Result, CetaceanInfo, Label
+from ..model_registry import is_yolo_type
+from .batch_inference import predict_top1
+from .model_export import load_for_inference
+
+# 寫回預測結果時每個 UPDATE ... WHERE id IN 的最大筆數
+WRITE_BACK_CHUNK_SIZE = 1000
+
+_UPDATE_PREDICTIONS = db.text(
+    "UPDATE cetacean_info SET event_type = :event_type, detect_type = 1 WHERE id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+
+def _collect_segment_images(audio_info):
+    """
+    依順序配對片段結果與標記，略過訓練用圖不存在的片段。
+    只查詢需要的欄位，不載入 Result / CetaceanInfo 的 ORM 物件。
+
+    Returns:
+        tuple: ([(片段序號, CetaceanInfo.id)], [影像路徑])
+    """
+    result_dir = os.path.join(current_app.root_path, 'static', audio_info.result_path)
+    filenames = db.session.query(Result.spectrogram_training_filename).filter_by(
+        upload_id=audio_info.id).order_by(Result.id).all()
+    cetacean_ids = db.session.query(CetaceanInfo.id).filter_by(
+        audio_id=audio_info.id).order_by(CetaceanInfo.id).all()
+
+    pairs, paths = [], []
+    for i, ((filename,), (cetacean_id,)) in enumerate(zip(filenames, cetacean_ids)):
+        image_path = os.path.join(result_dir, filename)
+        if os.path.exists(image_path):
+            pairs.append((i, cetacean_id))
+            paths.append(image_path)
+    return pairs, paths
+
+
+def _progress_updater(audio_id):
+    """
+    批次推論的進度回呼：約每 5% 更新一次 audio_info.progress。
+
+    以獨立連線執行並立即提交，不經過任務的 ORM session (不會 flush 或提前提交標記結果)。
+    """
+    last = [0]
+
+    def update(done, total):
+        if done - last[0] >= max(1, int(total * 0.05)) and done < total:
+            last[0] = done
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(
+                        db.text("UPDATE audio_info SET progress = :progress WHERE id = :id"),
+                        {"progress": int(done / total * 100), "id": audio_id}
+                    )
+            except Exception as e:
+                print(f"進度更新失敗 (ID: {audio_id}): {e}")
+    return update
+
+
+def _write_predictions(updates):
+    """
+    寫回自動標記結果：依預測類別分組，以分塊的 UPDATE ... WHERE id IN 執行 (每塊最多 WRITE_BACK_CHUNK_SIZE 筆)。
+    由呼叫端提交。
+
+    Args:
+        updates (list[tuple]): [(CetaceanInfo.id, event_type)]
+
+    Returns:
+        int: 更新筆數
+    """
+    ids_by_type = defaultdict(list)
+    for cetacean_id, event_type in updates:
+        ids_by_type[event_type].append(cetacean_id)
+    for event_type, ids in ids_by_type.items():
+        for start in range(0, len(ids), WRITE_BACK_CHUNK_SIZE):
+            db.session.execute(_UPDATE_PREDICTIONS, {'event_type': event_type, 'ids': ids[start:start + WRITE_BACK_CHUNK_SIZE]})
+    return len(updates)
+
+
+def _finish(audio_id):
+    """與寫回的標記於同一交易中將音檔標為完成"""
+    db.session.execute(
+        db.text("UPDATE audio_info SET status = 'COMPLETED', progress = 100 WHERE id = :id"),
+        {"id": audio_id}
+    )
+    db.session.commit()
+
 
 class InferenceService:
     @staticmethod
@@ -35,62 +122,44 @@ class InferenceService:
             # ---------------------------------------------------------
             # A. 模型初始化與載入
             # ---------------------------------------------------------
-            model = None
-            is_yolo = (model_type == 'yolo' or model_type.startswith('yolov8'))
+            # 模型由 model_registry 快取，重複執行自動標記時不需重新載入權重；
+            # CPU 推論時優先使用訓練後匯出的 TorchScript (見 model_export)
+            is_yolo = is_yolo_type(model_type)
             device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
             cnn_labels_map = [] # Index -> ID
 
             if is_yolo:
-                from ultralytics import YOLO
                 try:
-                    model = YOLO(model_path)
+                    entry = load_for_inference(model_path, device, 'yolo')
                 except Exception as e:
                     print(f"YOLO 模型載入失敗: {e}。嘗試使用 PyTorch 載入...")
                     is_yolo = False # Fallback to generic PyTorch handling check
 
             if not is_yolo:
                 # 載入 PyTorch 模型 (ResNet / EfficientNet)
-                import torch.nn as nn
-                from torchvision import transforms, models
-                from PIL import Image as PILImage
-                
                 # 默認類別對應 (若無法從其他地方取得)
                 all_labels = sorted(Label.query.all(), key=lambda x: x.name)
                 cnn_labels_map = [l.id for l in all_labels]
                 
-                # 先載入 checkpoint 以確定 num_classes
                 try:
-                    checkpoint = torch.load(model_path, map_location=device)
-                    state_dict = checkpoint
-                    
+                    # 類別數由 checkpoint 判斷；無法判斷時使用 DB 標籤數 (0 時預設為 2)
+                    cnn_type = model_type if model_type in ('resnet18', 'efficientnet_b0') else 'resnet18'
+                    entry = load_for_inference(model_path, device, cnn_type, num_classes=len(cnn_labels_map))
+                    num_classes = entry.meta['num_classes']
+                    class_names = entry.meta['classes']
+
                     # Checkpoint 格式判斷
-                    if isinstance(checkpoint, dict) and 'classes' in checkpoint:
+                    if class_names:
                         print("偵測到含 Metadata 的模型 checkpoint")
-                        class_names = checkpoint['classes']
-                        state_dict = checkpoint['model_state_dict']
                         
                         # 使用儲存的類別名稱來建立 Mapping
                         name_to_id = {l.name: l.id for l in Label.query.all()}
                         cnn_labels_map = [name_to_id.get(name, 0) for name in class_names]
-                        num_classes = len(class_names)
                     
                     else:
-                        # 舊版或是純 state_dict
-                        # 嘗試從權重形狀推斷 num_classes
-                        detected_classes = 0
-                        if 'fc.weight' in state_dict: # ResNet
-                            detected_classes = state_dict['fc.weight'].shape[0]
-                        elif 'classifier.1.weight' in state_dict: # EfficientNet
-                            detected_classes = state_dict['classifier.1.weight'].shape[0]
-                        # 處理 module. 前綴的情況
-                        elif 'module.fc.weight' in state_dict:
-                            detected_classes = state_dict['module.fc.weight'].shape[0]
-                        elif 'module.classifier.1.weight' in state_dict:
-                            detected_classes = state_dict['module.classifier.1.weight'].shape[0]
-                        
-                        if detected_classes > 0:
-                            print(f"從權重偵測到分類數量: {detected_classes}")
-                            num_classes = detected_classes
+                        # 舊版或是純 state_dict：類別數由權重形狀推斷
+                        if entry.meta['detected']:
+                            print(f"從權重偵測到分類數量: {num_classes}")
                             
                             # 優先使用使用者指定的類別
                             if user_specified_classes and len(user_specified_classes) == num_classes:
@@ -133,46 +202,10 @@ class InferenceService:
                                     else:
                                         print("警告: 無法確定類別映射，預測結果可能不正確")
                                         cnn_labels_map = list(range(num_classes))
-                        else:
-                            # 無法偵測，使用 DB 數量
-                            num_classes = len(cnn_labels_map)
-                            if num_classes == 0:
-                                print("警告: 無法決定分類數量，預設為 2 以避免崩潰")
-                                num_classes = 2
-                                cnn_labels_map = [90, 91]
-
-                    # 初始化架構
-                    if model_type == 'resnet18':
-                        model = models.resnet18(weights=None)
-                        num_ftrs = model.fc.in_features
-                        model.fc = nn.Linear(num_ftrs, num_classes)
-                    elif model_type == 'efficientnet_b0':
-                        model = models.efficientnet_b0(weights=None)
-                        num_ftrs = model.classifier[1].in_features
-                        model.classifier[1] = nn.Linear(num_ftrs, num_classes)
-                    else:
-                        model = models.resnet18(weights=None)
-                        num_ftrs = model.fc.in_features
-                        model.fc = nn.Linear(num_ftrs, num_classes)
-                    
-                    # 載入權重
-                    new_state_dict = {}
-                    for k, v in state_dict.items():
-                        if k.startswith('module.'):
-                            new_state_dict[k[7:]] = v
-                        else:
-                            new_state_dict[k] = v
-                            
-                    model.load_state_dict(new_state_dict)
-                    model.to(device)
-                    model.eval()
-                    
-                    # 定義預處理
-                    val_transforms = transforms.Compose([
-                        transforms.Resize((224, 224)),
-                        transforms.ToTensor(),
-                        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-                    ])
+                        elif not cnn_labels_map:
+                            # 無法偵測，且 DB 無標籤
+                            print("警告: 無法決定分類數量，預設為 2 以避免崩潰")
+                            cnn_labels_map = [90, 91]
                     
                 except Exception as e:
                     print(f"PyTorch 模型載入失敗: {e}")
@@ -185,85 +218,50 @@ class InferenceService:
             # 準備 Label Mapping (Class Name -> ID) for YOLO
             all_labels_obj_map = {label.name: label.id for label in Label.query.all()}
 
-            results_list = Result.query.filter_by(upload_id=upload_id).order_by(Result.id).all()
-            cetaceans_list = CetaceanInfo.query.filter_by(audio_id=upload_id).order_by(CetaceanInfo.id).all()
-            
-            total_items = len(results_list)
-            count = 0
+            pairs, paths = _collect_segment_images(audio_info)
+            updates = []
 
-            # 逐一預測
-            for i, (res_item, cetacean_item) in enumerate(zip(results_list, cetaceans_list)):
-                
-                # 定期更新進度
-                if total_items > 0 and i % max(1, int(total_items * 0.05)) == 0:
-                    current_prog = int((i / total_items) * 100)
-                    if current_prog != audio_info.progress:
-                        audio_info.progress = current_prog
-                        db.session.commit()
-
-                image_path = os.path.join(current_app.root_path, 'static', res_item.audio_info.result_path, res_item.spectrogram_training_filename)
-                
-                if not os.path.exists(image_path): continue
+            # 批次推論 (DataLoader 平行解碼影像，每個批次一次前向運算)
+            predictions = predict_top1(entry, paths, is_yolo, progress_callback=_progress_updater(upload_id))
+
+            for (i, cetacean_id), pred_idx in zip(pairs, predictions):
+                if pred_idx is None:
+                    continue
                 
                 predicted_id = 0
                 
                 try:
                     if is_yolo:
-                        preds = model(image_path, verbose=False)
-                        if preds and preds[0].probs:
-                            top1_index = preds[0].probs.top1
-                            label_name = model.names[top1_index]
-                            
-                            if label_name in all_labels_obj_map:
-                                predicted_id = all_labels_obj_map[label_name]
-                            elif str(label_name).isdigit():
-                                predicted_id = int(label_name)
-                    else:
-                        img = PILImage.open(image_path).convert('RGB')
-                        img_t = val_transforms(img).unsqueeze(0).to(device)
+                        label_name = entry.meta['classes'][pred_idx]
                         
-                        with torch.no_grad():
-                            outputs = model(img_t)
-                            _, predicted = torch.max(outputs, 1)
-                            pred_idx = predicted.item()
-                            
-                            if pred_idx < len(cnn_labels_map):
-                                predicted_id = cnn_labels_map[pred_idx]
+                        if label_name in all_labels_obj_map:
+                            predicted_id = all_labels_obj_map[label_name]
+                        elif str(label_name).isdigit():
+                            predicted_id = int(label_name)
+                    elif pred_idx < len(cnn_labels_map):
+                        predicted_id = cnn_labels_map[pred_idx]
                 
-                    # 寫入標記
+                    # 收集標記 (detect_type = 1：AI 辨識)，推論完成後批次寫回
                     if predicted_id != 0:
-                        cetacean_item.event_type = predicted_id
-                        cetacean_item.detect_type = 1 # 標記為 AI 辨識
-                        count += 1
+                        updates.append((cetacean_id, predicted_id))
                         
                 except Exception as e:
                     print(f"預測錯誤 (Index {i}): {e}")
                     continue
 
-            # 完成後更新狀態
-            audio_info.progress = 100
-            audio_info.status = 'COMPLETED'
-            db.session.commit()
+            # 寫回標記並更新狀態 (同一交易)
+            count = _write_predictions(updates)
+            _finish(upload_id)
             
             print(f"自動標記完成，更新了 {count} 筆資料。")
 
         except Exception as e:
             print(f"自動標記任務失敗: {e}")
+            db.session.rollback()
             audio_info.status = 'COMPLETED'
             db.session.commit()
             traceback.print_exc()
 
-        finally:
-            # 清理暫存模型檔
-            if os.path.exists(model_path):
-                try:
-                    os.remove(model_path)
-                    parent = os.path.dirname(model_path)
-                    if not os.listdir(parent):
-                        os.rmdir(parent)
-                except Exception:
-                    pass  # 静默忽略目錄清理錯誤
-
     @staticmethod
     def auto_label_v2(upload_id, model_path, model_type='yolov8n-cls', classes_list=None):
         """
@@ -300,112 +298,52 @@ class InferenceService:
             
             is_yolo = model_type.startswith('yolov8')
             device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            model = None
-            val_transforms = None
             
+            # 模型由 model_registry 快取，重複執行自動標記時不需重新載入權重；
+            # CPU 推論時優先使用訓練後匯出的 TorchScript (見 model_export)
             if is_yolo:
-                from ultralytics import YOLO
-                model = YOLO(model_path)
+                entry = load_for_inference(model_path, device, 'yolo')
             else:
-                import torch.nn as nn
-                from torchvision import transforms, models
-                from PIL import Image as PILImage
-                
-                num_classes = len(cnn_labels_map) if cnn_labels_map else 2
-                
-                checkpoint = torch.load(model_path, map_location=device)
-                state_dict = checkpoint
-                
-                if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
-                    state_dict = checkpoint['model_state_dict']
-                
-                # 初始化模型
-                if model_type == 'resnet18':
-                    model = models.resnet18(weights=None)
-                    model.fc = nn.Linear(model.fc.in_features, num_classes)
-                elif model_type == 'efficientnet_b0':
-                    model = models.efficientnet_b0(weights=None)
-                    model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_classes)
-                else:
-                    model = models.resnet18(weights=None)
-                    model.fc = nn.Linear(model.fc.in_features, num_classes)
-                
-                new_state_dict = {}
-                for k, v in state_dict.items():
-                    new_state_dict[k[7:] if k.startswith('module.') else k] = v
-                model.load_state_dict(new_state_dict)
-                model.to(device)
-                model.eval()
-                
-                val_transforms = transforms.Compose([
-                    transforms.Resize((224, 224)),
-                    transforms.ToTensor(),
-                    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-                ])
+                cnn_type = model_type if model_type in ('resnet18', 'efficientnet_b0') else 'resnet18'
+                entry = load_for_inference(model_path, device, cnn_type, num_classes=len(cnn_labels_map) or 2)
             
-            # 執行推論
-            results_list = Result.query.filter_by(upload_id=upload_id).order_by(Result.id).all()
-            cetaceans_list = CetaceanInfo.query.filter_by(audio_id=upload_id).order_by(CetaceanInfo.id).all()
-            
-            total_items = len(results_list)
-            count = 0
-
-            for i, (res_item, cetacean_item) in enumerate(zip(results_list, cetaceans_list)):
-                if total_items > 0 and i % max(1, int(total_items * 0.05)) == 0:
-                    audio_info.progress = int((i / total_items) * 100)
-                    db.session.commit()
-
-                image_path = os.path.join(
-                    current_app.root_path, 'static', 
-                    res_item.audio_info.result_path, 
-                    res_item.spectrogram_training_filename
-                )
-                
-                if not os.path.exists(image_path):
+            # 執行推論 (DataLoader 平行解碼影像，每個批次一次前向運算)
+            pairs, paths = _collect_segment_images(audio_info)
+            updates = []
+
+            predictions = predict_top1(entry, paths, is_yolo, progress_callback=_progress_updater(upload_id))
+
+            for (i, cetacean_id), pred_idx in zip(pairs, predictions):
+                if pred_idx is None:
                     continue
                 
                 predicted_id = 0
                 
                 try:
                     if is_yolo:
-                        preds = model(image_path, verbose=False)
-                        if preds and preds[0].probs:
-                            top1_index = preds[0].probs.top1
-                            label_name = model.names[top1_index]
-                            try:
-                                predicted_id = int(label_name)
-                            except ValueError:
-                                predicted_id = 0
-                    else:
-                        from PIL import Image as PILImage
-                        img = PILImage.open(image_path).convert('RGB')
-                        img_t = val_transforms(img).unsqueeze(0).to(device)
-                        
-                        with torch.no_grad():
-                            outputs = model(img_t)
-                            _, predicted = torch.max(outputs, 1)
-                            pred_idx = predicted.item()
-                            
-                            if pred_idx < len(cnn_labels_map):
-                                predicted_id = cnn_labels_map[pred_idx]
+                        label_name = entry.meta['classes'][pred_idx]
+                        try:
+                            predicted_id = int(label_name)
+                        except ValueError:
+                            predicted_id = 0
+                    elif pred_idx < len(cnn_labels_map):
+                        predicted_id = cnn_labels_map[pred_idx]
                     
                     if predicted_id != 0:
-                        cetacean_item.event_type = predicted_id
-                        cetacean_item.detect_type = 1
-                        count += 1
+                        updates.append((cetacean_id, predicted_id))
                         
                 except Exception as e:
                     print(f"預測錯誤 (Index {i}): {e}")
                     continue
 
-            audio_info.progress = 100
-            audio_info.status = 'COMPLETED'
-            db.session.commit()
+            count = _write_predictions(updates)
+            _finish(upload_id)
             
             print(f"自動標記 V2 完成，更新了 {count} 筆資料。")
 
         except Exception as e:
             print(f"自動標記任務 V2 失敗: {e}")
+            db.session.rollback()
             audio_info.status = 'COMPLETED'
             db.session.commit()
             traceback.print_exc()
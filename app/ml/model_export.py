@@ -0,0 +1,313 @@
+"""
+訓練後的 CPU 推論模型匯出模組。
+
+此模組負責：
+1. 訓練完成後將 weights/best.pt 匯出為 TorchScript (trace → freeze → optimize_for_inference，channels_last)，
+   存為同目錄的 best.torchscript
+2. 以驗證集影像比對匯出模型與原始 (eager) 模型的 Top-1 預測，一致率未達門檻時不保留匯出檔
+3. 推論時 (CPU) 優先載入匯出檔 (load_for_inference)，不存在、較 best.pt 舊或載入失敗時使用原始權重
+4. (選用) 以驗證集影像校正的靜態 INT8 量化 (FX graph mode)，存為 best_int8.torchscript，
+   並比較量化前後於驗證集的準確率；自動標記時可選用此模型
+
+設計模式：
+- 匯出檔內以 meta.json 記錄類別名稱、輸入尺寸等資訊，載入時不需原始 checkpoint
+- YOLO 匯出其底層 torch 模組，前處理沿用 ultralytics 的 classify_transforms (見 batch_inference)
+- 凍結後的模型針對 CPU 最佳化 (MKLDNN 等)，GPU 推論仍使用原始權重
+- 匯出失敗不影響訓練結果，只記錄於訓練指標
+- INT8 模型只在 CPU 執行 (量化運算子無 GPU 實作)，量化後端 (x86/fbgemm/qnnpack) 記錄於 meta.json
+
+環境變數：
+- EXPORT_PARITY_THRESHOLD: 保留匯出檔所需的 Top-1 一致率 (預設 0.99)
+"""
+
+import os
+import copy
+import json
+import time
+
+# 匯出檔副檔名 (與 best.pt 同目錄、同檔名)
+ARTIFACT_EXTENSION = '.torchscript'
+
+EXPORT_PARITY_THRESHOLD = float(os.environ.get('EXPORT_PARITY_THRESHOLD', 0.99))
+
+# 一致性檢查最多使用的驗證影像數
+PARITY_SAMPLES = 256
+
+# INT8 量化模型檔名後綴 (best_int8.torchscript)
+INT8_SUFFIX = '_int8'
+
+# 量化校正最多使用的驗證影像數 (由整個驗證集等距抽樣，避免只取到排序在前的類別)
+CALIBRATION_SAMPLES = 256
+
+
+def artifact_path(model_path):
+    """best.pt 對應的匯出檔路徑"""
+    return os.path.splitext(model_path)[0] + ARTIFACT_EXTENSION
+
+
+def int8_artifact_path(model_path):
+    """best.pt 對應的 INT8 量化模型路徑"""
+    return os.path.splitext(model_path)[0] + INT8_SUFFIX + ARTIFACT_EXTENSION
+
+
+def load_for_inference(model_path, device, model_type, **loader_kwargs):
+    """
+    取得推論用模型：CPU 推論且存在較新的匯出檔時使用 TorchScript，否則使用原始權重 (皆經 model_registry 快取)。
+    model_path 本身為匯出檔 (如使用者選擇的 INT8 模型) 時直接於 CPU 載入。
+
+    Returns:
+        LoadedModel: 匯出檔的 meta['backend'] 為 'torchscript'
+    """
+    from ..model_registry import model_registry, is_yolo_type
+
+    if model_path.endswith(ARTIFACT_EXTENSION):
+        return model_registry.get(model_path, 'cpu', 'torchscript')
+
+    scripted_path = artifact_path(model_path)
+    if (str(device) == 'cpu' and os.path.exists(scripted_path)
+            and os.path.getmtime(scripted_path) >= os.path.getmtime(model_path)):
+        try:
+            entry = model_registry.get(scripted_path, device, 'torchscript')
+            if entry.meta.get('source') == ('yolo' if is_yolo_type(model_type) else 'torchvision'):
+                return entry
+            print(f"匯出模型來源與模型類型 {model_type} 不符，改用原始權重")
+        except Exception as e:
+            print(f"載入匯出模型失敗 ({scripted_path}): {e}，改用原始權重")
+    return model_registry.get(model_path, device, model_type, **loader_kwargs)
+
+
+def _top1_wrapper(module):
+    """包裝模型只輸出單一 tensor (YOLO Classify 層部分版本回傳 (機率, logits))，以便 trace"""
+    import torch
+
+    class Top1Output(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, x):
+            outputs = self.inner(x)
+            if isinstance(outputs, (list, tuple)):
+                outputs = outputs[0]
+            return outputs
+
+    return Top1Output(module)
+
+
+def _load_eager(model_path, model_type):
+    """
+    以獨立的 CPU 實例載入原始權重 (不影響 model_registry 中共用的實例)。
+
+    Returns:
+        tuple: (float32 eval 模式的 torch 模組, transform, (3, 高, 寬), 匯出檔 meta)
+    """
+    from ..model_registry import LoadedModel, _get_loader, is_yolo_type
+    from .batch_inference import model_input
+
+    is_yolo = is_yolo_type(model_type)
+    model, meta = _get_loader(model_type)(model_path, 'cpu', model_type)
+    transform, image_shape, module = model_input(LoadedModel(model, meta), is_yolo)
+    module = copy.deepcopy(module).float().eval()
+
+    scripted_meta = {
+        'source': 'yolo' if is_yolo else 'torchvision',
+        'arch': model_type,
+        'channels_last': False,
+    }
+    if is_yolo:
+        names = model.names
+        scripted_meta['classes'] = [names[i] for i in range(len(names))]
+        scripted_meta['num_classes'] = len(names)
+        scripted_meta['imgsz'] = image_shape[-1]
+    else:
+        scripted_meta.update({
+            'classes': meta.get('classes'),
+            'num_classes': meta['num_classes'],
+            'detected': meta['detected'],
+            'image_size': image_shape[-1],
+        })
+    return module, transform, image_shape, scripted_meta
+
+
+def _save_scripted(scripted, out_path, scripted_meta):
+    """寫入暫存檔後再取代，推論端不會讀到寫到一半的檔案"""
+    import torch
+
+    tmp_path = out_path + '.tmp'
+    torch.jit.save(scripted, tmp_path, _extra_files={'meta.json': json.dumps(scripted_meta)})
+    os.replace(tmp_path, out_path)
+
+
+def export_cpu_artifact(model_path, model_type, sample_paths):
+    """
+    將訓練完成的模型匯出為 CPU 推論用 TorchScript 並檢查與原始模型的 Top-1 一致性。
+
+    Args:
+        model_path (str): weights/best.pt
+        model_type (str): 'yolo' 或 torchvision 架構名稱
+        sample_paths (list[str]): 一致性檢查用的驗證影像 (最多使用 PARITY_SAMPLES 張)
+
+    Returns:
+        dict: {'path', 'exported', 'parity_top1', 'samples', 'seconds'} (寫入訓練指標)；匯出失敗時含 'error'
+    """
+    import torch
+    from PIL import Image
+    from .batch_inference import forward_top1
+
+    out_path = artifact_path(model_path)
+    info = {'path': os.path.basename(out_path), 'exported': False}
+    start = time.perf_counter()
+    try:
+        module, transform, image_shape, scripted_meta = _load_eager(model_path, model_type)
+        scripted_meta['channels_last'] = True
+
+        with torch.no_grad():
+            eager = _top1_wrapper(module).to(memory_format=torch.channels_last)
+            example = torch.zeros(1, *image_shape).contiguous(memory_format=torch.channels_last)
+            traced = torch.jit.trace(eager, example)
+            scripted = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+            # 一致性檢查：匯出模型與原始模型對驗證影像的 Top-1 預測
+            images = []
+            for path in sample_paths[:PARITY_SAMPLES]:
+                try:
+                    with Image.open(path) as image:
+                        images.append(transform(image.convert('RGB')))
+                except Exception as e:
+                    print(f"[模型匯出] 略過無法讀取的影像 {path}: {e}")
+            if not images:
+                # 無驗證影像時以隨機輸入比對 (仍可檢查凍結與最佳化後的數值一致性)
+                images = [torch.rand(image_shape) for _ in range(8)]
+                info['synthetic'] = True
+            agree = 0
+            for i in range(0, len(images), 32):
+                batch = torch.stack(images[i:i + 32])
+                expected = forward_top1(module, batch)
+                actual = forward_top1(scripted, batch, channels_last=True)
+                agree += int((expected == actual).sum())
+
+        info['samples'] = len(images)
+        info['parity_top1'] = round(agree / len(images), 4)
+        if agree / len(images) < EXPORT_PARITY_THRESHOLD:
+            print(f"[模型匯出] Top-1 一致率 {info['parity_top1']} 未達門檻 {EXPORT_PARITY_THRESHOLD}，不保留匯出檔")
+        else:
+            _save_scripted(scripted, out_path, scripted_meta)
+            info['exported'] = True
+            print(f"[模型匯出] 已輸出 {out_path} (Top-1 一致率 {info['parity_top1']}，{len(images)} 張)")
+    except Exception as e:
+        print(f"[模型匯出] 匯出失敗: {e}")
+        info['error'] = str(e)
+    info['seconds'] = round(time.perf_counter() - start, 2)
+    return info
+
+
+def _quantized_engine():
+    """選擇此 CPU 可用的量化後端 (x86 為新版 PyTorch 的預設，舊版為 fbgemm；ARM 為 qnnpack)"""
+    import torch
+
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"此 PyTorch 不支援 INT8 量化運算 (可用後端: {engines})")
+
+
+def _labelled_batches(samples, transform, batch_size=32):
+    """逐批讀取 (路徑, 類別索引)，產生 (影像 tensor, 類別索引 list)；無法讀取的影像略過"""
+    import torch
+    from PIL import Image
+
+    for start in range(0, len(samples), batch_size):
+        images, labels = [], []
+        for path, label in samples[start:start + batch_size]:
+            try:
+                with Image.open(path) as image:
+                    images.append(transform(image.convert('RGB')))
+                labels.append(label)
+            except Exception as e:
+                print(f"[INT8 量化] 略過無法讀取的影像 {path}: {e}")
+        if images:
+            yield torch.stack(images), labels
+
+
+def export_int8_artifact(model_path, model_type, val_samples):
+    """
+    以驗證集影像校正的靜態 INT8 量化，匯出 CPU 推論用 TorchScript 並比較量化前後的準確率。
+
+    卷積層在動態量化 (quantize_dynamic) 中不會被量化，故使用 FX graph mode 的靜態量化：
+    prepare_fx 插入觀察器 → 以驗證影像校正 activation 範圍 → convert_fx 轉為 INT8 運算子。
+
+    Args:
+        model_path (str): weights/best.pt
+        model_type (str): 'yolo' 或 torchvision 架構名稱
+        val_samples (list[tuple]): 驗證集 (影像路徑, 類別索引)，校正與準確率比較皆使用
+
+    Returns:
+        dict: {'path', 'exported', 'engine', 'calibration_samples', 'samples', 'accuracy_fp32',
+               'accuracy_int8', 'accuracy_delta', 'agreement', 'size_mb', 'seconds'} (寫入訓練指標)；
+              失敗時含 'error'
+    """
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    from .batch_inference import forward_top1
+
+    out_path = int8_artifact_path(model_path)
+    info = {'path': os.path.basename(out_path), 'exported': False}
+    start = time.perf_counter()
+    try:
+        if not val_samples:
+            raise RuntimeError("驗證集沒有影像，無法校正量化參數")
+        module, transform, image_shape, scripted_meta = _load_eager(model_path, model_type)
+        engine = _quantized_engine()
+        torch.backends.quantized.engine = engine
+
+        step = max(1, len(val_samples) // CALIBRATION_SAMPLES)
+        calibration = val_samples[::step][:CALIBRATION_SAMPLES]
+        example = torch.zeros(1, *image_shape)
+
+        with torch.no_grad():
+            # prepare_fx 會改寫模組，使用副本；原始模組保留作為 float32 準確率基準
+            prepared = prepare_fx(_top1_wrapper(copy.deepcopy(module)).eval(),
+                                  get_default_qconfig_mapping(engine), (example,))
+            calibrated = 0
+            for images, _ in _labelled_batches(calibration, transform):
+                prepared(images)
+                calibrated += len(images)
+            if not calibrated:
+                raise RuntimeError("驗證集影像皆無法讀取，無法校正量化參數")
+            scripted = torch.jit.freeze(torch.jit.trace(convert_fx(prepared), example).eval())
+
+            total = correct_fp32 = correct_int8 = agree = 0
+            for images, labels in _labelled_batches(val_samples, transform):
+                expected = forward_top1(module, images)
+                actual = forward_top1(scripted, images)
+                labels = torch.tensor(labels)
+                correct_fp32 += int((expected == labels).sum())
+                correct_int8 += int((actual == labels).sum())
+                agree += int((expected == actual).sum())
+                total += len(labels)
+
+        accuracy_fp32 = correct_fp32 / total
+        accuracy_int8 = correct_int8 / total
+        info.update({
+            'engine': engine,
+            'calibration_samples': calibrated,
+            'samples': total,
+            'accuracy_fp32': round(accuracy_fp32, 4),
+            'accuracy_int8': round(accuracy_int8, 4),
+            'accuracy_delta': round(accuracy_int8 - accuracy_fp32, 4),
+            'agreement': round(agree / total, 4),
+        })
+
+        scripted_meta.update({'quantized': True, 'quantized_engine': engine})
+        _save_scripted(scripted, out_path, scripted_meta)
+        info['exported'] = True
+        info['size_mb'] = round(os.path.getsize(out_path) / (1024 * 1024), 2)
+        print(f"[INT8 量化] 已輸出 {out_path} (準確率 {info['accuracy_fp32']} → {info['accuracy_int8']}，"
+              f"{total} 張，後端 {engine})")
+    except Exception as e:
+        print(f"[INT8 量化] 量化失敗: {e}")
+        info['error'] = str(e)
+    info['seconds'] = round(time.perf_counter() - start, 2)
+    return info
@@ -201,7 +201,7 @@ class YoloTrainer:
                             if os.path.exists(class_dir):
                                 for img_file in os.listdir(class_dir):
                                     img_path = os.path.join(class_dir, img_file)
-                                    if img_file.lower().endswith(('.jpg', '.png', '.jpeg')):
+                                    if img_file.lower().endswith(('.jpg', '.png', '.jpeg', '.webp')):
                                         try:
                                             # 進行預測
                                             result = val_model.predict(img_path, verbose=False)
@@ -285,12 +285,31 @@ class YoloTrainer:
                 print("[YOLO 訓練] 使用備案：僅提供類別名稱")
                 per_class_list = [{'name': name, 'precision': 0, 'recall': 0, 'f1-score': 0} for name in class_names]
 
+            # 4. 匯出 CPU 推論用 TorchScript (以驗證集檢查與原始模型的 Top-1 一致性，見 model_export)
+            cpu_artifact = None
+            int8_artifact = None
+            if os.path.exists(best_model_path):
+                from .model_export import export_cpu_artifact, export_int8_artifact
+                # (影像路徑, 類別索引)：類別索引與 ultralytics 相同，依類別資料夾名稱排序
+                val_samples = []
+                for class_idx, class_name in enumerate(class_names):
+                    class_dir = os.path.join(val_dir, class_name)
+                    if os.path.isdir(class_dir):
+                        val_samples.extend((os.path.join(class_dir, f), class_idx) for f in sorted(os.listdir(class_dir))
+                                           if f.lower().endswith(('.jpg', '.png', '.jpeg', '.webp')))
+                cpu_artifact = export_cpu_artifact(best_model_path, 'yolo', [path for path, _ in val_samples])
+                # (選用) 以驗證集校正的 INT8 量化模型
+                if train_params.get('quantize_int8'):
+                    int8_artifact = export_int8_artifact(best_model_path, 'yolo', val_samples)
+
             # 5. 儲存
             now = datetime.now()
             duration_sec = (now - training_run.timestamp.replace(tzinfo=None)).total_seconds() if training_run.timestamp else 0
             metrics_dict = {
                 'accuracy_top1': round(float(accuracy_top1), 4),
                 'per_class_list': per_class_list,
+                'cpu_artifact': cpu_artifact,
+                'int8_artifact': int8_artifact,
                 'end_time': now.strftime('%Y-%m-%d %H:%M:%S'),
                 'duration_seconds': round(duration_sec, 1)
             }
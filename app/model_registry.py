@@ -0,0 +1,258 @@
+"""
+模型快取模組。
+
+此模組負責：
+1. 以 (路徑, 修改時間/大小, 裝置, 模型類型, 載入參數) 為 key 快取已載入的模型，重複的推論任務不需重新讀取權重
+2. 同一個模型只載入一次：多個執行緒同時要求時，後到者等待先到者載入完成
+3. 保留最近使用的 N 個模型 (LRU 淘汰)
+4. Celery worker 行程啟動時預先載入設定的模型 (見 tasks.preload_models)
+
+設計模式：
+- 行程內全域單例 (與 dsp_cache 相同)，所有任務執行緒共用
+- 模型檔被覆寫 (重新訓練) 時修改時間改變，自然成為新的 key；舊模型由 LRU 淘汰
+- 回傳 LoadedModel：YOLO predictor 保存批次狀態、非執行緒安全，呼叫端以 entry.lock 序列化推論；
+  eval 模式的 torchvision 模型可同時推論，不需取得鎖
+- 載入器回傳 (模型, metadata)，metadata 記錄 checkpoint 內的類別名稱等資訊
+
+環境變數：
+- MODEL_REGISTRY_SIZE: 同時保留的模型數量上限 (預設 3)
+- PRELOAD_MODELS: worker 啟動時預先載入的模型，以逗號分隔，格式為 路徑 或 模型類型=路徑
+  (例如 app/models/best.pt,resnet18=/data/runs/3/weights/best.pt)；未設定時載入 ai_model.MODEL_PATH
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class LoadedModel:
+    """
+    已載入的模型。
+
+    Attributes:
+        model: YOLO 或 torch.nn.Module (eval 模式)
+        meta (dict): 載入器回傳的資訊 (如 'classes'、'num_classes')
+        path (str | None): 載入的模型檔路徑 (推論快取以其內容雜湊區分模型)
+        lock (threading.Lock): 非執行緒安全的模型 (YOLO) 推論時使用
+    """
+
+    def __init__(self, model, meta=None, path=None):
+        self.model = model
+        self.meta = meta or {}
+        self.path = path
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    執行緒安全的模型 LRU。
+
+    Attributes:
+        maxsize (int): 同時保留的模型數
+        hits (int): 命中次數
+        misses (int): 載入次數
+
+    Example:
+        >>> entry = model_registry.get('/runs/3/weights/best.pt', 'cuda', 'yolo')
+        >>> with entry.lock:
+        ...     preds = entry.model(image_path, verbose=False)
+    """
+
+    def __init__(self, maxsize=3):
+        self.maxsize = max(1, maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, device='cpu', model_type='yolo', **loader_kwargs):
+        """
+        取得已載入的模型，不在快取中時載入。
+
+        Args:
+            path (str): 權重檔路徑
+            device (str | torch.device): 運算裝置
+            model_type (str): 'yolo' (含 yolov8*)、torchvision 架構名稱 ('resnet18', 'efficientnet_b0') 或 'torchscript'
+            **loader_kwargs: 傳給載入器的其他參數 (如權重無法判斷類別數時的 num_classes)；
+                參數不同視為不同的模型 (需可雜湊)
+
+        Raises:
+            FileNotFoundError: 權重檔不存在
+            Exception: 載入失敗時由載入器拋出 (不會寫入快取)
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, str(device), model_type, tuple(sorted(loader_kwargs.items())))
+
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # 只鎖定同一個 key：不同模型可同時載入，同一模型只載入一次
+        with key_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry
+            try:
+                start = time.perf_counter()
+                model, meta = _get_loader(model_type)(path, device, model_type, **loader_kwargs)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            entry = LoadedModel(model, meta, path)
+            print(f"[model_registry] 已載入模型 {path} ({model_type}, {device})，耗時 {time.perf_counter() - start:.2f}s")
+
+            # 寫入快取與移除載入鎖在同一次持鎖內完成：之後到達的執行緒必定找得到已載入的模型
+            with self._lock:
+                self.misses += 1
+                self._items[key] = entry
+                self._loading.pop(key, None)
+                while len(self._items) > self.maxsize:
+                    evicted_key, _ = self._items.popitem(last=False)
+                    print(f"[model_registry] 已釋放模型 {evicted_key[0]} ({evicted_key[4]})")
+        return entry
+
+    def _lookup(self, key):
+        entry = self._items.get(key)
+        if entry is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def preload(self, specs=None, device=None):
+        """
+        預先載入模型 (worker 行程啟動時呼叫)。
+
+        Args:
+            specs (str): 格式同環境變數 PRELOAD_MODELS；None 時讀取環境變數
+            device: 運算裝置，None 時自動偵測
+        """
+        if specs is None:
+            specs = os.environ.get('PRELOAD_MODELS')
+        if specs is None:
+            from .ai_model import MODEL_PATH
+            specs = MODEL_PATH
+        if device is None:
+            device = default_device()
+
+        for item in filter(None, (s.strip() for s in specs.split(','))):
+            model_type, _, path = item.rpartition('=')
+            if not os.path.exists(path):
+                continue
+            try:
+                self.get(path, device, model_type or 'yolo')
+            except Exception as e:
+                print(f"[model_registry] 預先載入模型失敗 ({path}): {e}")
+
+    def stats(self):
+        """回傳快取統計 (已載入模型、命中、載入次數)"""
+        with self._lock:
+            return {
+                'models': [(key[0], key[4], key[3]) for key in self._items],
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def default_device():
+    """GPU 優先，否則使用 CPU"""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def is_yolo_type(model_type):
+    return model_type == 'yolo' or model_type.startswith('yolov8')
+
+
+def _get_loader(model_type):
+    if model_type == 'torchscript':
+        return load_torchscript
+    return load_yolo if is_yolo_type(model_type) else load_torchvision_classifier
+
+
+def load_yolo(path, device, model_type='yolo'):
+    """載入 YOLOv8 分類模型"""
+    from ultralytics import YOLO
+
+    model = YOLO(path)
+    model.to(device)
+    return model, {'classes': model.names}
+
+
+def load_torchvision_classifier(path, device, model_type='resnet18', num_classes=None):
+    """
+    載入 CnnTrainer 輸出的 ResNet18 / EfficientNet-B0 權重。
+
+    類別數優先使用 checkpoint 的 'classes'，其次由分類層權重形狀判斷，
+    都無法判斷時才使用 num_classes (預設 2)。
+
+    Returns:
+        tuple: (eval 模式的模型, {'classes': checkpoint 內的類別名稱或 None,
+                'num_classes': 類別數, 'detected': 是否由 checkpoint 判斷出類別數})
+    """
+    import torch
+    import torch.nn as nn
+    from torchvision import models
+
+    checkpoint = torch.load(path, map_location=device)
+    state_dict = checkpoint
+    class_names = None
+    if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
+        state_dict = checkpoint['model_state_dict']
+        class_names = checkpoint.get('classes')
+
+    # 去除 DataParallel 的 module. 前綴
+    state_dict = {(k[7:] if k.startswith('module.') else k): v for k, v in state_dict.items()}
+
+    detected = 0
+    if class_names:
+        detected = len(class_names)
+    elif 'fc.weight' in state_dict:                 # ResNet
+        detected = state_dict['fc.weight'].shape[0]
+    elif 'classifier.1.weight' in state_dict:       # EfficientNet
+        detected = state_dict['classifier.1.weight'].shape[0]
+    n_classes = detected or num_classes or 2
+
+    if model_type == 'efficientnet_b0':
+        model = models.efficientnet_b0(weights=None)
+        model.classifier[1] = nn.Linear(model.classifier[1].in_features, n_classes)
+    else:
+        model = models.resnet18(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, n_classes)
+
+    model.load_state_dict(state_dict)
+    model.to(device)
+    model.eval()
+    return model, {'classes': class_names, 'num_classes': n_classes, 'detected': bool(detected)}
+
+
+def load_torchscript(path, device, model_type='torchscript'):
+    """載入 model_export 輸出的 TorchScript 模型，metadata 取自檔案內的 meta.json"""
+    import json
+    import torch
+
+    extra_files = {'meta.json': ''}
+    model = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    model.eval()
+    meta = json.loads(extra_files['meta.json'] or '{}')
+    meta['backend'] = 'torchscript'
+    # INT8 模型的權重以匯出時的量化後端封裝，推論時需使用相同後端
+    engine = meta.get('quantized_engine')
+    if engine and engine in torch.backends.quantized.supported_engines:
+        torch.backends.quantized.engine = engine
+    return model, meta
+
+
+# 全域模型快取實例
+model_registry = ModelRegistry(maxsize=int(os.environ.get('MODEL_REGISTRY_SIZE', 3)))
@@ -26,6 +26,7 @@
 字元集：utf8mb4（支援繁體中文與 Emoji）
 """
 
+import re
 from . import db
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -342,15 +343,16 @@ class Result(db.Model):
     Attributes:
         id (int): 主鍵
         upload_id (int): 所屬音檔 ID
-        audio_filename (str): 切割音檔檔名（可選）
+        audio_filename (str): 切割音檔檔名（可選；未輸出實體檔時為匯出用的檔名）
         spectrogram_filename (str): 顯示用頻譜圖檔名（帶座標軸）
         spectrogram_training_filename (str): 訓練用頻譜圖檔名（無座標軸）
         label_id (int): 關聯的標籤 ID
         bbox_annotations (list[BBoxAnnotation]): 此頻譜圖的框選標記
         
     Properties:
-        audio_url: 音檔完整 URL
-        spectrogram_url: 顯示用頻譜圖完整 URL
+        segment_index: 片段編號（由訓練用圖檔名解析）
+        audio_url: 片段音訊 URL（由原始上傳檔隨需讀取的端點）
+        spectrogram_url: 顯示用頻譜圖 URL（隨需繪製的顯示端點）
         spectrogram_training_url: 訓練用頻譜圖完整 URL
     """
     __tablename__ = 'results'
@@ -365,22 +367,36 @@ class Result(db.Model):
     # 關聯
     label = db.relationship('Label', backref='results')
 
+    @property
+    def segment_index(self):
+        """片段編號，由 *_spec_training_{i}.{ext} 檔名解析 (與 process_large_audio 的片段順序相同)"""
+        match = re.search(r'_(\d+)\.\w+$', self.spectrogram_training_filename or '')
+        return int(match.group(1)) if match else 0
+
     @property
     def audio_url(self):
         """
-        取得切割音檔的完整相對路徑。
+        取得片段音訊的 URL。
+        
+        片段音訊由端點自原始上傳檔讀取 (舊資料的切割音檔仍由端點直接回傳)。
         
         Returns:
             str: 音檔 URL，若無音檔返回 None
         """
         if self.audio_filename:
-            return f"{self.audio_info.result_path}/{self.audio_filename}"
+            from flask import url_for
+            return url_for('main.result_audio', result_id=self.id)
         return None
 
     @property
     def spectrogram_url(self):
-        """取得顯示用頻譜圖的完整相對路徑（帶座標軸）"""
-        return f"{self.audio_info.result_path}/{self.spectrogram_filename}"
+        """
+        取得顯示用頻譜圖的 URL（帶座標軸）。
+        
+        顯示用圖於首次瀏覽時由顯示端點繪製並快取，不再由 static 目錄提供。
+        """
+        from flask import url_for
+        return url_for('main.result_spectrogram', result_id=self.id)
 
     @property
     def spectrogram_training_url(self):
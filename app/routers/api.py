@@ -57,7 +57,14 @@ def api_upload_audio():
             'n_mels': int(request.form.get('n_mels', 128)),
             'f_min': float(request.form.get('f_min', 0.0)),
             'f_max': float(request.form.get('f_max', 0.0)),
-            'power': float(request.form.get('power', 2.0))
+            'stft_method': request.form.get('stft_method', 'fft'),
+            'power': float(request.form.get('power', 2.0)),
+            'image_format': request.form.get('image_format', ''),
+            'envelope_decimate': request.form.get('envelope_decimate') in ('on', 'true', '1'),
+            'shared_stft': request.form.get('shared_stft') in ('on', 'true', '1'),
+            'save_tensors': request.form.get('save_tensors') in ('on', 'true', '1'),
+            'tile_pyramid': request.form.get('tile_pyramid') in ('on', 'true', '1'),
+            'segment_audio': request.form.get('segment_audio') in ('on', 'true', '1')
         }
     except Exception as e:
         return jsonify({'error': f'參數格式錯誤: {str(e)}'}), 400
@@ -0,0 +1,75 @@
+import io
+import os
+from flask import render_template, send_file, current_app, jsonify, abort
+from ..main_router import main_bp
+
+from ..models import AudioInfo, CetaceanInfo, Label
+from ..tile_pyramid import load_pyramid_index, tile_color_table, render_tile
+from ..image_encoder import get_encoder
+
+# 圖磚內容建立後不會變動，瀏覽器可長時間快取
+TILE_MAX_AGE = 7 * 24 * 3600
+
+def _result_dir(upload):
+    return os.path.join(current_app.root_path, 'static', upload.result_path)
+
+@main_bp.route('/results/<int:upload_id>/browse')
+def browse_recording(upload_id):
+    """整檔頻譜瀏覽頁面 (需於上傳時勾選建立圖磚)"""
+    upload = AudioInfo.query.get_or_404(upload_id)
+    pyramid = load_pyramid_index(_result_dir(upload))
+    if pyramid is None:
+        return "此音檔未建立整檔頻譜圖磚，請於上傳時勾選「整檔頻譜瀏覽」後重新分析。", 404
+    params = upload.get_params()
+    try:
+        segment_duration = float(params.get('segment_duration', 2.0))
+        hop_length_seconds = segment_duration * (1 - float(params.get('overlap', 50)) / 100.0)
+    except (ValueError, TypeError):
+        hop_length_seconds = 1.0
+    return render_template('browse.html', upload=upload, pyramid=pyramid, hop_length_seconds=hop_length_seconds)
+
+@main_bp.route('/results/<int:upload_id>/tiles/<int:depth>/<int:tile_index>')
+def recording_tile(upload_id, depth, tile_index):
+    """套用色彩對照表後的單張圖磚 (depth 0 為原始解析度)"""
+    upload = AudioInfo.query.get_or_404(upload_id)
+    result_dir = _result_dir(upload)
+    pyramid = load_pyramid_index(result_dir)
+    if pyramid is None or depth >= pyramid['levels']:
+        abort(404)
+    image = render_tile(result_dir, depth, tile_index, tile_color_table(pyramid))
+    if image is None:
+        abort(404)
+    encoder = get_encoder(kind='display')
+    buffer = io.BytesIO()
+    encoder.save_array(image, buffer, 'tile')
+    buffer.seek(0)
+    return send_file(buffer, mimetype=encoder.mimetype, max_age=TILE_MAX_AGE)
+
+@main_bp.route('/results/<int:upload_id>/detections')
+def recording_detections(upload_id):
+    """已分類 (event_type != 0) 的片段，供整檔瀏覽頁面疊加顯示"""
+    upload = AudioInfo.query.get_or_404(upload_id)
+    params = upload.get_params()
+    # 與 AudioService 寫入 CetaceanInfo 時的取樣率相同
+    try:
+        sample_rate = int(params.get('sample_rate'))
+    except (ValueError, TypeError):
+        sample_rate = upload.fs if upload.fs else 44100
+
+    label_map = {l.id: l.name for l in Label.query.all()}
+    rows = CetaceanInfo.query.filter_by(audio_id=upload_id).order_by(CetaceanInfo.id.asc()).with_entities(
+        CetaceanInfo.start_sample, CetaceanInfo.end_sample, CetaceanInfo.event_type, CetaceanInfo.detect_type
+    ).all()
+    detections = []
+    for index, (start_sample, end_sample, event_type, detect_type) in enumerate(rows):
+        if not event_type:
+            continue
+        detections.append({
+            'segment': index,
+            'start': (start_sample or 0) / sample_rate,
+            'end': (end_sample or 0) / sample_rate,
+            'event_type': event_type,
+            'label': label_map.get(event_type, str(event_type)),
+            'detect_type': detect_type
+        })
+    return jsonify({'success': True, 'detections': detections})
@@ -0,0 +1,84 @@
+import os
+import soundfile as sf
+from flask import send_file, current_app, abort
+from ..main_router import main_bp
+
+from ..models import Result
+from ..display_cache import get_display_cache
+from ..image_encoder import get_encoder
+from ..spectrogram_store import SpectrogramStore
+
+# 顯示用頻譜圖的瀏覽器快取時間 (秒)；內容由片段與處理參數決定，不會變動
+DISPLAY_MAX_AGE = 7 * 24 * 3600
+
+def _send_image(path, mimetype=None):
+    """回傳圖檔並附上 Cache-Control / ETag / Last-Modified (mimetype 未指定時依副檔名判斷)"""
+    return send_file(path, mimetype=mimetype, max_age=DISPLAY_MAX_AGE, conditional=True)
+
+def _render_from_store(cache, audio_id, cache_name, result_dir, index, spec_type, spec_params):
+    """由 spectrogram_store 的矩陣繪製並寫入快取；沒有存檔、片段未寫入或類型不支援時回傳 None"""
+    from ..audio_utils import render_display_from_store, STORE_DISPLAY_TYPES
+
+    if spec_type not in STORE_DISPLAY_TYPES:
+        return None
+    store = SpectrogramStore.open(result_dir)
+    if store is None or index not in store:
+        return None
+    sr = store.index['sr']
+    n_samples = int(round(store.index['segment_duration'] * sr))
+    time_start = index * store.index['step_duration']
+    matrix = store.get(index)
+    return cache.put(audio_id, cache_name, lambda out: render_display_from_store(
+        matrix, sr, n_samples, out, spec_type, spec_params, time_start
+    ))
+
+@main_bp.route('/results/<int:result_id>/spectrogram')
+def result_spectrogram(result_id):
+    """顯示用頻譜圖：首次請求時由頻譜矩陣存檔 (若有) 或片段音訊繪製，之後由磁碟快取提供"""
+    result = Result.query.get_or_404(result_id)
+    audio = result.audio_info
+    result_dir = os.path.join(current_app.root_path, 'static', audio.result_path)
+
+    # 舊資料 (或 render_display=True) 於處理時已輸出顯示用圖，直接回傳
+    legacy_path = os.path.join(result_dir, result.spectrogram_filename)
+    if os.path.exists(legacy_path):
+        return _send_image(legacy_path)
+
+    # 快取檔名的副檔名依目前的顯示用圖格式 (DISPLAY_IMAGE_FORMAT) 決定
+    encoder = get_encoder(kind='display')
+    cache_name = os.path.splitext(result.spectrogram_filename)[0] + encoder.extension
+
+    cache = get_display_cache()
+    path = cache.get(audio.id, cache_name)
+    if path is None:
+        from ..audio_utils import render_display_spectrogram
+        from ..services.audio_service import build_spec_params
+        from ..segment_audio import read_upload_segment, segment_window
+
+        params = audio.get_params()
+        spec_params = build_spec_params(params)
+        spec_type = params.get('spec_type', 'mel')
+        index = result.segment_index
+
+        # 上傳時勾選「儲存頻譜矩陣」：直接以存檔的矩陣繪製，不需解碼音訊與重新計算頻譜
+        path = _render_from_store(cache, audio.id, cache_name, result_dir, index, spec_type, spec_params)
+        if path is not None:
+            return _send_image(path, encoder.mimetype)
+
+        audio_path = os.path.join(result_dir, result.audio_filename) if result.audio_filename else None
+        if audio_path and os.path.exists(audio_path):
+            # 舊資料 (或上傳時勾選輸出片段音檔) 由切割音檔繪製
+            y, sr = sf.read(audio_path, dtype='float32', always_2d=False)
+            time_start, _ = segment_window(params, index, sr)
+        elif audio.file_path and os.path.exists(audio.file_path):
+            # 由原始上傳檔讀取片段，重取樣至處理時的取樣率 (與訓練用圖相同的頻率範圍)
+            y, sr, time_start = read_upload_segment(audio.file_path, params, index, resample=True)
+        else:
+            abort(404)
+
+        path = cache.put(audio.id, cache_name, lambda out: render_display_spectrogram(
+            y, sr, out, spec_type, spec_params, time_start
+        ))
+        if path is None:
+            abort(500)
+    return _send_image(path, encoder.mimetype)
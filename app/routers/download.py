@@ -8,6 +8,8 @@ from werkzeug.utils import secure_filename
 from ..main_router import main_bp
 
 from ..models import AudioInfo, Result, CetaceanInfo, Label, BBoxAnnotation
+from ..spectrogram_store import STORE_FILENAME, INDEX_FILENAME
+from ..segment_audio import iter_virtual_segment_wavs
 
 @main_bp.route('/download_dataset_zip/<int:upload_id>')
 def download_dataset_zip(upload_id):
@@ -50,12 +52,20 @@ def download_dataset_zip(upload_id):
                     if filename_lower.endswith(('.wav', '.mp3')):
                         arcname = f"audio/{file}"
                         should_include = True
-                    elif filename_lower.endswith(('.png', '.jpg')) and '_spec_training_' in filename_lower:
+                    elif filename_lower.endswith(('.png', '.jpg', '.webp')) and '_spec_training_' in filename_lower:
                         arcname = f"images/{file}"
                         should_include = True
+                    elif file in (STORE_FILENAME, INDEX_FILENAME):
+                        # 頻譜矩陣 (float16，第 i 列對應 _spec_training_{i}.png)
+                        arcname = f"tensors/{file}"
+                        should_include = True
                     
                     if should_include:
                         zf.write(file_path, arcname)
+
+            # 未輸出實體檔的片段音訊，由原始上傳檔讀取後加入
+            for audio_filename, data in iter_virtual_segment_wavs(upload, results_all, folder_path):
+                zf.writestr(f"audio/{audio_filename}", data)
             
             # B. 生成 labels.csv 
             csv_buffer = io.StringIO()
@@ -102,7 +112,8 @@ def download_dataset_zip(upload_id):
                             info = sf.info(first_audio_path)
                             sample_rate = info.samplerate
                         else:
-                            sample_rate = 44100  # 預設值
+                            # 未輸出切割音檔時，處理取樣率即原始檔取樣率
+                            sample_rate = upload.fs or 44100
                     else:
                         sample_rate = 44100
                 else:
@@ -181,6 +192,7 @@ def download_multiple_datasets_zip():
     export_audio = 'audio' in export_options
     export_csv = 'csv' in export_options
     export_bbox = 'bbox' in export_options
+    export_tensors = 'tensors' in export_options
         
     memory_file = io.BytesIO()
     
@@ -275,12 +287,20 @@ def download_multiple_datasets_zip():
                         if export_audio and filename_lower.endswith(('.wav', '.mp3')):
                             arcname = f"audio/{file}"
                             should_include = True
-                        elif export_images and filename_lower.endswith(('.png', '.jpg')) and '_spec_training_' in filename_lower:
+                        elif export_images and filename_lower.endswith(('.png', '.jpg', '.webp')) and '_spec_training_' in filename_lower:
                             arcname = f"images/{file}"
                             should_include = True
+                        elif export_tensors and file in (STORE_FILENAME, INDEX_FILENAME):
+                            # 各音檔的矩陣檔名相同，以 upload_id 分資料夾
+                            arcname = f"tensors/{upload.id}/{file}"
+                            should_include = True
                         
                         if should_include:
                             zf.write(file_path, arcname)
+
+                if export_audio:
+                    for audio_filename, data in iter_virtual_segment_wavs(upload, results_all, folder_path):
+                        zf.writestr(f"audio/{audio_filename}", data)
                             
                 # B. 生成該檔案的 labels.csv 內容
                 if export_csv:
@@ -311,7 +331,7 @@ def download_multiple_datasets_zip():
                                     info = sf.info(first_audio_path)
                                     sample_rate = info.samplerate
                                 else:
-                                    sample_rate = 44100
+                                    sample_rate = upload.fs or 44100
                             else:
                                 sample_rate = 44100
                         else:
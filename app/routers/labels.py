@@ -43,6 +43,14 @@ def auto_label():
     if not os.path.exists(model_path):
         return f"模型檔案不存在: {model_path}", 404
     
+    # 選用訓練時產生的 INT8 量化模型 (CPU 推論，見 model_export.export_int8_artifact)
+    if request.form.get('model_variant') == 'int8':
+        from ..ml.model_export import int8_artifact_path
+        int8_path = int8_artifact_path(model_path)
+        if not os.path.exists(int8_path):
+            return f"此訓練紀錄沒有 INT8 量化模型: {int8_path}", 404
+        model_path = int8_path
+    
     # 從訓練參數取得模型類型
     params = training_run.get_params() if hasattr(training_run, 'get_params') else {}
     if isinstance(params, str):
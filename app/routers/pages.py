@@ -5,6 +5,7 @@ from ..main_router import main_bp
 
 # 引入相關模型
 from ..models import AudioInfo, Result, Label, TrainingRun, CetaceanInfo
+from ..tile_pyramid import load_pyramid_index
 
 @main_bp.route('/')
 def index():
@@ -100,12 +101,17 @@ def results(upload_id):
         label_obj = Label.query.get(cetacean.event_type) if cetacean.event_type else None
         setattr(cetacean, 'label_name', label_obj.name if label_obj else 'Unknown')
 
+    # 上傳時勾選整檔頻譜瀏覽者才有圖磚
+    result_dir = os.path.join(current_app.root_path, 'static', upload_record.result_path)
+    has_pyramid = load_pyramid_index(result_dir) is not None
+
     return render_template(
         'result.html',
         upload=upload_record,
         pagination=pagination,
         hop_length_seconds=hop_length_seconds,
-        params=params
+        params=params,
+        has_pyramid=has_pyramid
     )
 
 @main_bp.route('/labeling/<int:upload_id>')
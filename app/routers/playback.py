@@ -0,0 +1,35 @@
+import io
+import os
+from flask import send_file, current_app, abort
+from ..main_router import main_bp
+
+from ..models import Result
+from ..segment_audio import read_upload_segment, encode_wav
+
+# 片段音訊由原始上傳檔與處理參數決定，內容不會變動
+AUDIO_MAX_AGE = 7 * 24 * 3600
+
+@main_bp.route('/results/<int:result_id>/audio')
+def result_audio(result_id):
+    """
+    片段音訊 (WAV，支援 HTTP Range 以便播放器拖曳)。
+    舊資料 (或上傳時勾選輸出片段音檔) 直接回傳切割音檔，否則由原始上傳檔讀取片段範圍。
+    """
+    result = Result.query.get_or_404(result_id)
+    audio = result.audio_info
+    result_dir = os.path.join(current_app.root_path, 'static', audio.result_path)
+
+    legacy_path = os.path.join(result_dir, result.audio_filename) if result.audio_filename else None
+    if legacy_path and os.path.exists(legacy_path):
+        return send_file(legacy_path, mimetype='audio/wav', max_age=AUDIO_MAX_AGE, conditional=True)
+
+    if not audio.file_path or not os.path.exists(audio.file_path):
+        abort(404)
+    y, sr, _ = read_upload_segment(audio.file_path, audio.get_params(), result.segment_index)
+    modified = os.path.getmtime(audio.file_path)
+    # BytesIO 的長度已知，conditional=True 時 werkzeug 依 Range 標頭回傳 206 部分內容
+    return send_file(
+        io.BytesIO(encode_wav(y, sr)), mimetype='audio/wav', max_age=AUDIO_MAX_AGE, conditional=True,
+        etag=f"{result.id}-{int(modified)}", last_modified=modified,
+        download_name=result.audio_filename or f"segment_{result.id}.wav"
+    )
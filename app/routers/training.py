@@ -19,7 +19,8 @@ def start_training():
         'batch_size': int(request.form.get('batch_size', 16)),
         'learning_rate': float(request.form.get('learning_rate', 0.001)),
         'image_size': int(request.form.get('image_size', 224)),
-        'loss_function': request.form.get('loss_function', 'cross_entropy')
+        'loss_function': request.form.get('loss_function', 'cross_entropy'),
+        'quantize_int8': request.form.get('quantize_int8') == '1'
     }
     
     # 進階設定：收集訓練標籤與限制筆數
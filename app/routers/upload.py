@@ -10,6 +10,7 @@ from ..main_router import main_bp
 # 引入相關模型和實例
 from ..models import AudioInfo, PointInfo, BBoxAnnotation, Result, CetaceanInfo
 from .. import db, celery
+from ..display_cache import get_display_cache
 
 @main_bp.route('/upload', methods=['POST'])
 def upload():
@@ -32,7 +33,20 @@ def upload():
             'n_mels': int(request.form.get('n_mels', 128)),
             'f_min': float(request.form.get('f_min', 0)),
             'f_max': float(request.form.get('f_max', 0)),  # 0 表示使用 Nyquist 頻率
-            'power': float(request.form.get('power', 2.0))
+            'stft_method': request.form.get('stft_method', 'fft'),
+            'power': float(request.form.get('power', 2.0)),
+            # 訓練用圖格式 (空字串表示使用 TRAINING_IMAGE_FORMAT 設定)
+            'image_format': request.form.get('image_format', ''),
+            # 包絡線頻譜先降取樣再 FFT (較快，但訓練用圖與預設模式不同，需重新訓練模型)
+            'envelope_decimate': request.form.get('envelope_decimate') == 'on',
+            # STFT / Mel / YAMNet 整個區塊共用一次 STFT (較快，但片段邊緣與逐片段計算不同，需重新訓練模型)
+            'shared_stft': request.form.get('shared_stft') == 'on',
+            # 另存各片段的 float16 頻譜矩陣 (spectrograms.npy，佔用較多磁碟空間)
+            'save_tensors': request.form.get('save_tensors') == 'on',
+            # 整檔頻譜瀏覽 (多解析度圖磚)
+            'tile_pyramid': request.form.get('tile_pyramid') == 'on',
+            # 舊模式：輸出每個片段的切割音檔 (預設由原始檔隨需讀取)
+            'segment_audio': request.form.get('segment_audio') == 'on'
         }
     except Exception as e:
         print(f"上傳參數解析錯誤: {e}")
@@ -88,6 +102,7 @@ def delete_selected_uploads():
     for u in uploads:
         path = os.path.join(current_app.root_path, 'static', u.result_path)
         if os.path.exists(path): shutil.rmtree(path, ignore_errors=True)
+        get_display_cache().remove_upload(u.id)
         if u.file_path and os.path.exists(u.file_path): os.remove(u.file_path)
         db.session.delete(u)
     db.session.commit()
@@ -0,0 +1,203 @@
+"""
+片段音訊隨需讀取模組。
+
+此模組負責：
+1. 依片段編號與處理參數換算片段在原始上傳檔中的時間範圍
+2. 由原始上傳檔讀取該範圍：WAV/FLAC 直接 seek；MP3 保留已開啟的解碼器，重用其 frame 索引
+3. 編碼為 16-bit PCM WAV，供 /results/<id>/audio 端點 (支援 HTTP Range) 與資料集匯出使用
+
+設計模式：
+- 處理音檔時預設不輸出 *_partN.wav；Result.audio_filename 仍記錄片段檔名 (匯出時的檔名)，
+  上傳時勾選「輸出片段音檔」則沿用舊行為輸出實體檔，端點與匯出優先使用實體檔
+- 片段與舊版切割音檔相同混為單聲道；播放時維持原始檔的取樣率 (不重取樣)，
+  匯出時重取樣至處理時的取樣率，與舊版切割音檔格式一致
+- MP3 每次開檔後 seek 都需從頭掃描 frame 標頭 (長錄音可達數百 ms)，
+  因此以 LRU 保留最近使用的解碼器 (每個解碼器一把鎖)；WAV/FLAC 的 seek 為常數時間，每次重新開檔
+
+環境變數：
+- SEGMENT_AUDIO_DECODERS: 保留的 MP3 解碼器數量上限 (預設 8)
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+# 需保留解碼器才能快速 seek 的副檔名
+INDEXED_EXTENSIONS = ('.mp3',)
+
+# 重取樣時片段前後多讀的秒數，避免濾波器在片段邊緣產生暫態 (處理時為整段串流重取樣)
+RESAMPLE_PAD_SECONDS = 0.05
+
+
+class DecoderCache:
+    """
+    執行緒安全的已開啟解碼器 LRU。
+
+    以 (路徑, 修改時間) 為 key，原始檔被覆寫時不會沿用舊的解碼器。
+
+    Example:
+        >>> data, sr, time_start = decoder_cache.read('/uploads/a.mp3', lambda sr: (120.0, 2.0))
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path, window):
+        """讀取 window(取樣率) 回傳的 (起始秒數, 長度秒數) 範圍，回傳 ([frames, channels], sr, 起始秒數)"""
+        key = (path, os.path.getmtime(path))
+        evicted = []
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                entry = (sf.SoundFile(path), threading.Lock())
+                self._items[key] = entry
+                while len(self._items) > self.maxsize:
+                    evicted.append(self._items.popitem(last=False)[1])
+            else:
+                self._items.move_to_end(key)
+        for handle, lock in evicted:
+            with lock:
+                handle.close()
+
+        handle, lock = entry
+        with lock:
+            if not handle.closed:
+                return _read_range(handle, window)
+        # 取得後隨即被淘汰 (極少見)，改為重新開檔
+        with sf.SoundFile(path) as f:
+            return _read_range(f, window)
+
+
+decoder_cache = DecoderCache(maxsize=int(os.environ.get('SEGMENT_AUDIO_DECODERS', 8)))
+
+
+def _read_range(handle, window):
+    """由已開啟的 SoundFile 讀取 window(取樣率) 指定的範圍，不足的尾端補零"""
+    sr = handle.samplerate
+    time_start, duration = window(sr)
+    start = int(round(time_start * sr))
+    frames = int(round(duration * sr))
+    handle.seek(min(start, handle.frames))
+    data = handle.read(frames, dtype='float32', always_2d=True)
+    if len(data) < frames:
+        # 片段超出錄音結尾時補零 (與處理時短音訊補零一致)
+        data = np.pad(data, ((0, frames - len(data)), (0, 0)))
+    return data, sr, time_start
+
+
+def processing_sr(params, file_sr):
+    """處理時使用的取樣率 (與 process_large_audio 相同：YAMNet 固定 16000 Hz，未指定 sample_rate 時為原始取樣率)"""
+    if params.get('spec_type', 'mel') == 'yamnet_log_mel':
+        return 16000
+    if str(params.get('sample_rate', 'None')).isdigit():
+        return int(params['sample_rate'])
+    return file_sr
+
+
+def segment_window(params, index, file_sr):
+    """
+    片段 index 在錄音中的 (起始秒數, 長度秒數)，與 process_large_audio 切割片段的方式相同。
+
+    Args:
+        params (dict): AudioInfo.get_params()
+        index (int): 片段編號
+        file_sr (int): 原始檔取樣率
+    """
+    sr = processing_sr(params, file_sr)
+    segment_duration = float(params.get('segment_duration', 2.0))
+    overlap_ratio = float(params.get('overlap', 50)) / 100.0
+    frame_length = int(segment_duration * sr)
+    step_samples = max(1, int(frame_length * (1 - overlap_ratio)))
+    return index * step_samples / sr, frame_length / sr
+
+
+def _to_mono(data):
+    """混為單聲道；兩聲道反相 (混音後幾乎無聲) 時改取第一聲道，與舊版切割音檔相同"""
+    if data.shape[1] == 1:
+        return data[:, 0]
+    mono = data.mean(axis=1)
+    if data.size and np.max(np.abs(mono)) < 1e-4 and np.max(np.abs(data)) > 1e-3:
+        return data[:, 0]
+    return mono
+
+
+def read_upload_segment(path, params, index, resample=False):
+    """
+    由原始上傳檔讀取片段 index 的單聲道音訊。
+
+    Args:
+        path (str): 原始上傳檔路徑
+        params (dict): AudioInfo.get_params()
+        index (int): 片段編號
+        resample (bool): 是否重取樣至處理時的取樣率 (繪製頻譜需與訓練用圖一致)；預設維持原始取樣率
+
+    Returns:
+        tuple: (y [samples] float32, sr, time_start)
+    """
+    pad = RESAMPLE_PAD_SECONDS if resample else 0.0
+
+    def window(sr):
+        time_start, duration = segment_window(params, index, sr)
+        lead = min(pad, time_start)
+        return time_start - lead, duration + lead + pad
+
+    try:
+        if path.lower().endswith(INDEXED_EXTENSIONS):
+            data, sr, _ = decoder_cache.read(path, window)
+        else:
+            with sf.SoundFile(path) as f:
+                data, sr, _ = _read_range(f, window)
+        y = _to_mono(data)
+    except sf.LibsndfileError:
+        # soundfile 無法解碼的格式改用 librosa (audioread)
+        import librosa
+        sr = librosa.get_samplerate(path)
+        offset, duration = window(sr)
+        y, _ = librosa.load(path, sr=None, mono=True, offset=offset, duration=duration)
+        expected = int(round(duration * sr))
+        if len(y) < expected:
+            y = np.pad(y, (0, expected - len(y)))
+
+    time_start, duration = segment_window(params, index, sr)
+    lead = min(pad, time_start)
+    target_sr = processing_sr(params, sr) if resample else sr
+    if target_sr != sr:
+        import librosa
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+        sr = target_sr
+    # 去除重取樣用的前後補充樣本
+    start = int(round(lead * sr))
+    y = y[start:start + int(round(duration * sr))]
+    return y.astype(np.float32, copy=False), sr, time_start
+
+
+def encode_wav(y, sr):
+    """將片段編碼為 16-bit PCM WAV bytes"""
+    buffer = io.BytesIO()
+    sf.write(buffer, y, sr, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+
+def iter_virtual_segment_wavs(upload, results, result_dir):
+    """
+    匯出用：逐一產生未輸出實體檔之片段的 (檔名, WAV bytes)，取樣率與處理時相同。
+
+    Args:
+        upload (AudioInfo): 音檔紀錄
+        results (list[Result]): 片段結果
+        result_dir (str): 結果資料夾 (已存在實體檔的片段略過，由呼叫端直接加入)
+    """
+    if not upload.file_path or not os.path.exists(upload.file_path):
+        return
+    params = upload.get_params()
+    for res in results:
+        if not res.audio_filename or os.path.exists(os.path.join(result_dir, res.audio_filename)):
+            continue
+        y, sr, _ = read_upload_segment(upload.file_path, params, res.segment_index, resample=True)
+        yield res.audio_filename, encode_wav(y, sr)
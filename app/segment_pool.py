@@ -0,0 +1,193 @@
+"""
+片段處理的多行程執行模式 (shared memory)。
+
+此模組負責：
+1. 建立跨音檔共用的片段處理行程池 (ProcessPoolExecutor，spawn 啟動)
+2. 將每個區塊的音訊與共用頻譜 (spectrogram_engine 的區塊物件) 複製到一塊 shared memory
+3. 於 worker 行程中依 (區塊名稱, 偏移量, 長度) 描述子取回片段資料並繪圖，結果回傳主行程
+
+設計模式：
+- 主行程仍負責解碼、共用頻譜運算 (DEMON 濾波器狀態需依序延續) 與圖磚建立
+- 每個區塊一塊 shared memory (BlockArena)，區塊內所有片段完成後由主行程釋放；
+  送往 worker 的只有描述子，音訊與頻譜陣列不經過 pickle
+- 頻譜矩陣存檔 (spectrogram_store) 與模型推論留在主行程：
+  worker 回傳 float16 矩陣與訓練用圖 (RGB 陣列，供主行程的 InferenceStage 批次推論)，避免各行程各自載入模型
+- worker 內的影像編碼統計以差值回傳，由主行程併入 encoding_stats
+- worker 以 spawn 啟動，會重新匯入 app 套件；app/__init__.py 在子行程中不呼叫 create_app()，
+  worker 不建立 Flask 應用程式也不連線資料庫
+
+環境變數：
+- SEGMENT_PROCESS_WORKERS: 行程池大小 (預設為 cpu_budget 的核心預算)；
+  各任務的在途片段數受其分得的核心數限制，行程池本身不需隨任務數調整
+"""
+
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .image_encoder import encoding_stats
+from .spectrogram_store import STORE_DTYPE
+from .cpu_budget import cpu_budget
+
+# 陣列於 shared memory 中的對齊位元組數
+_ALIGN = 64
+
+POOL_WORKERS = int(os.environ.get('SEGMENT_PROCESS_WORKERS', 0)) or cpu_budget.total
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """
+    取得全域片段處理行程池 (首次呼叫時建立)。
+
+    Celery worker 以多執行緒執行任務，fork 出的子行程可能繼承其他執行緒持有的鎖，
+    因此固定使用 spawn 啟動；多個任務共用同一個行程池，總行程數不隨任務數增加。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+            )
+            print(f"[segment_pool] 已建立片段處理行程池: {POOL_WORKERS} 個行程")
+        return _pool
+
+
+def _init_worker():
+    """每個 worker 行程只處理一個片段，PyTorch 不另開 intra-op 執行緒"""
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except Exception:
+        pass
+
+
+def _aligned(size):
+    return -(-size // _ALIGN) * _ALIGN
+
+
+class BlockArena:
+    """
+    單一區塊的 shared memory：區塊音訊 + 共用頻譜物件的陣列屬性。
+
+    Attributes:
+        spec (dict): 送往 worker 的描述子 (名稱、各陣列的偏移量/dtype/形狀、共用頻譜的類別)
+        remaining (int): 尚未完成的片段數，歸零時釋放
+
+    Example:
+        >>> arena = BlockArena(block, shared, n_segments)
+        >>> pool.submit(run_segment, arena.spec, offset, frame_length, kwargs)
+        >>> arena.release()  # 每個片段完成後呼叫一次
+    """
+
+    def __init__(self, block, shared, n_segments):
+        self.remaining = n_segments
+        arrays = [np.asarray(block)]
+        shared_spec = None
+        if shared is not None:
+            # 陣列屬性放入 shared memory (記錄 layout 索引)，其餘屬性 (步長、偏移量等) 直接 pickle
+            array_attrs, plain_attrs = {}, {}
+            for key, value in vars(shared).items():
+                if isinstance(value, np.ndarray):
+                    array_attrs[key] = len(arrays)
+                    arrays.append(value)
+                else:
+                    plain_attrs[key] = value
+            shared_spec = (type(shared), array_attrs, plain_attrs)
+
+        layout = []
+        size = 0
+        for array in arrays:
+            layout.append((size, array.dtype.str, array.shape))
+            size += _aligned(array.nbytes)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for array, (offset, dtype, shape) in zip(arrays, layout):
+            np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)[...] = array
+
+        self.spec = {
+            'name': self._shm.name,
+            'layout': layout,
+            'shared': shared_spec,
+        }
+
+    def release(self):
+        """片段完成時呼叫；區塊內所有片段都完成後釋放 shared memory"""
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.close()
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _view(shm, layout, index):
+    offset, dtype, shape = layout[index]
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+
+def _copy_out(value):
+    """將 shared memory 上的 view 複製出來，讓 worker 結束時可以關閉對應的 mapping"""
+    if isinstance(value, np.ndarray):
+        return np.array(value)
+    if isinstance(value, tuple):
+        return tuple(_copy_out(v) for v in value)
+    return value
+
+
+def _read_segment(shm, spec, offset, frame_length):
+    """由描述子取得片段音訊與共用頻譜 (皆為複本)"""
+    layout = spec['layout']
+    y_segment = np.array(_view(shm, layout, 0)[..., offset:offset + frame_length])
+    precomputed = None
+    if spec['shared'] is not None:
+        cls, array_attrs, plain_attrs = spec['shared']
+        shared = cls.__new__(cls)
+        shared.__dict__.update(plain_attrs)
+        for key, index in array_attrs.items():
+            setattr(shared, key, _view(shm, layout, index))
+        precomputed = _copy_out(shared.segment(offset))
+    return y_segment, precomputed
+
+
+def run_segment(spec, offset, frame_length, segment_kwargs, return_matrix=False):
+    """
+    worker 行程：處理區塊中從 offset 開始的片段。
+
+    Args:
+        spec (dict): BlockArena.spec
+        offset (int): 片段起點相對於區塊起點的樣本數
+        frame_length (int): 片段長度 (樣本數)
+        segment_kwargs (dict): 傳給 audio_utils._render_segment 的其餘參數
+        return_matrix (bool): 是否回傳頻譜矩陣 (供主行程存入 spectrogram_store)
+
+    Returns:
+        dict: 片段結果 (不含 detections)，另含 'image' (訓練用圖)、'matrix' 與 'encoding' (編碼統計差值)
+    """
+    from .audio_utils import _render_segment
+
+    encoding_before = encoding_stats.snapshot()
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    try:
+        y_segment, precomputed = _read_segment(shm, spec, offset, frame_length)
+    finally:
+        shm.close()
+
+    result, matrix = _render_segment(y_segment=y_segment, precomputed=precomputed, **segment_kwargs)
+    result['matrix'] = np.asarray(matrix, dtype=STORE_DTYPE) if (return_matrix and matrix is not None) else None
+
+    encoding = {}
+    for key, totals in encoding_stats.snapshot().items():
+        base = encoding_before.get(key, (0, 0.0, 0))
+        if totals != base:
+            encoding[key] = tuple(a - b for a, b in zip(totals, base))
+    result['encoding'] = encoding
+    return result
@@ -5,6 +5,32 @@ from .. import db
 from ..models import AudioInfo, Result, CetaceanInfo
 from ..audio_utils import process_large_audio
 
+def build_spec_params(params):
+    """
+    由 AudioInfo.params (上傳表單參數) 組裝頻譜圖參數字典。
+    處理任務與顯示端點共用，確保隨需繪製的顯示圖與處理時的設定一致。
+    """
+    n_fft = int(params.get('n_fft', 1024))
+    window_overlap = float(params.get('window_overlap', 50)) / 100.0
+    hop_length = int(n_fft * (1 - window_overlap))
+    if hop_length < 1:
+        hop_length = 1
+    
+    return {
+        'n_fft': n_fft,
+        'hop_length': hop_length,
+        'window_overlap': window_overlap,
+        'window_type': params.get('window_type', 'hann'),
+        'n_mels': int(params.get('n_mels', 128)),
+        'f_min': float(params.get('f_min', 0)),
+        'f_max': float(params.get('f_max', 0)),
+        'stft_method': params.get('stft_method', 'fft'),
+        'power': float(params.get('power', 2.0)),
+        'image_format': params.get('image_format', ''),
+        'envelope_decimate': bool(params.get('envelope_decimate', False)),
+        'shared_stft': bool(params.get('shared_stft', False))
+    }
+
 class AudioService:
     @staticmethod
     def process_audio(audio_id):
@@ -63,23 +89,7 @@ class AudioService:
                             db.session.rollback()
                             print(f"進度更新失敗 (ID: {audio_id}): {e}")
 
-            # 組裝頻譜圖參數字典
-            n_fft = int(params.get('n_fft', 1024))
-            window_overlap = float(params.get('window_overlap', 50)) / 100.0
-            hop_length = int(n_fft * (1 - window_overlap))
-            if hop_length < 1:
-                hop_length = 1
-            
-            spec_params = {
-                'n_fft': n_fft,
-                'hop_length': hop_length,
-                'window_overlap': window_overlap,
-                'window_type': params.get('window_type', 'hann'),
-                'n_mels': int(params.get('n_mels', 128)),
-                'f_min': float(params.get('f_min', 0)),
-                'f_max': float(params.get('f_max', 0)),
-                'power': float(params.get('power', 2.0))
-            }
+            spec_params = build_spec_params(params)
             
             results_data = process_large_audio(
                 filepath=upload_path,
@@ -90,7 +100,11 @@ class AudioService:
                 target_sr=int(params['sample_rate']) if params.get('sample_rate', 'None').isdigit() else None,
                 is_mono=(params.get('channels', 'mono') == 'mono'),
                 progress_callback=progress_callback,
-                spec_params=spec_params
+                spec_params=spec_params,
+                decode_mode=params.get('decode_mode', 'auto'),
+                tile_pyramid=bool(params.get('tile_pyramid', False)),
+                save_tensors=bool(params.get('save_tensors', False)),
+                write_segment_audio=bool(params.get('segment_audio', False))
             )
 
             # 計算時間參數
@@ -0,0 +1,584 @@
+"""
+共用頻譜運算引擎。
+
+此模組負責：
+1. 將區塊內所有片段排成 [n_segments, frame_length] 的 2-D view，
+   以一次批次轉換取代逐片段呼叫 (預設，結果與逐片段計算完全相同)
+2. 選用 'shared' 模式時，對整段錄音（或串流模式下的每個區塊）只計算一次
+   STFT / Mel / YAMNet Log Mel，再依片段的樣本範圍切出對應的欄位 (column range)
+
+設計說明：
+- 片段重疊 50% 時，逐片段計算會讓每個 STFT frame 至少被算兩次；
+  'shared' 模式的共用矩陣讓 FFT 運算量隨重疊率降低（50% 約減半，重疊越高省越多）
+- 預設為 'batched' 模式：結果與逐片段計算完全相同 (bit-identical)，
+  省去每片段的 Python 呼叫與 window 設定成本
+- 'shared' 模式需由 spec_params['shared_stft'] 選用，且片段步長 (step) 須為
+  hop_length 的整數倍 (否則退回 'batched')；片段邊緣的 frame 使用真實的相鄰樣本，
+  而非逐片段計算時的零填補 (降取樣頻帶與 YAMNet 亦同)，訓練用圖因此與逐片段計算不同，
+  既有模型需以同模式產生的圖重新訓練
+- 區塊起點一律對齊片段起點（見 audio_utils 的區塊產生器），
+  因此區塊內的欄位索引可直接由片段偏移量換算
+- Mel 頻譜由功率頻譜與快取的 Mel 濾波器組做一次矩陣乘法取得，
+  批次模式下同一次 matmul 即處理區塊內所有片段
+- DEMON 前端 (帶通、平方律解調、降取樣) 對整段錄音只做一次，
+  以 sosfilt 的濾波器狀態 (zi) 跨區塊延續，片段直接從降取樣後的訊號切出
+- STFT 在 f_max 遠低於 Nyquist 時先抗混疊降取樣再轉換 (n_fft / hop 同比縮小，
+  頻率與時間解析度不變)，只保留 [f_min, f_max] 內的頻率 bin；
+  窄頻帶可改用 Zoom FFT (chirp-z) 直接在頻帶內取得更細的頻率格點
+- 包絡線頻譜以 rfft 對區塊內所有片段做 2-D 批次運算；選用 envelope_decimate 時
+  先將包絡線低通降取樣至略高於顯示頻帶 (0–300 Hz) 的取樣率 (訓練用圖會改變，見 envelope_spectrum)
+"""
+
+import numpy as np
+import librosa
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import rfft, rfftfreq
+from scipy.signal import cheby1, sosfilt, sosfilt_zi, lfilter, hilbert, resample_poly, ZoomFFT
+
+from .dsp_cache import get_mel_filterbank
+from .dsp_cache import get_butter_sos as get_butter_sos_cached
+from .dsp_cache import get_butter_ba
+
+# 降取樣後 f_max 需低於新 Nyquist 頻率的比例 (保留抗混疊濾波器的過渡帶)
+BAND_GUARD_RATIO = 0.8
+# 降取樣後頻帶內至少保留的頻率 bin 數 (原始解析度下不足此數時以原始 bin 數為準)
+MIN_BAND_BINS = 8
+# 降取樣後的最短 FFT 長度 (避免窗長只剩數個樣本)
+MIN_DECIMATED_N_FFT = 64
+# 包絡線頻譜顯示的最高調變頻率 (Hz)
+ENVELOPE_MAX_FREQ = 300
+# 包絡線批次運算時每次處理的片段數 (限制 hilbert 的暫存記憶體)
+ENVELOPE_BATCH_SIZE = 16
+
+
+def mel_from_magnitude(S, mel_basis, power=2.0):
+    """
+    以矩陣乘法將幅度頻譜轉為 Mel 頻譜 (等同 librosa.feature.melspectrogram)。
+
+    Args:
+        S (np.ndarray): 幅度頻譜 [..., 1 + n_fft // 2, time]，可含批次維度
+        mel_basis (np.ndarray): Mel 濾波器組 [n_mels, 1 + n_fft // 2]
+        power (float): 幅度的指數 (2.0 為功率頻譜)
+
+    Returns:
+        np.ndarray: [..., n_mels, time]
+    """
+    return np.matmul(mel_basis, S ** power)
+
+
+def segment_frames(block, frame_length, step_samples):
+    """
+    將區塊內所有完整片段排成 [..., n_segments, frame_length] 的 strided view (不複製資料)。
+
+    Args:
+        block (np.ndarray): 音訊區塊，時間軸在最後一維
+        frame_length (int): 片段長度 (樣本數)
+        step_samples (int): 片段步長 (樣本數)
+    """
+    if block.shape[-1] < frame_length:
+        return np.empty(block.shape[:-1] + (0, frame_length), dtype=block.dtype)
+    return sliding_window_view(block, frame_length, axis=-1)[..., ::step_samples, :]
+
+
+def _band_bins(sr, n_fft, f_min, f_max):
+    """回傳 (rfft 各 bin 頻率, 落在 [f_min, f_max] 內的 bin 索引)"""
+    freqs = np.fft.rfftfreq(n_fft, 1 / sr)
+    return freqs, np.flatnonzero((freqs >= f_min) & (freqs <= f_max))
+
+
+class BandLimitedStft:
+    """
+    依 f_min / f_max 限制頻帶的 STFT 設定。
+
+    - f_max 遠低於 Nyquist 時，以 resample_poly 抗混疊降取樣 factor 倍，
+      n_fft 與 hop_length 同比縮小 (factor 取兩者的公因數，頻率 / 時間解析度不變)；
+      factor 受 MIN_DECIMATED_N_FFT 與 MIN_BAND_BINS 限制
+    - 頻帶窄於 bin 間距 (沒有 bin 落在頻帶內) 時保留最接近頻帶中心的一個 bin
+    - stft_method='fft': 一般 FFT 後只保留 [f_min, f_max] 內的 bin
+    - stft_method='zoom': 以 Zoom FFT (chirp-z) 在 [f_min, f_max] 內均勻取 zoom_bins 點
+
+    未設定頻帶 (f_min=0, f_max=0 或 ≥ Nyquist) 且為 'fft' 時與完整 STFT 完全相同。
+
+    Attributes:
+        factor (int): 降取樣倍率
+        sr (float): 降取樣後的取樣率
+        n_fft (int): 降取樣後的 FFT 長度
+        hop_length (int): 降取樣後的 hop 長度
+        freqs (np.ndarray): 輸出各列 (bin) 對應的頻率 (Hz)
+
+    Example:
+        >>> band = BandLimitedStft.create(sr, spec_params)
+        >>> S = band.magnitude(y)  # [..., len(band.freqs), time]
+    """
+
+    def __init__(self, sr, n_fft, hop_length, window_type, f_min, f_max, method, zoom_bins):
+        self.window_type = window_type
+        self.f_min = f_min
+        self.f_max = f_max
+        self.method = method
+
+        self.factor = self._choose_factor(sr, n_fft, hop_length, f_min, f_max)
+        self.sr = sr / self.factor
+        self.n_fft = n_fft // self.factor
+        self.hop_length = hop_length // self.factor
+
+        if method == 'zoom':
+            self.zoom = ZoomFFT(self.n_fft, [f_min, f_max], m=zoom_bins, fs=self.sr, endpoint=True)
+            self.freqs = np.linspace(f_min, f_max, zoom_bins)
+            self.bins = None
+        else:
+            freqs, keep = _band_bins(self.sr, self.n_fft, f_min, f_max)
+            if len(keep) == 0:
+                # 頻帶窄於 bin 間距：取最接近頻帶中心的 bin
+                keep = [int(np.argmin(np.abs(freqs - (f_min + f_max) / 2)))]
+            self.bins = slice(keep[0], keep[-1] + 1)
+            self.freqs = freqs[self.bins]
+
+    @staticmethod
+    def _choose_factor(sr, n_fft, hop_length, f_min, f_max):
+        """
+        降取樣倍率：需同時整除 n_fft 與 hop_length，降取樣後 f_max 仍在保護頻帶內，
+        FFT 長度不短於 MIN_DECIMATED_N_FFT，且頻帶內的 bin 數不少於 MIN_BAND_BINS
+        (原始解析度下即不足時，不少於原始的 bin 數)。
+        """
+        max_factor = int(sr * BAND_GUARD_RATIO / (2 * f_max))
+        common = int(np.gcd(n_fft, hop_length))
+        min_bins = min(MIN_BAND_BINS, len(_band_bins(sr, n_fft, f_min, f_max)[1]))
+        for q in range(min(max_factor, common), 1, -1):
+            if common % q or n_fft // q < MIN_DECIMATED_N_FFT:
+                continue
+            if len(_band_bins(sr / q, n_fft // q, f_min, f_max)[1]) >= min_bins:
+                return q
+        return 1
+
+    @classmethod
+    def create(cls, sr, spec_params):
+        """由 spec_params 建立設定 (f_max 為 0 或超過 Nyquist 時視為 Nyquist)"""
+        spec_params = spec_params or {}
+        n_fft = spec_params.get('n_fft', 1024)
+        f_min = max(0.0, float(spec_params.get('f_min', 0)))
+        f_max = float(spec_params.get('f_max', 0))
+        if f_max <= 0 or f_max > sr / 2:
+            f_max = sr / 2
+        if f_min >= f_max:
+            f_min = 0.0
+        method = spec_params.get('stft_method', 'fft')
+        if method not in ('fft', 'zoom'):
+            method = 'fft'
+        return cls(
+            sr, n_fft, spec_params.get('hop_length', 512), spec_params.get('window_type', 'hann'),
+            f_min, f_max, method, int(spec_params.get('zoom_bins', 1 + n_fft // 2))
+        )
+
+    @property
+    def is_full_band(self):
+        """是否等同完整 0 – Nyquist 的一般 STFT"""
+        return self.factor == 1 and self.method == 'fft' and len(self.freqs) == 1 + self.n_fft // 2
+
+    def decimate(self, y):
+        """沿最後一維抗混疊降取樣 (factor 為 1 時原樣回傳)"""
+        if self.factor == 1:
+            return y
+        return resample_poly(y, 1, self.factor, axis=-1).astype(np.float32, copy=False)
+
+    def magnitude(self, y):
+        """
+        計算頻帶內的幅度頻譜。
+
+        Args:
+            y (np.ndarray): 原始取樣率的音訊，時間在最後一維 (可含批次維度)
+
+        Returns:
+            np.ndarray: [..., len(freqs), time]
+        """
+        y = self.decimate(y)
+        if self.method == 'zoom':
+            S = self._zoom_stft(y)
+        else:
+            D = librosa.stft(
+                y,
+                n_fft=self.n_fft,
+                hop_length=self.hop_length,
+                win_length=self.n_fft,
+                window=self.window_type
+            )
+            S = np.abs(D[..., self.bins, :])
+        # 窗長縮短 factor 倍，乘回 factor 使幅度與原取樣率的 STFT 同尺度
+        return S * self.factor if self.factor > 1 else S
+
+    def _zoom_stft(self, y):
+        """與 librosa.stft (center=True, 零填補) 相同的分幀，逐幀以 Zoom FFT 取頻帶內的頻譜"""
+        pad = [(0, 0)] * (y.ndim - 1) + [(self.n_fft // 2, self.n_fft // 2)]
+        y = np.pad(y, pad)
+        frames = sliding_window_view(y, self.n_fft, axis=-1)[..., ::self.hop_length, :]
+        window = librosa.filters.get_window(self.window_type, self.n_fft, fftbins=True)
+        spectrum = self.zoom(frames * window, axis=-1)
+        return np.abs(np.swapaxes(spectrum, -1, -2))
+
+
+class BlockSpectrogram:
+    """
+    單一區塊的共用頻譜矩陣。
+
+    Attributes:
+        matrix (np.ndarray): 頻譜矩陣，欄位 (時間) 軸由 time_axis 指定
+        hop_length (int): 相鄰欄位間的樣本數
+        n_columns (int): 每個片段應切出的欄位數
+        time_axis (int): 時間軸所在維度
+    """
+
+    def __init__(self, matrix, hop_length, n_columns, time_axis=-1):
+        self.matrix = matrix
+        self.hop_length = hop_length
+        self.n_columns = n_columns
+        self.time_axis = time_axis
+
+    def segment(self, offset_samples):
+        """
+        取得區塊內從 offset_samples 開始之片段的頻譜 (view，不複製)。
+
+        Args:
+            offset_samples (int): 片段起點相對於區塊起點的樣本數 (需為 hop_length 的整數倍)
+        """
+        start = offset_samples // self.hop_length
+        index = [slice(None)] * self.matrix.ndim
+        index[self.time_axis] = slice(start, start + self.n_columns)
+        return self.matrix[tuple(index)]
+
+
+class BatchedSpectrogram:
+    """
+    單一區塊內所有片段的批次頻譜，第 0 維為片段索引。
+
+    Attributes:
+        batch (np.ndarray): [n_segments, ...] 的頻譜陣列
+        step_samples (int): 片段步長，用於由偏移量換算片段索引
+    """
+
+    def __init__(self, batch, step_samples):
+        self.batch = batch
+        self.step_samples = step_samples
+
+    def segment(self, offset_samples):
+        """取得區塊內從 offset_samples 開始之片段的頻譜"""
+        return self.batch[offset_samples // self.step_samples]
+
+
+def envelope_spectrum(frames, sr, max_freq=ENVELOPE_MAX_FREQ, decimate=False):
+    """
+    計算包絡線頻譜 (DEMON 1D)，支援 [samples] 或 [n_segments, samples] 批次輸入。
+
+    流程：帶通 (2 kHz – 20 kHz) → Hilbert 包絡 → 去除直流 → rfft，
+    回傳 0 – Nyquist 的前 N // 2 個 bin (與原本逐片段以 fft 計算的結果相同)。
+
+    decimate=True 時先將包絡線低通降取樣至約 3 × max_freq 再做 FFT (較快)，
+    但頻譜只到降取樣後的 Nyquist：訓練用圖的 y 軸自動縮放範圍因此不同，
+    圖像與預設模式不一致，既有模型需以同模式產生的圖重新訓練。
+
+    Returns:
+        tuple: (freqs, magnitude)，magnitude 的最後一維對應 freqs
+    """
+    bp_high = min(20000, sr / 2 * 0.99)
+    b, a = get_butter_ba(4, 2000, bp_high, sr)
+    envelope = np.abs(hilbert(lfilter(b, a, frames, axis=-1), axis=-1))
+
+    fs_env = sr
+    if decimate:
+        # 只保留 0 – max_freq 的調變成分；降取樣倍率取片段長度的因數，
+        # 使頻率解析度 (sr / 片段長度) 與全速率 FFT 相同
+        length = envelope.shape[-1]
+        factor = max(1, int(sr // (3 * max_freq)))
+        while factor > 1 and length % factor:
+            factor -= 1
+        if factor > 1:
+            envelope = resample_poly(envelope, 1, factor, axis=-1)
+        fs_env = sr / factor
+
+    n = envelope.shape[-1]
+    envelope = envelope - envelope.mean(axis=-1, keepdims=True)
+    magnitude = 2.0 / n * np.abs(rfft(envelope, axis=-1, workers=-1))
+    return rfftfreq(n, 1 / fs_env)[:n // 2], magnitude[..., :n // 2]
+
+
+def create_engine(spec_type, sr, spec_params, frame_length, step_samples):
+    """
+    依頻譜類型建立對應的區塊運算引擎。
+
+    Returns:
+        SpectrogramEngine | DemonEngine | None: 不支援的類型回傳 None (逐片段運算)
+    """
+    if spec_type == 'classic_demon':
+        return DemonEngine.create(sr, frame_length)
+    if spec_type == 'envelope_spectrum':
+        return EnvelopeEngine.create(sr, frame_length, step_samples, bool((spec_params or {}).get('envelope_decimate')))
+    return SpectrogramEngine.create(spec_type, sr, spec_params, frame_length, step_samples)
+
+
+class SpectrogramEngine:
+    """
+    依頻譜類型對整個區塊計算一次頻譜，再由各片段切片取用。
+
+    模式：
+        - 'batched' (預設): 對 [n_segments, frame_length] 矩陣做一次批次轉換，與逐片段計算完全相同
+        - 'shared': spec_params['shared_stft'] 為 True 且片段步長為 hop 整數倍時，
+          整個區塊算一次 STFT 後切欄位 (片段邊緣的 frame 與逐片段計算不同)
+
+    支援的類型：
+        - 'stft': 儲存頻帶內的幅度矩陣 |D| (見 BandLimitedStft)，dB 轉換仍於各片段內以 ref=np.max 進行
+        - 'mel': 儲存 Mel 頻譜 (依 n_mels, f_min, f_max, power)，dB 轉換同上
+        - 'yamnet_log_mel': 儲存 [time, n_mels] 的 Log Mel 矩陣
+
+    Example:
+        >>> engine = SpectrogramEngine.create('stft', sr, spec_params, frame_length, step_samples)
+        >>> shared = engine.compute_block(block) if engine else None
+        >>> S = shared.segment(j * step_samples)
+    """
+
+    SUPPORTED_TYPES = ('stft', 'mel', 'yamnet_log_mel')
+
+    def __init__(self, spec_type, sr, spec_params, frame_length, step_samples):
+        self.spec_type = spec_type
+        self.sr = sr
+        self.spec_params = spec_params or {}
+        self.frame_length = frame_length
+        self.step_samples = step_samples
+        self.mode = 'shared' if self.spec_params.get('shared_stft') else 'batched'
+
+        if spec_type == 'yamnet_log_mel':
+            from .audio_utils import yamnet_params_from_spec_params
+            self.yamnet_params = yamnet_params_from_spec_params(self.spec_params)
+            self.hop_length = int(round(self.yamnet_params.sample_rate * self.yamnet_params.stft_hop_seconds))
+        else:
+            self.n_fft = self.spec_params.get('n_fft', 1024)
+            self.hop_length = self.spec_params.get('hop_length', 512)
+            self.window_type = self.spec_params.get('window_type', 'hann')
+
+        if spec_type == 'stft':
+            self.band = BandLimitedStft.create(sr, self.spec_params)
+
+        if spec_type == 'mel':
+            f_min = self.spec_params.get('f_min', 0)
+            f_max = self.spec_params.get('f_max', 0)
+            if f_max <= 0 or f_max > sr / 2:
+                f_max = sr / 2
+            self.power = self.spec_params.get('power', 2.0)
+            self.mel_basis = get_mel_filterbank(sr, self.n_fft, self.spec_params.get('n_mels', 128), f_min, f_max)
+
+    @classmethod
+    def create(cls, spec_type, sr, spec_params, frame_length, step_samples):
+        """
+        建立引擎；若頻譜類型不支援則回傳 None。
+
+        Returns:
+            SpectrogramEngine | None
+        """
+        if spec_type not in cls.SUPPORTED_TYPES:
+            return None
+        if spec_type == 'yamnet_log_mel' and sr != 16000:
+            return None
+
+        engine = cls(spec_type, sr, spec_params, frame_length, step_samples)
+        if engine.hop_length < 1:
+            return None
+        if engine.mode == 'shared' and step_samples % engine.hop_length != 0:
+            print(f"片段步長 ({step_samples}) 非 hop_length ({engine.hop_length}) 的整數倍，改為批次逐片段計算頻譜。")
+            engine.mode = 'batched'
+        return engine
+
+    def compute_block(self, block, block_start=0):
+        """
+        對單聲道區塊計算共用頻譜矩陣。
+
+        Args:
+            block (np.ndarray): 1-D float 音訊區塊，起點對齊某個片段起點
+            block_start (int): 區塊起點在整段錄音中的樣本索引 (此引擎不需要，僅統一介面)
+
+        Returns:
+            BlockSpectrogram | BatchedSpectrogram | None: 多聲道區塊 (需逐片段挑選聲道) 時回傳 None
+        """
+        if block.ndim != 1:
+            return None
+
+        if self.mode == 'batched':
+            # [n_segments, frame_length] view，一次轉換所有片段 (輸出第 0 維為片段)
+            frames = segment_frames(block, self.frame_length, self.step_samples)
+            return BatchedSpectrogram(self._transform(frames), self.step_samples)
+
+        n_columns = 1 + self.frame_length // self.hop_length
+        time_axis = 0 if self.spec_type == 'yamnet_log_mel' else -1
+        return BlockSpectrogram(self._transform(block), self.hop_length, n_columns, time_axis)
+
+    def _transform(self, y):
+        """對最後一維為時間的 1-D 或 2-D 陣列計算頻譜 (librosa / torchaudio 皆支援批次維度)"""
+        if self.spec_type == 'yamnet_log_mel':
+            from .audio_utils import waveform_to_log_mel_spectrogram_patches
+            return waveform_to_log_mel_spectrogram_patches(y, self.yamnet_params)
+        if self.spec_type == 'stft':
+            return self.band.magnitude(y)
+
+        D = librosa.stft(
+            y,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            win_length=self.n_fft,
+            window=self.window_type
+        )
+        return mel_from_magnitude(np.abs(D), self.mel_basis, self.power)
+
+
+class DemonBlock:
+    """
+    DEMON 降取樣訊號的緩衝區 view，供區塊內各片段切取。
+
+    Attributes:
+        signal (np.ndarray): 降取樣後的解調訊號
+        signal_start (int): signal[0] 對應的降取樣絕對索引
+        block_start (int): 區塊起點 (原始樣本絕對索引)
+        factor (int): 降取樣倍率
+        frame_length (int): 片段長度 (原始樣本數)
+    """
+
+    def __init__(self, signal, signal_start, block_start, factor, frame_length):
+        self.signal = signal
+        self.signal_start = signal_start
+        self.block_start = block_start
+        self.factor = factor
+        self.frame_length = frame_length
+
+    def segment(self, offset_samples):
+        """取得原始樣本範圍 [start, start + frame_length) 內的降取樣樣本"""
+        start = self.block_start + offset_samples
+        first = -(-start // self.factor)
+        last = -(-(start + self.frame_length) // self.factor)
+        return self.signal[first - self.signal_start:last - self.signal_start]
+
+
+class DemonEngine:
+    """
+    整段錄音的 DEMON 前端：帶通濾波 → 平方律解調 → 抗混疊低通 → 降取樣。
+
+    與逐片段的 sosfiltfilt + decimate 相比：
+    - 重疊區域的樣本只濾波一次
+    - 濾波器狀態跨區塊延續，片段邊緣不再有暫態
+    - 產出的訊號長度僅為原始音訊的 DOWNSAMPLE_RATE / sr
+
+    區塊需依序送入；區塊間的重疊部分 (carry-over) 只處理一次。
+    濾波為因果式 (sosfilt)，相較 filtfilt 會有數毫秒的群延遲，對調變頻譜無實質影響。
+    """
+
+    def __init__(self, sr, frame_length, params):
+        self.sr = sr
+        self.frame_length = frame_length
+        self.factor = max(1, int(sr / params['DOWNSAMPLE_RATE']))
+
+        bandpass_high = min(params['BANDPASS_HIGH'], sr / 2 * 0.99)
+        self.bandpass_sos = get_butter_sos_cached(5, params['BANDPASS_LOW'], bandpass_high, sr)
+        self.bandpass_zi = sosfilt_zi(self.bandpass_sos) * 0.0
+
+        # 與 scipy.signal.decimate 預設相同的 8 階 Chebyshev I 抗混疊濾波器
+        self.lowpass_sos = None
+        if self.factor > 1:
+            self.lowpass_sos = cheby1(8, 0.05, 0.8 / self.factor, output='sos')
+            self.lowpass_zi = sosfilt_zi(self.lowpass_sos) * 0.0
+
+        self.consumed = 0
+        self.signal = np.zeros(0, dtype=np.float32)
+        self.signal_start = 0
+
+    @classmethod
+    def create(cls, sr, frame_length):
+        """建立 DEMON 前端；取樣率過低而無法進行帶通時回傳 None"""
+        from .audio_utils import CLASSIC_DEMON_PARAMS
+        params = CLASSIC_DEMON_PARAMS
+        if params['BANDPASS_LOW'] >= min(params['BANDPASS_HIGH'], sr / 2 * 0.99):
+            return None
+        return cls(sr, frame_length, params)
+
+    def compute_block(self, block, block_start=0):
+        """
+        處理區塊中尚未處理過的樣本，並回傳涵蓋此區塊的降取樣訊號。
+
+        Args:
+            block (np.ndarray): 1-D float 音訊區塊
+            block_start (int): 區塊起點在整段錄音中的樣本索引
+
+        Returns:
+            DemonBlock | None: 多聲道區塊回傳 None
+        """
+        if block.ndim != 1:
+            return None
+
+        new_samples = block[max(0, self.consumed - block_start):]
+        if new_samples.size:
+            filtered, self.bandpass_zi = sosfilt(self.bandpass_sos, new_samples, zi=self.bandpass_zi)
+            demodulated = filtered ** 2
+            if self.lowpass_sos is not None:
+                demodulated, self.lowpass_zi = sosfilt(self.lowpass_sos, demodulated, zi=self.lowpass_zi)
+            # 只保留絕對索引為 factor 整數倍的樣本
+            first = (-self.consumed) % self.factor
+            decimated = demodulated[first::self.factor].astype(np.float32)
+            self.consumed += new_samples.size
+            self.signal = np.concatenate([self.signal, decimated])
+
+        # 捨棄此區塊起點之前、後續片段不會再用到的樣本
+        keep_from = -(-block_start // self.factor)
+        if keep_from > self.signal_start:
+            self.signal = self.signal[keep_from - self.signal_start:]
+            self.signal_start = keep_from
+
+        return DemonBlock(self.signal, self.signal_start, block_start, self.factor, self.frame_length)
+
+
+class EnvelopeSpectrumBatch(BatchedSpectrogram):
+    """區塊內所有片段的包絡線頻譜，segment() 回傳 (freqs, magnitude)"""
+
+    def __init__(self, batch, step_samples, freqs):
+        super().__init__(batch, step_samples)
+        self.freqs = freqs
+
+    def segment(self, offset_samples):
+        return self.freqs, super().segment(offset_samples)
+
+
+class EnvelopeEngine:
+    """
+    以 [n_segments, frame_length] 批次計算包絡線頻譜。
+
+    每個片段仍獨立濾波與取包絡 (與逐片段計算的語意相同)，
+    但整批共用一次 lfilter / hilbert / resample_poly / rfft 呼叫。
+    """
+
+    def __init__(self, sr, frame_length, step_samples, decimate=False):
+        self.sr = sr
+        self.frame_length = frame_length
+        self.step_samples = step_samples
+        self.decimate = decimate
+
+    @classmethod
+    def create(cls, sr, frame_length, step_samples, decimate=False):
+        """取樣率過低而無法進行帶通時回傳 None"""
+        if 2000 >= min(20000, sr / 2 * 0.99):
+            return None
+        return cls(sr, frame_length, step_samples, decimate)
+
+    def compute_block(self, block, block_start=0):
+        """
+        Args:
+            block (np.ndarray): 1-D float 音訊區塊，起點對齊某個片段起點
+            block_start (int): 區塊起點樣本索引 (僅統一介面)
+
+        Returns:
+            EnvelopeSpectrumBatch | None: 多聲道區塊回傳 None
+        """
+        if block.ndim != 1:
+            return None
+
+        frames = segment_frames(block, self.frame_length, self.step_samples)
+        if frames.shape[0] == 0:
+            return None
+
+        freqs, parts = None, []
+        for i in range(0, frames.shape[0], ENVELOPE_BATCH_SIZE):
+            freqs, magnitude = envelope_spectrum(frames[i:i + ENVELOPE_BATCH_SIZE], self.sr, decimate=self.decimate)
+            parts.append(magnitude)
+        return EnvelopeSpectrumBatch(np.concatenate(parts), self.step_samples, freqs)
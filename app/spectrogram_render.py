@@ -0,0 +1,330 @@
+"""
+頻譜圖的繪製模組。
+
+此模組負責：
+1. 將 dB 矩陣經預先計算的色彩對照表 (LUT) 直接轉成 uint8 RGB 陣列
+2. 交由 image_encoder 以 Pillow 編碼，取代 matplotlib Figure + specshow (pcolormesh) + savefig
+3. 顯示用圖的 figure 樣板：每個執行緒、每種圖各保留一個已排版的 figure，
+   座標軸與 colorbar 只建立一次，每個片段只替換影像資料 (set_data) 與標題
+
+設計說明：
+- 訓練圖為無座標軸、無留白的純圖，尺寸固定 (6x4 吋 / 9.69x3.7 吋 @ 100 dpi)，
+  不需要 matplotlib 的版面配置與向量繪製流程
+- 色彩對照與 matplotlib 相同：Normalize(vmin, vmax) 後乘以 256 取整數索引，
+  LUT 取自同名的 matplotlib colormap，輸出尺寸與既有訓練圖一致，既有模型可直接沿用
+- 像素對應採「像素中心落在哪個格子」的規則，與 Agg 繪製 pcolormesh 的結果一致
+  (僅格子邊界恰好落在像素中心時可能差一個像素)
+- 全程為 numpy 向量運算，大部分時間不持有 GIL，多執行緒下可平行擴展
+- matplotlib 的 Figure 不是執行緒安全的，顯示樣板以 threading.local 保存，
+  各 worker 執行緒互不共用；tight_layout 只在樣板第一次輸出時執行
+"""
+
+import threading
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib import ticker
+
+from .image_encoder import get_encoder
+
+# 與 matplotlib 訓練圖相同的輸出尺寸 (寬, 高)，即 figsize × dpi=100
+TRAINING_SIZE = (600, 400)
+YAMNET_TRAINING_SIZE = (969, 370)
+
+_lut_lock = threading.Lock()
+_luts = {}
+
+
+def get_colormap_lut(name):
+    """
+    取得 matplotlib colormap 的 uint8 RGB 對照表 [N, 3]。
+
+    pcolormesh 以浮點 RGBA 交給 Agg 繪製，Agg 轉 8 位元時四捨五入，故此處同樣四捨五入。
+    """
+    with _lut_lock:
+        lut = _luts.get(name)
+        if lut is None:
+            import matplotlib
+            cmap = matplotlib.colormaps[name]
+            lut = (cmap(np.arange(cmap.N))[:, :3] * 255 + 0.5).astype(np.uint8)
+            _luts[name] = lut
+    return lut
+
+
+def default_cmap(data):
+    """
+    與 librosa.display.cmap 相同的預設色彩對照選擇。
+
+    以 2% / 98% 分位數判斷：同號資料 (如 ref=np.max 的 dB) 使用 'magma'，
+    跨越 0 的資料使用 'coolwarm'。
+    """
+    data = np.asarray(data)
+    if data.dtype == bool:
+        return 'gray_r'
+    data = data[np.isfinite(data)]
+    if data.size == 0:
+        return 'magma'
+    min_val, max_val = np.percentile(data, [2, 98])
+    if min_val >= 0 or max_val <= 0:
+        return 'magma'
+    return 'coolwarm'
+
+
+def _cell_index(edges, n_cells, n_pixels, lim, upward=False):
+    """
+    計算每個像素中心所在的格子索引。
+
+    Args:
+        edges (np.ndarray | None): 格子邊界 (長度 n_cells + 1)，None 表示 0..n_cells 的均勻格
+        n_cells (int): 格子數
+        n_pixels (int): 像素數
+        lim (tuple | None): 顯示範圍 (資料座標)，None 表示邊界的最小值到最大值
+        upward (bool): 資料座標是否與影像座標反向 (頻率軸由下往上)
+
+    Returns:
+        np.ndarray: 每個像素的格子索引，超出資料範圍者為 -1
+    """
+    if edges is None:
+        edges = np.arange(n_cells + 1, dtype=np.float64)
+    low, high = lim if lim is not None else (edges[0], edges[-1])
+    if high <= low:
+        return np.full(n_pixels, -1)
+    # 在像素座標中比較；邊界恰好落在像素中心時，Agg 將像素歸給影像座標較小 (左 / 上) 的格子
+    edge_pixels = (np.asarray(edges, dtype=np.float64) - low) * (n_pixels / (high - low))
+    centers = np.arange(n_pixels) + 0.5
+    side = 'right' if upward else 'left'
+    index = np.searchsorted(edge_pixels, centers, side=side) - 1
+    outside = (centers < edge_pixels[0]) | (centers > edge_pixels[-1])
+    outside |= (centers == edge_pixels[-1]) if upward else (centers == edge_pixels[0])
+    index[outside] = -1
+    return index
+
+
+def centers_to_edges(centers):
+    """
+    由格子中心座標推算邊界 (等同 pcolormesh shading='auto' / 'nearest')。
+
+    只有一個中心時與 matplotlib 相同，視為寬度 0 的格子 (繪製結果為空白)。
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    if centers.size == 1:
+        return np.array([centers[0], centers[0]])
+    mid = (centers[1:] + centers[:-1]) / 2
+    return np.concatenate([[centers[0] - (mid[0] - centers[0])], mid, [centers[-1] + (centers[-1] - mid[-1])]])
+
+
+def render_spectrogram_array(data, size=TRAINING_SIZE, cmap=None, x_edges=None, y_edges=None, ylim=None):
+    """
+    將 [n_rows, n_cols] 的頻譜矩陣轉為 [height, width, 3] 的 uint8 影像 (第 0 列在下方)。
+
+    Args:
+        data (np.ndarray): 頻譜矩陣 (通常為 dB)
+        size (tuple): 輸出 (寬, 高)
+        cmap (str | None): matplotlib colormap 名稱，None 時依 default_cmap 選擇
+        x_edges (np.ndarray | None): 時間方向格子邊界
+        y_edges (np.ndarray | None): 頻率方向格子邊界
+        ylim (tuple | None): 頻率方向的顯示範圍 (等同 ax.set_ylim)
+
+    Returns:
+        np.ndarray: uint8 RGB 影像，範圍外的像素為白色 (與 savefig 的背景相同)
+    """
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    width, height = size
+    lut = get_colormap_lut(cmap or default_cmap(data))
+
+    # 與 matplotlib Normalize 相同，以全體資料的最小 / 最大值線性映射至 LUT 索引
+    finite = data[np.isfinite(data)]
+    vmin, vmax = (finite.min(), finite.max()) if finite.size else (0.0, 1.0)
+    n = len(lut)
+    if vmax > vmin:
+        scaled = (data - vmin) / (vmax - vmin) * n
+    else:
+        scaled = np.zeros_like(data)
+    indices = np.clip(np.nan_to_num(scaled, nan=0.0), 0, n - 1).astype(np.intp)
+
+    cols = _cell_index(x_edges, data.shape[1], width, None)
+    # 影像第 0 列在上方，頻率由下往上，故反轉列順序
+    rows = _cell_index(y_edges, data.shape[0], height, ylim, upward=True)[::-1]
+
+    image = lut[indices[np.ix_(np.maximum(rows, 0), np.maximum(cols, 0))]]
+    outside = (rows < 0)[:, None] | (cols < 0)[None, :]
+    if outside.any():
+        image[outside] = 255
+    return image
+
+
+def save_training_image(data, out_path, size=TRAINING_SIZE, cmap=None, x_edges=None, y_edges=None, ylim=None, encoder=None):
+    """
+    以 LUT 直接輸出訓練用頻譜圖 (參數同 render_spectrogram_array)。
+
+    encoder 為 image_encoder.ImageEncoder，None 時使用訓練用圖的預設格式。
+
+    Example:
+        >>> save_training_image(S_db, 'seg_spec_training_0.png')
+    """
+    image = render_spectrogram_array(data, size, cmap, x_edges, y_edges, ylim)
+    encoder = encoder or get_encoder(kind='training')
+    encoder.save_array(image, out_path, 'training')
+    # 無損格式的影像與存檔內容相同，保留給推論階段直接使用 (見 pop_training_image)
+    _thread_state.training_image = image if encoder.lossless else None
+
+
+def pop_training_image():
+    """
+    取出目前執行緒最近一次 save_training_image 輸出的 RGB 影像並清除。
+
+    Returns:
+        np.ndarray | None: [height, width, 3] uint8；非無損格式或未經 save_training_image 輸出時為 None
+    """
+    image = getattr(_thread_state, 'training_image', None)
+    _thread_state.training_image = None
+    return image
+
+
+_thread_state = threading.local()
+
+
+# ============================================================================
+# 顯示用圖樣板
+# ============================================================================
+
+
+def get_display_template(key, factory):
+    """
+    取得目前執行緒的顯示樣板，不存在時以 factory() 建立。
+
+    Args:
+        key (tuple): 樣板識別 (圖種與影響版面的參數)
+        factory (callable): 建立樣板的函式
+    """
+    templates = getattr(_thread_state, 'templates', None)
+    if templates is None:
+        templates = _thread_state.templates = {}
+    template = templates.get(key)
+    if template is None:
+        template = templates[key] = factory()
+    return template
+
+
+def set_time_axis(ax):
+    """與 librosa specshow x_axis='time' 相同的刻度與標籤"""
+    from librosa.display import TimeFormatter
+    ax.xaxis.set_major_formatter(TimeFormatter(lag=False))
+    ax.xaxis.set_major_locator(ticker.MaxNLocator(prune=None, steps=[1, 1.5, 5, 6, 10]))
+    ax.set_xlabel('Time')
+
+
+def set_mel_axis(ax, fmin, fmax):
+    """
+    Mel 頻率軸：影像以 Mel 單位線性排列，刻度標在 2 的冪次 Hz 上並以 Hz 顯示。
+    """
+    import librosa
+    mel_low, mel_high = librosa.hz_to_mel(fmin), librosa.hz_to_mel(fmax)
+    mel_ticks = []
+    for hz in [0] + [2 ** k for k in range(6, 17)]:
+        mel = librosa.hz_to_mel(hz)
+        # 略過與前一個刻度距離太近 (低於 8% 軸長) 的刻度，避免低頻標籤重疊
+        if mel_low <= mel <= mel_high and (not mel_ticks or mel - mel_ticks[-1] >= 0.08 * (mel_high - mel_low)):
+            mel_ticks.append(mel)
+    ax.yaxis.set_major_locator(ticker.FixedLocator(mel_ticks))
+    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda m, pos: f'{librosa.mel_to_hz(m):.0f}'))
+    ax.set_ylabel('Hz')
+
+
+class ImageDisplayTemplate:
+    """
+    可重複使用的頻譜顯示圖 (imshow + colorbar)。
+
+    Example:
+        >>> template = get_display_template(('stft',), lambda: ImageDisplayTemplate((6, 4), colorbar_format='%+2.0f dB'))
+        >>> template.render(S_db, (0, duration, 0, sr / 2), 'STFT Spectrogram', out_path)
+    """
+
+    def __init__(self, figsize, cmap='magma', colorbar_format=None, colorbar_label=None, setup_axes=None):
+        self.fig = Figure(figsize=figsize)
+        FigureCanvas(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        self.image = self.ax.imshow(
+            np.zeros((1, 1)), origin='lower', aspect='auto', interpolation='nearest',
+            cmap=cmap, extent=(0, 1, 0, 1)
+        )
+        self.colorbar = self.fig.colorbar(self.image, ax=self.ax, format=colorbar_format, label=colorbar_label)
+        if setup_axes:
+            setup_axes(self.ax)
+        self.laid_out = False
+
+    def render(self, data, extent, title, out_path, cmap=None, ylim=None, encoder=None):
+        """
+        替換影像資料並輸出。
+
+        Args:
+            data (np.ndarray): [n_rows, n_cols] 矩陣 (第 0 列在下方)
+            extent (tuple): (x0, x1, y0, y1) 資料座標範圍
+            title (str): 標題
+            out_path (str): 輸出路徑
+            cmap (str | None): 與樣板不同時切換 colormap
+            ylim (tuple | None): y 軸顯示範圍，預設為 extent 的 y 範圍
+            encoder (ImageEncoder | None): 輸出格式，None 時使用顯示用圖的預設格式
+        """
+        finite = data[np.isfinite(data)]
+        vmin, vmax = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+        self.image.set_data(data)
+        self.image.set_extent(extent)
+        self.image.set_clim(vmin, vmax)
+        if cmap and cmap != self.image.get_cmap().name:
+            self.image.set_cmap(cmap)
+        self.ax.set_xlim(extent[0], extent[1])
+        self.ax.set_ylim(ylim if ylim is not None else (extent[2], extent[3]))
+        self.ax.set_title(title)
+        if not self.laid_out:
+            self.fig.tight_layout()
+            self.laid_out = True
+        (encoder or get_encoder(kind='display')).save_figure(self.fig, out_path, 'display', dpi=100)
+
+
+class LineDisplayTemplate:
+    """
+    可重複使用的折線圖 (包絡線頻譜)，y 軸依每次資料自動縮放。
+
+    Args:
+        figsize (tuple): 圖尺寸 (吋)
+        xlim (tuple): 固定的 x 軸範圍
+        axis_off (bool): 是否為無座標軸的訓練用純圖 (決定預設的輸出格式與統計分類)
+    """
+
+    def __init__(self, figsize, xlim, xlabel=None, ylabel=None, axis_off=False):
+        self.fig = Figure(figsize=figsize)
+        FigureCanvas(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        self.line, = self.ax.plot([], [])
+        self.xlim = xlim
+        self.axis_off = axis_off
+        if axis_off:
+            self.ax.axis('off')
+            self.fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+        else:
+            self.ax.set_xlabel(xlabel)
+            self.ax.set_ylabel(ylabel)
+            self.ax.grid(True)
+        self.laid_out = axis_off
+
+    def render(self, x, y, out_path, title=None, encoder=None):
+        """替換折線資料並輸出"""
+        self.line.set_data(x, y)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.ax.set_xlim(*self.xlim)
+        if title is not None:
+            self.ax.set_title(title)
+        if not self.laid_out:
+            self.fig.tight_layout()
+            self.laid_out = True
+        kind = 'training' if self.axis_off else 'display'
+        encoder = encoder or get_encoder(kind=kind)
+        if self.axis_off:
+            encoder.save_figure(self.fig, out_path, kind, bbox_inches='tight', pad_inches=0, dpi=100)
+        else:
+            encoder.save_figure(self.fig, out_path, kind, dpi=100)
@@ -0,0 +1,168 @@
+"""
+頻譜矩陣儲存模組。
+
+此模組負責：
+1. 處理音檔時，將每個片段的頻譜矩陣 (與訓練用圖同源) 寫入單一 float16 陣列檔
+2. 以 JSON 索引記錄矩陣形狀、頻譜參數與實際寫入的片段編號
+3. 提供以片段編號讀取矩陣的介面 (記憶體映射，不需解碼 PNG)；
+   顯示端點 (/results/<id>/spectrogram) 以此直接繪製 stft / mel / yamnet_log_mel 的顯示用圖，
+   不需重新解碼音訊與計算頻譜 (見 audio_utils.render_display_from_store)
+
+設計模式：
+- 檔案結構：<result_dir>/spectrograms.npy 與 <result_dir>/spectrograms.json
+- .npy 形狀為 [片段數, *單一片段矩陣形狀]，第 i 列即片段 i (與 _spec_training_{i}.png 對應)
+- 寫入端依預估片段數預先配置記憶體映射檔，各 worker 執行緒直接寫入自己的列
+- 實際片段數與預估不同時 (串流重取樣的尾端誤差)，於 close() 重建為正確長度
+
+矩陣內容 (依 spec_type)：
+- stft / mel: 訓練用圖的 dB 矩陣 [freq, time] (含時間軸 max pooling)
+- yamnet_log_mel: Log Mel 矩陣 [n_mels, time]
+- classic_demon: mlab.specgram 的 dB 矩陣 [freq, time] (未裁切 FREQ_YLIM)
+- envelope_spectrum: 包絡線頻譜幅度的 dB 值 20·log10(幅度 + ENVELOPE_DB_EPS) [freq]
+  (線性幅度約 1e-3 – 1e-6，直接存為 float16 會失去精度或歸零)
+
+磁碟用量：每片段 2 bytes × 矩陣元素數 (例如 128 × 188 的 Mel 矩陣約 48 KB，10 萬片段約 4.8 GB)，
+因此預設不儲存，由上傳表單的「儲存頻譜矩陣」選用 (process_large_audio 的 save_tensors)。
+"""
+
+import os
+import json
+import threading
+import numpy as np
+
+STORE_FILENAME = 'spectrograms.npy'
+INDEX_FILENAME = 'spectrograms.json'
+STORE_DTYPE = np.float16
+
+# 包絡線頻譜幅度轉為 dB 時加上的下限 (對應 -240 dB)
+ENVELOPE_DB_EPS = 1e-12
+
+# close() 重建檔案時每次複製的列數
+_COPY_ROWS = 1024
+
+
+class SpectrogramStoreWriter:
+    """
+    執行緒安全的頻譜矩陣寫入器。
+
+    Attributes:
+        result_dir (str): 結果資料夾
+        capacity (int): 預先配置的列數 (預估片段數)
+        meta (dict): 寫入索引的附加資訊 (spec_type、sr、片段長度等)
+
+    Example:
+        >>> writer = SpectrogramStoreWriter(result_dir, total_segments, {'spec_type': 'mel'})
+        >>> writer.write(0, S_db)
+        >>> writer.close()
+    """
+
+    def __init__(self, result_dir, capacity, meta=None):
+        self.result_dir = result_dir
+        self.capacity = max(1, int(capacity))
+        self.meta = meta or {}
+        self.path = os.path.join(result_dir, STORE_FILENAME)
+        self._array = None
+        self._row_shape = None
+        self._written = set()
+        self._overflow = {}
+        self._lock = threading.Lock()
+
+    def write(self, index, matrix):
+        """寫入片段 index 的矩陣；形狀與第一個片段不同時略過"""
+        matrix = np.asarray(matrix)
+        with self._lock:
+            if self._array is None:
+                self._row_shape = matrix.shape
+                self._array = np.lib.format.open_memmap(
+                    self.path, mode='w+', dtype=STORE_DTYPE, shape=(self.capacity,) + matrix.shape
+                )
+            if matrix.shape != self._row_shape:
+                print(f"[spectrogram_store] 片段 {index} 形狀 {matrix.shape} 與 {self._row_shape} 不同，略過儲存")
+                return
+            self._written.add(index)
+            if index >= self.capacity:
+                self._overflow[index] = matrix.astype(STORE_DTYPE)
+                return
+        # 各片段寫入不同列，不需持有鎖
+        self._array[index] = matrix
+
+    def close(self):
+        """
+        完成寫入：修正列數並輸出索引。
+
+        Returns:
+            str | None: 索引檔路徑；沒有任何片段寫入時回傳 None
+        """
+        with self._lock:
+            if self._array is None:
+                return None
+            n_rows = max(self._written) + 1
+            self._array.flush()
+            if n_rows != self.capacity:
+                self._rebuild(n_rows)
+            self._array = None
+
+            index = {
+                'dtype': np.dtype(STORE_DTYPE).name,
+                'shape': [n_rows] + list(self._row_shape),
+                'segments': sorted(self._written),
+                **self.meta
+            }
+        index_path = os.path.join(self.result_dir, INDEX_FILENAME)
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        return index_path
+
+    def _rebuild(self, n_rows):
+        """依實際片段數重建陣列檔 (預估片段數不準確時)"""
+        tmp_path = f"{self.path}.tmp"
+        rebuilt = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=STORE_DTYPE, shape=(n_rows,) + self._row_shape)
+        copy_rows = min(n_rows, self.capacity)
+        for start in range(0, copy_rows, _COPY_ROWS):
+            stop = min(start + _COPY_ROWS, copy_rows)
+            rebuilt[start:stop] = self._array[start:stop]
+        for index, matrix in self._overflow.items():
+            rebuilt[index] = matrix
+        rebuilt.flush()
+        del rebuilt
+        self._array = None
+        os.replace(tmp_path, self.path)
+
+
+class SpectrogramStore:
+    """
+    以記憶體映射讀取某個音檔的頻譜矩陣。
+
+    Example:
+        >>> store = SpectrogramStore.open(result_dir)
+        >>> if store is not None and 3 in store:
+        ...     S_db = store.get(3)
+    """
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+        self._segments = set(index.get('segments', []))
+
+    @classmethod
+    def open(cls, result_dir):
+        """開啟結果資料夾中的矩陣檔；不存在 (舊資料) 時回傳 None"""
+        path = os.path.join(result_dir, STORE_FILENAME)
+        index_path = os.path.join(result_dir, INDEX_FILENAME)
+        if not os.path.exists(path) or not os.path.exists(index_path):
+            return None
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        return cls(np.load(path, mmap_mode='r'), index)
+
+    def __contains__(self, segment_index):
+        return segment_index in self._segments
+
+    def __len__(self):
+        return len(self._segments)
+
+    def get(self, segment_index):
+        """取得片段的矩陣 (float32)；片段未寫入時拋出 KeyError"""
+        if segment_index not in self._segments:
+            raise KeyError(segment_index)
+        return np.asarray(self.array[segment_index], dtype=np.float32)
@@ -1,16 +1,49 @@
+import threading
+
+from celery.signals import worker_process_init, worker_ready
+
 from . import celery
 from .services.audio_service import AudioService
 from .ml.yolo_trainer import YoloTrainer
 from .ml.cnn_trainer import CnnTrainer
 from .ml.inference import InferenceService
+from .cpu_budget import cpu_budget
+from .model_registry import model_registry
+
+
+# --- Worker 啟動：預先載入模型 ---
+def _start_preload():
+    """
+    於背景執行緒載入 PRELOAD_MODELS 指定的模型 (未設定時為 app/models/best.pt，見 model_registry)。
+    不阻塞 worker 啟動 (prefork 子行程初始化有逾時限制)；載入完成前開始的任務會等待同一模型載入完成，不會重複載入。
+    """
+    threading.Thread(target=model_registry.preload, name='model-preload', daemon=True).start()
+
+
+@worker_process_init.connect
+def preload_models(**kwargs):
+    """prefork 模式：每個子行程啟動時載入"""
+    _start_preload()
+
+
+@worker_ready.connect
+def preload_models_in_worker(sender=None, **kwargs):
+    """--pool=threads / solo 模式不會觸發 worker_process_init，任務於主行程執行，在此載入"""
+    pool = getattr(sender, 'pool', None)
+    if pool is not None and type(pool).__module__.endswith('prefork'):
+        return
+    _start_preload()
+
 
 # --- 任務 1: 音訊處理 ---
 @celery.task(name='app.tasks.process_audio_task', bind=True)
 def process_audio_task(self, audio_id):
     """
     背景任務：處理上傳的音訊檔案，切割成片段並產生頻譜圖。
+    各任務於 CPU 預算租約內執行，同時執行的任務平均分配 worker 的核心 (見 cpu_budget)。
     """
-    AudioService.process_audio(audio_id)
+    with cpu_budget.lease('process_audio'):
+        AudioService.process_audio(audio_id)
 
 
 # --- 任務 2: 模型訓練 ---
@@ -19,7 +52,8 @@ def train_yolo_model(upload_ids, training_run_id, model_name='yolov8n-cls.pt', t
     """
     背景任務：使用已標記的資料來訓練 YOLOv8 分類模型。
     """
-    YoloTrainer.train(upload_ids, training_run_id, model_name, train_params)
+    with cpu_budget.lease('train_yolo'):
+        YoloTrainer.train(upload_ids, training_run_id, model_name, train_params)
 
 
 @celery.task(name='app.tasks.train_cnn_model')
@@ -27,7 +61,8 @@ def train_cnn_model(upload_ids, training_run_id, model_name='resnet18', train_pa
     """
     背景任務：使用 PyTorch 訓練 CNN 分類模型 (ResNet18, EfficientNet-B0)。
     """
-    CnnTrainer.train(upload_ids, training_run_id, model_name, train_params)
+    with cpu_budget.lease('train_cnn'):
+        CnnTrainer.train(upload_ids, training_run_id, model_name, train_params)
 
 
 # --- 任務 3: AI 自動標記 ---
@@ -36,7 +71,8 @@ def auto_label_task(upload_id, model_path, model_type='yolo', classes_str=''):
     """
     背景任務：對 CetaceanInfo 進行自動標記。
     """
-    InferenceService.auto_label(upload_id, model_path, model_type, classes_str)
+    with cpu_budget.lease('auto_label'):
+        InferenceService.auto_label(upload_id, model_path, model_type, classes_str)
 
 
 @celery.task(name='app.tasks.auto_label_task_v2')
@@ -44,4 +80,5 @@ def auto_label_task_v2(upload_id, model_path, model_type='yolov8n-cls', classes_
     """
     背景任務：對 CetaceanInfo 進行自動標記 (V2)。
     """
-    InferenceService.auto_label_v2(upload_id, model_path, model_type, classes_list)
\ No newline at end of file
+    with cpu_budget.lease('auto_label_v2'):
+        InferenceService.auto_label_v2(upload_id, model_path, model_type, classes_list)
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+整檔頻譜圖多解析度圖磚 (tile pyramid) 模組。
+
+此模組負責：
+1. 處理音檔時，以串流方式對整個錄音做一次 STFT (不受片段重疊影響，每個樣本只算一次)
+2. 將頻譜量化為 dBFS 灰階，依時間軸逐層 2:1 max pooling 建立多解析度圖磚
+3. 瀏覽時將灰階圖磚依整檔的 dB 範圍套用色彩對照表，只傳送畫面可見的圖磚
+
+設計模式：
+- 檔案結構：<result_dir>/tiles/<depth>/<index>.png 與 <result_dir>/tiles/pyramid.json
+- depth 0 為原始解析度 (每個像素 = 一個 STFT frame)，depth 每加 1 時間解析度減半，
+  最高一層只有一張圖磚 (涵蓋整個錄音)
+- 圖磚寬 TILE_SIZE 欄 (最後一張可較窄)，頻率方向於 [f_min, f_max] 內 max pooling 為至多 TILE_SIZE 列
+- 灰階值為 [DB_FLOOR, DB_CEIL] dBFS 的線性量化，與錄音音量無關；
+  顯示範圍 (最大值 - DISPLAY_RANGE_DB) 於建立完成後由整檔的 dB 分布決定
+- 只保留每層未滿一張圖磚的欄位，峰值記憶體與錄音長度無關
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+
+from .dsp_cache import get_window
+
+TILE_SIZE = 256
+DB_FLOOR = -160.0
+DB_CEIL = 10.0
+# 顯示範圍：整檔第 99.9 百分位數往下 80 dB (與 power_to_db 的 top_db 相同)
+DISPLAY_RANGE_DB = 80.0
+DISPLAY_PERCENTILE = 99.9
+
+PYRAMID_DIRNAME = 'tiles'
+INDEX_FILENAME = 'pyramid.json'
+
+_DB_STEP = (DB_CEIL - DB_FLOOR) / 255.0
+
+
+def pyramid_dir(result_dir):
+    return os.path.join(result_dir, PYRAMID_DIRNAME)
+
+
+def load_pyramid_index(result_dir):
+    """讀取 pyramid.json；未建立圖磚時回傳 None"""
+    path = os.path.join(pyramid_dir(result_dir), INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class TilePyramidBuilder:
+    """
+    以串流方式建立整檔頻譜圖磚。
+
+    Attributes:
+        sr (int): 取樣率
+        n_fft (int): FFT 長度
+        hop_length (int): STFT 步長 (原始解析度下每個像素的樣本數)
+
+    Example:
+        >>> builder = TilePyramidBuilder(result_dir, sr, spec_params)
+        >>> for block_start, block in blocks:
+        ...     builder.feed(block, block_start)
+        >>> builder.close()
+    """
+
+    def __init__(self, result_dir, sr, spec_params=None):
+        spec_params = spec_params or {}
+        self.root = pyramid_dir(result_dir)
+        self.sr = sr
+        self.n_fft = int(spec_params.get('n_fft', 1024))
+        self.hop_length = max(1, int(spec_params.get('hop_length', self.n_fft // 2)))
+        self.window = get_window(spec_params.get('window_type', 'hann'), self.n_fft)
+        # 以 0 dBFS 正弦波的峰值為 0 dB
+        self.scale = 2.0 / self.window.sum()
+
+        f_min = float(spec_params.get('f_min', 0) or 0)
+        f_max = float(spec_params.get('f_max', 0) or 0)
+        if f_max <= 0 or f_max > sr / 2:
+            f_max = sr / 2
+        freqs = np.fft.rfftfreq(self.n_fft, 1.0 / sr)
+        self.bins = np.flatnonzero((freqs >= f_min) & (freqs <= f_max))
+        if self.bins.size == 0:
+            self.bins = np.arange(len(freqs))
+        self.f_min, self.f_max = float(freqs[self.bins[0]]), float(freqs[self.bins[-1]])
+        # 頻率 bin 超過 TILE_SIZE 時，分為 TILE_SIZE 組取最大值
+        n_rows = min(TILE_SIZE, self.bins.size)
+        self.row_starts = np.linspace(0, self.bins.size, n_rows + 1).astype(int)[:-1]
+
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._consumed = 0
+        self._buffers = []  # 每層尚未輸出成圖磚的欄位 [rows, cols] (uint8)
+        self._tile_counts = []
+        self._column_counts = []
+        self._histogram = np.zeros(256, dtype=np.int64)
+
+    def feed(self, block, block_start):
+        """
+        餵入音訊區塊 (block_start 為區塊第一個樣本的絕對位置)。
+        區塊之間可以重疊 (片段重疊時的 carry-over)，已處理過的樣本會略過。
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim > 1:
+            block = block.mean(axis=0)
+        skip = self._consumed - block_start
+        if skip >= block.shape[-1]:
+            return
+        new = block[max(0, skip):]
+        self._consumed = block_start + block.shape[-1]
+
+        x = np.concatenate([self._tail, new]) if self._tail.size else new
+        n_frames = (len(x) - self.n_fft) // self.hop_length + 1 if len(x) >= self.n_fft else 0
+        if n_frames <= 0:
+            self._tail = x.copy()
+            return
+        frames = sliding_window_view(x, self.n_fft)[::self.hop_length][:n_frames]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)[:, self.bins]
+        power = (np.abs(spectrum) * self.scale) ** 2
+        columns = np.maximum.reduceat(power, self.row_starts, axis=1).T
+        self._tail = x[n_frames * self.hop_length:].copy()
+        self._push(0, self._quantize(columns))
+
+    def _quantize(self, power):
+        db = 10.0 * np.log10(power + 1e-20)
+        return np.clip(np.rint((db - DB_FLOOR) / _DB_STEP), 0, 255).astype(np.uint8)
+
+    def _push(self, depth, columns):
+        if depth == len(self._buffers):
+            self._buffers.append(np.zeros((columns.shape[0], 0), dtype=np.uint8))
+            self._tile_counts.append(0)
+            self._column_counts.append(0)
+        if depth == 0:
+            self._histogram += np.bincount(columns.ravel(), minlength=256)
+        self._column_counts[depth] += columns.shape[1]
+        buffer = np.concatenate([self._buffers[depth], columns], axis=1)
+        while buffer.shape[1] >= TILE_SIZE:
+            self._write_tile(depth, buffer[:, :TILE_SIZE])
+            self._push(depth + 1, _pool_columns(buffer[:, :TILE_SIZE]))
+            buffer = buffer[:, TILE_SIZE:]
+        self._buffers[depth] = buffer
+
+    def _write_tile(self, depth, tile):
+        index = self._tile_counts[depth]
+        self._tile_counts[depth] += 1
+        level_dir = os.path.join(self.root, str(depth))
+        if index == 0:
+            os.makedirs(level_dir, exist_ok=True)
+        # 影像第 0 列為最高頻
+        Image.fromarray(np.ascontiguousarray(tile[::-1]), 'L').save(
+            os.path.join(level_dir, f"{index}.png"), format='PNG', compress_level=1
+        )
+
+    def close(self):
+        """
+        輸出各層剩餘欄位並寫入 pyramid.json。
+
+        Returns:
+            dict | None: 索引內容；錄音短於一個 FFT 長度時回傳 None
+        """
+        if not self._buffers:
+            return None
+        depth = 0
+        while True:
+            buffer = self._buffers[depth]
+            self._buffers[depth] = buffer[:, :0]
+            top = self._column_counts[depth] <= TILE_SIZE
+            if buffer.shape[1]:
+                self._write_tile(depth, buffer)
+                if not top:
+                    self._push(depth + 1, _pool_columns(buffer))
+            if top:
+                break
+            depth += 1
+        # 片段數恰好填滿整數張圖磚時，串流過程可能已多建立更高的層，予以移除
+        for extra in range(depth + 1, len(self._buffers)):
+            shutil.rmtree(os.path.join(self.root, str(extra)), ignore_errors=True)
+
+        cumulative = np.cumsum(self._histogram)
+        q_max = int(np.searchsorted(cumulative, cumulative[-1] * DISPLAY_PERCENTILE / 100.0))
+        db_max = DB_FLOOR + q_max * _DB_STEP
+        index = {
+            'tile_size': TILE_SIZE,
+            'levels': depth + 1,
+            'columns': self._column_counts[:depth + 1],
+            'tiles': self._tile_counts[:depth + 1],
+            'rows': len(self.row_starts),
+            'sr': self.sr,
+            'n_fft': self.n_fft,
+            'hop_length': self.hop_length,
+            'seconds_per_column': self.hop_length / self.sr,
+            'duration': self._consumed / self.sr,
+            'f_min': self.f_min,
+            'f_max': self.f_max,
+            'db_floor': DB_FLOOR,
+            'db_ceil': DB_CEIL,
+            'db_max': db_max,
+            'db_min': db_max - DISPLAY_RANGE_DB,
+        }
+        with open(os.path.join(self.root, INDEX_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        return index
+
+
+def _pool_columns(tile):
+    """時間方向 2:1 max pooling (欄數為奇數時最後一欄單獨成一欄)"""
+    if tile.shape[1] % 2:
+        tile = np.concatenate([tile, tile[:, -1:]], axis=1)
+    return np.maximum(tile[:, 0::2], tile[:, 1::2])
+
+
+def tile_color_table(index, cmap='magma'):
+    """
+    建立灰階值 (0-255) 到 RGB 的對照表 [256, 3]，以整檔的顯示範圍 (db_min, db_max) 正規化。
+    """
+    from .spectrogram_render import get_colormap_lut
+    lut = get_colormap_lut(cmap)
+    db = index['db_floor'] + np.arange(256) * (index['db_ceil'] - index['db_floor']) / 255.0
+    span = max(index['db_max'] - index['db_min'], 1e-6)
+    scaled = (db - index['db_min']) / span * len(lut)
+    return lut[np.clip(scaled, 0, len(lut) - 1).astype(np.intp)]
+
+
+def render_tile(result_dir, depth, tile_index, table, height=TILE_SIZE):
+    """
+    讀取灰階圖磚並套用色彩對照表，回傳 [height, width, 3] uint8 影像；圖磚不存在時回傳 None。
+
+    頻率列數少於 height 時以最近鄰放大，讓所有圖磚高度一致。
+    """
+    path = os.path.join(pyramid_dir(result_dir), str(int(depth)), f"{int(tile_index)}.png")
+    if not os.path.exists(path):
+        return None
+    with Image.open(path) as img:
+        gray = np.asarray(img)
+    if gray.shape[0] != height:
+        rows = (np.arange(height) * gray.shape[0] // height)
+        gray = gray[rows]
+    return table[gray]
@@ -0,0 +1,26 @@
+"""
+測試共用設定。
+
+- 完整環境 (已安裝 Flask / Flask-SQLAlchemy / Celery)：以記憶體內 SQLite 取代 MySQL，正常匯入 app 套件
+- 只有 DSP 相依套件時：以不執行 app/__init__.py 的空套件取代 app，
+  spectrogram_engine 等不依賴 Flask 的模組仍可匯入；需要 Flask / torch 的測試以 pytest.importorskip 略過
+"""
+
+import os
+import sys
+import types
+import importlib.util
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def _installed(*modules):
+    return all(importlib.util.find_spec(name) is not None for name in modules)
+
+
+if 'app' not in sys.modules and not _installed('flask', 'flask_sqlalchemy', 'celery'):
+    _package = types.ModuleType('app')
+    _package.__path__ = [APP_DIR]
+    sys.modules['app'] = _package
@@ -0,0 +1,77 @@
+"""串流解碼與完整載入的片段一致性測試"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+sf = pytest.importorskip('soundfile')
+librosa = pytest.importorskip('librosa')
+
+from app.audio_utils import _iter_stream_blocks, _iter_memory_blocks, _open_pcm_memmap, _mono_float_block
+from app.spectrogram_engine import segment_frames
+
+ORIGINAL_SR = 44100
+
+
+@pytest.fixture
+def wav_path(tmp_path):
+    path = tmp_path / 'stereo.wav'
+    y = np.random.default_rng(0).standard_normal((ORIGINAL_SR * 3, 2)) * 0.1
+    sf.write(path, y.astype(np.float32), ORIGINAL_SR, subtype='PCM_16')
+    return str(path)
+
+
+def _segments(blocks, frame_length, step_samples):
+    """將區塊產生器的輸出展開為依片段編號排列的 [n_segments, ..., frame_length]"""
+    segments = []
+    for first_idx, block in blocks:
+        assert first_idx == len(segments)
+        frames = segment_frames(block, frame_length, step_samples)
+        segments.extend(np.moveaxis(frames, -2, 0))
+    return np.array(segments)
+
+
+@pytest.mark.parametrize('sr', [ORIGINAL_SR, 16000])
+@pytest.mark.parametrize('is_mono', [True, False])
+def test_stream_blocks_match_full_load(wav_path, sr, is_mono):
+    frame_length = int(0.2 * sr)
+    step_samples = frame_length // 2
+
+    full_audio, _ = librosa.load(wav_path, sr=sr, mono=is_mono)
+    expected = _segments(_iter_memory_blocks(full_audio, sr, frame_length, step_samples), frame_length, step_samples)
+    # 區塊長度遠小於錄音長度，確保跨區塊的 carry-over 與重取樣狀態都被用到
+    streamed = _segments(
+        _iter_stream_blocks(wav_path, sr, is_mono, frame_length, step_samples, block_seconds=0.5),
+        frame_length, step_samples
+    )
+
+    assert streamed.shape == expected.shape
+    np.testing.assert_array_equal(streamed, expected)
+
+
+def test_memmap_blocks_match_full_load(wav_path):
+    frame_length = int(0.2 * ORIGINAL_SR)
+    step_samples = frame_length // 2
+
+    rate, mapped = _open_pcm_memmap(wav_path)
+    assert rate == ORIGINAL_SR
+    mapped_segments = _segments(
+        ((i, _mono_float_block(block, True)) for i, block in
+         _iter_memory_blocks(mapped, rate, frame_length, step_samples, block_seconds=0.5)),
+        frame_length, step_samples
+    )
+    full_audio, _ = librosa.load(wav_path, sr=None, mono=True)
+    expected = _segments(_iter_memory_blocks(full_audio, rate, frame_length, step_samples), frame_length, step_samples)
+
+    np.testing.assert_allclose(mapped_segments, expected, atol=1e-7)
+
+
+def test_stream_short_audio_is_padded(tmp_path):
+    path = str(tmp_path / 'short.wav')
+    sf.write(path, np.full(1000, 0.5, dtype=np.float32), ORIGINAL_SR)
+
+    blocks = list(_iter_stream_blocks(path, ORIGINAL_SR, True, 4410, 2205))
+    assert len(blocks) == 1
+    first_idx, block = blocks[0]
+    assert first_idx == 0 and block.shape == (4410,)
+    assert np.all(block[1000:] == 0)
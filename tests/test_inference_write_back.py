@@ -0,0 +1,55 @@
+"""自動標記結果批次寫回 (UPDATE ... WHERE id IN) 的測試"""
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from app import app as flask_app, db
+from app.models import CetaceanInfo
+from app.ml import inference
+
+
+@pytest.fixture
+def session():
+    with flask_app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.rollback()
+        CetaceanInfo.query.delete()
+        db.session.commit()
+
+
+def _add_rows(session, n, audio_id=1):
+    rows = [CetaceanInfo(audio_id=audio_id, event_type=0, detect_type=2) for _ in range(n)]
+    session.add_all(rows)
+    session.commit()
+    return [row.id for row in rows]
+
+
+def test_write_predictions_updates_matched_rows(session, monkeypatch):
+    monkeypatch.setattr(inference, 'WRITE_BACK_CHUNK_SIZE', 2)
+    ids = _add_rows(session, 7)
+    updates = [(ids[0], 3), (ids[1], 1), (ids[2], 3), (ids[3], 3), (ids[5], 1)]
+
+    assert inference._write_predictions(updates) == len(updates)
+    session.commit()
+
+    rows = {row.id: row for row in CetaceanInfo.query.all()}
+    for cetacean_id, event_type in updates:
+        assert (rows[cetacean_id].event_type, rows[cetacean_id].detect_type) == (event_type, 1)
+    # 未出現在預測中的片段維持原狀
+    for cetacean_id in (ids[4], ids[6]):
+        assert (rows[cetacean_id].event_type, rows[cetacean_id].detect_type) == (0, 2)
+
+
+def test_write_predictions_is_part_of_caller_transaction(session):
+    ids = _add_rows(session, 3)
+
+    inference._write_predictions([(ids[0], 5)])
+    session.rollback()
+
+    assert session.get(CetaceanInfo, ids[0]).event_type == 0
+
+
+def test_write_predictions_empty():
+    assert inference._write_predictions([]) == 0
@@ -0,0 +1,96 @@
+"""模型快取 (ModelRegistry) 的並行載入、key 與 LRU 測試"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import model_registry as registry_module
+from app.model_registry import ModelRegistry
+
+
+class _FakeLoader:
+    """記錄呼叫次數的載入器，載入時稍作等待以放大並行競爭"""
+
+    def __init__(self, delay=0.05, fail_times=0):
+        self.calls = []
+        self.delay = delay
+        self.fail_times = fail_times
+        self._lock = threading.Lock()
+
+    def __call__(self, path, device, model_type, **loader_kwargs):
+        with self._lock:
+            self.calls.append(loader_kwargs)
+            fail = len(self.calls) <= self.fail_times
+        time.sleep(self.delay)
+        if fail:
+            raise RuntimeError('載入失敗')
+        return object(), {'kwargs': loader_kwargs}
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    fake = _FakeLoader()
+    monkeypatch.setattr(registry_module, '_get_loader', lambda model_type: fake)
+    return fake
+
+
+@pytest.fixture
+def weights(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'best_{i}.pt'
+        path.write_bytes(b'weights')
+        paths.append(str(path))
+    return paths
+
+
+def test_concurrent_get_loads_once(loader, weights):
+    registry = ModelRegistry()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        entries = list(executor.map(lambda _: registry.get(weights[0], 'cpu', 'resnet18'), range(64)))
+
+    assert len(loader.calls) == 1
+    assert all(entry is entries[0] for entry in entries)
+    assert registry.misses == 1
+    assert not registry._loading
+
+
+def test_loader_kwargs_are_part_of_key(loader, weights):
+    registry = ModelRegistry()
+    two = registry.get(weights[0], 'cpu', 'resnet18', num_classes=2)
+    five = registry.get(weights[0], 'cpu', 'resnet18', num_classes=5)
+
+    assert two is not five
+    assert five.meta['kwargs'] == {'num_classes': 5}
+    assert registry.get(weights[0], 'cpu', 'resnet18', num_classes=2) is two
+    assert len(loader.calls) == 2
+
+
+def test_failed_load_is_not_cached(monkeypatch, weights):
+    fake = _FakeLoader(fail_times=1)
+    monkeypatch.setattr(registry_module, '_get_loader', lambda model_type: fake)
+    registry = ModelRegistry()
+
+    with pytest.raises(RuntimeError):
+        registry.get(weights[0], 'cpu', 'yolo')
+    assert not registry._loading and not registry._items
+
+    entry = registry.get(weights[0], 'cpu', 'yolo')
+    assert registry.get(weights[0], 'cpu', 'yolo') is entry
+    assert len(fake.calls) == 2
+    assert not registry._loading
+
+
+def test_lru_eviction(loader, weights):
+    registry = ModelRegistry(maxsize=2)
+    first = registry.get(weights[0])
+    registry.get(weights[1])
+    registry.get(weights[0])    # weights[0] 成為最近使用
+    registry.get(weights[2])    # 淘汰 weights[1]
+
+    assert registry.get(weights[0]) is first
+    assert len(registry._items) == 2
+    registry.get(weights[1])
+    assert len(loader.calls) == 4
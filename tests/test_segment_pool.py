@@ -0,0 +1,61 @@
+"""片段處理行程池 (spawn + shared memory) 的測試"""
+
+import sys
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('torch')
+
+from app.segment_pool import BlockArena, run_segment, _init_worker
+
+
+def _worker_state():
+    """在 worker 行程中執行：回報 app 套件是否建立了 Flask 應用程式"""
+    import app.segment_pool  # noqa: F401  與實際工作相同的匯入路徑
+    package = sys.modules['app']
+    return {
+        'has_app': hasattr(package, 'app'),
+        'routers_loaded': 'app.main_router' in sys.modules,
+        'audio_utils_loaded': 'app.audio_utils' in sys.modules,
+    }
+
+
+@pytest.fixture(scope='module')
+def pool():
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+    )
+    yield executor
+    executor.shutdown()
+
+
+def test_spawned_worker_does_not_create_app(pool):
+    state = pool.submit(_worker_state).result(timeout=300)
+    assert not state['has_app']
+    assert not state['routers_loaded']
+
+
+def test_run_segment_in_spawned_worker(pool, tmp_path):
+    sr, frame_length = 16000, 16000
+    block = np.random.default_rng(0).standard_normal(frame_length * 2).astype(np.float32)
+    arena = BlockArena(block, None, 1)
+    try:
+        result = pool.submit(
+            run_segment, arena.spec, frame_length // 2, frame_length,
+            dict(i=0, start_s=0.5, sr=sr, basename='seg', result_dir=str(tmp_path), spec_type='stft',
+                 spec_params={'n_fft': 512, 'hop_length': 256}, training_spec_path=str(tmp_path / 'seg_spec_training_0.png'),
+                 is_mono=True),
+            True
+        ).result(timeout=300)
+    finally:
+        arena.close()
+
+    assert (tmp_path / 'seg_spec_training_0.png').exists()
+    assert result['matrix'].shape == (257, 1 + frame_length // 256)
+    assert result['training_spectrogram'] == 'seg_spec_training_0.png'
+    assert pool.submit(_worker_state).result(timeout=300)['audio_utils_loaded']
+    assert not pool.submit(_worker_state).result(timeout=300)['has_app']
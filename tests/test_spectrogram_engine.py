@@ -0,0 +1,151 @@
+"""spectrogram_engine 的回歸測試 (BandLimitedStft 窄頻帶、與逐片段計算的一致性、DEMON 跨區塊濾波器狀態)"""
+
+import librosa
+import numpy as np
+import pytest
+from scipy.signal import sosfilt
+
+from app.spectrogram_engine import BandLimitedStft, DemonEngine, SpectrogramEngine, segment_frames
+from app.spectrogram_engine import MIN_BAND_BINS, MIN_DECIMATED_N_FFT
+
+SR = 48000
+
+
+def _band(f_min, f_max, method='fft', n_fft=1024, hop_length=512):
+    return BandLimitedStft.create(SR, {
+        'n_fft': n_fft, 'hop_length': hop_length, 'f_min': f_min, 'f_max': f_max, 'stft_method': method,
+    })
+
+
+@pytest.mark.parametrize('f_min, f_max', [(10, 30), (100, 120), (0, 50), (20, 300)])
+def test_narrow_low_band_keeps_bins(f_min, f_max):
+    band = _band(f_min, f_max)
+    assert len(band.freqs) >= 1
+    assert band.n_fft >= MIN_DECIMATED_N_FFT or band.factor == 1
+
+    S = band.magnitude(np.random.default_rng(0).standard_normal(SR).astype(np.float32))
+    assert S.shape[-2] == len(band.freqs)
+    assert np.all(np.isfinite(S))
+
+
+def test_band_narrower_than_bin_spacing_uses_nearest_bin():
+    band = _band(10, 30)
+    assert len(band.freqs) == 1
+    spacing = band.sr / band.n_fft
+    assert abs(band.freqs[0] - 20) <= spacing / 2
+
+
+def test_factor_keeps_minimum_bins():
+    band = _band(0, 600)
+    full_bins = np.count_nonzero(np.fft.rfftfreq(1024, 1 / SR) <= 600)
+    assert len(band.freqs) >= min(MIN_BAND_BINS, full_bins)
+    assert band.factor > 1
+
+
+def test_full_band_unchanged():
+    band = _band(0, 0)
+    assert band.is_full_band
+
+
+# 與 audio_utils.CLASSIC_DEMON_PARAMS 相同的前端參數 (直接建構 DemonEngine，不匯入 audio_utils)
+DEMON_PARAMS = {'BANDPASS_LOW': 2000, 'BANDPASS_HIGH': 7500, 'DOWNSAMPLE_RATE': 2000}
+
+
+def _demon_segments(engine, y, frame_length, step_samples, segments_per_block):
+    """依 audio_utils 的區塊切法 (區塊起點對齊片段起點、相鄰區塊重疊) 依序送入引擎，回傳各片段的降取樣訊號"""
+    total = (len(y) - frame_length) // step_samples + 1
+    segments = []
+    for first_idx in range(0, total, segments_per_block):
+        n = min(segments_per_block, total - first_idx)
+        block_start = first_idx * step_samples
+        block = y[block_start:block_start + (n - 1) * step_samples + frame_length]
+        shared = engine.compute_block(block, block_start)
+        segments.extend(np.array(shared.segment(j * step_samples)) for j in range(n))
+    return segments
+
+
+def test_demon_filter_state_continues_across_blocks():
+    """分區塊處理 (濾波器狀態 zi 跨區塊延續) 與整段錄音一次處理的結果相同"""
+    sr, frame_length, step_samples = 16000, 4000, 2000
+    y = np.random.default_rng(0).standard_normal(sr * 4)
+
+    whole = _demon_segments(DemonEngine(sr, frame_length, DEMON_PARAMS), y, frame_length, step_samples, 10 ** 6)
+    for segments_per_block in (1, 3, 7):
+        blocked = _demon_segments(DemonEngine(sr, frame_length, DEMON_PARAMS), y, frame_length, step_samples, segments_per_block)
+        assert len(blocked) == len(whole)
+        for a, b in zip(blocked, whole):
+            np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-9)
+
+
+def test_demon_matches_single_pass_filter():
+    """片段內容等於對整段錄音做一次 sosfilt 帶通 → 平方 → 低通後取 factor 倍數索引的樣本"""
+    sr, frame_length, step_samples = 16000, 4000, 2000
+    y = np.random.default_rng(1).standard_normal(sr * 2)
+    engine = DemonEngine(sr, frame_length, DEMON_PARAMS)
+
+    demodulated = sosfilt(engine.lowpass_sos, sosfilt(engine.bandpass_sos, y) ** 2)
+    expected = demodulated[::engine.factor].astype(np.float32)
+
+    segments = _demon_segments(engine, y, frame_length, step_samples, 2)
+    for j, segment in enumerate(segments):
+        first = -(-(j * step_samples) // engine.factor)
+        np.testing.assert_allclose(segment, expected[first:first + len(segment)], rtol=1e-5, atol=1e-7)
+
+
+def _engine_segments(spec_type, sr, spec_params, frame_length, step_samples, y):
+    engine = SpectrogramEngine.create(spec_type, sr, spec_params, frame_length, step_samples)
+    shared = engine.compute_block(y)
+    frames = segment_frames(y, frame_length, step_samples)
+    return engine, frames, [np.asarray(shared.segment(j * step_samples)) for j in range(len(frames))]
+
+
+@pytest.mark.parametrize('spec_params', [
+    {'n_fft': 1024, 'hop_length': 512},
+    {'n_fft': 1024, 'hop_length': 512, 'f_min': 100, 'f_max': 4000},
+])
+def test_stft_engine_matches_per_segment(spec_params):
+    """預設模式 (即使步長為 hop 整數倍) 與逐片段 librosa.stft (center=True 零填補) 完全相同"""
+    frame_length, step_samples = 24576, 12288  # 步長為 hop 的整數倍
+    y = np.random.default_rng(2).standard_normal(SR * 3).astype(np.float32)
+
+    engine, frames, segments = _engine_segments('stft', SR, spec_params, frame_length, step_samples, y)
+    assert engine.mode == 'batched'
+    band = BandLimitedStft.create(SR, spec_params)
+    for frame, segment in zip(frames, segments):
+        np.testing.assert_array_equal(segment, band.magnitude(np.array(frame)))
+    if band.is_full_band:
+        np.testing.assert_array_equal(segments[0], np.abs(librosa.stft(np.array(frames[0]), n_fft=1024, hop_length=512)))
+
+
+def test_mel_engine_matches_per_segment():
+    spec_params = {'n_fft': 1024, 'hop_length': 512, 'n_mels': 64}
+    frame_length, step_samples = 24576, 12288
+    y = np.random.default_rng(3).standard_normal(SR * 3).astype(np.float32)
+
+    engine, frames, segments = _engine_segments('mel', SR, spec_params, frame_length, step_samples, y)
+    assert engine.mode == 'batched'
+    for frame, segment in zip(frames, segments):
+        expected = librosa.feature.melspectrogram(y=np.array(frame), sr=SR, n_fft=1024, hop_length=512, n_mels=64)
+        np.testing.assert_allclose(segment, expected, rtol=1e-5, atol=1e-9)
+
+
+def test_yamnet_engine_matches_per_segment():
+    """YAMNet 預設 hop (160) 整除任何整毫秒的步長，仍須與逐片段計算完全相同"""
+    pytest.importorskip('torch')
+    from app.audio_utils import waveform_to_log_mel_spectrogram_patches, yamnet_params_from_spec_params
+
+    sr, frame_length, step_samples = 16000, 32000, 16000
+    y = np.random.default_rng(4).standard_normal(sr * 5).astype(np.float32)
+
+    engine, frames, segments = _engine_segments('yamnet_log_mel', sr, {}, frame_length, step_samples, y)
+    assert engine.mode == 'batched'
+    params = yamnet_params_from_spec_params({})
+    for frame, segment in zip(frames, segments):
+        np.testing.assert_array_equal(segment, np.asarray(waveform_to_log_mel_spectrogram_patches(np.array(frame), params)))
+
+
+def test_shared_stft_is_opt_in():
+    spec_params = {'n_fft': 1024, 'hop_length': 512, 'shared_stft': True}
+    assert SpectrogramEngine.create('stft', SR, spec_params, 24576, 12288).mode == 'shared'
+    # 步長無法對齊 hop 時退回批次模式
+    assert SpectrogramEngine.create('stft', SR, spec_params, 24576, 12000).mode == 'batched'
@@ -0,0 +1,51 @@
+"""LUT 訓練用圖與 matplotlib (specshow + savefig) 的像素一致性測試"""
+
+import io
+
+import numpy as np
+import pytest
+
+librosa_display = pytest.importorskip('librosa.display')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from PIL import Image
+
+from app.spectrogram_render import render_spectrogram_array, save_training_image, default_cmap, TRAINING_SIZE
+
+
+def _matplotlib_training_image(data, hop_length=512, sr=48000):
+    """與原本 save_spectrogram 相同的訓練用圖繪製流程 (無座標軸純圖)"""
+    fig = Figure(figsize=(6, 4))
+    FigureCanvas(fig)
+    ax = fig.add_subplot(111)
+    librosa_display.specshow(data, sr=sr, ax=ax, hop_length=hop_length)
+    ax.axis('off')
+    fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', pad_inches=0, dpi=100)
+    return np.asarray(Image.open(buffer).convert('RGB'))
+
+
+@pytest.mark.parametrize('shape', [(513, 94), (128, 188), (257, 1000)])
+def test_lut_render_matches_matplotlib(shape):
+    data = -80 * np.random.default_rng(0).random(shape)
+
+    image = render_spectrogram_array(data)
+
+    assert image.shape == (TRAINING_SIZE[1], TRAINING_SIZE[0], 3)
+    np.testing.assert_array_equal(image, _matplotlib_training_image(data))
+
+
+def test_default_cmap_matches_librosa():
+    rng = np.random.default_rng(1)
+    for data in (-80 * rng.random((8, 8)), rng.standard_normal((8, 8))):
+        assert default_cmap(data) == librosa_display.cmap(data).name
+
+
+def test_save_training_image_png_round_trip(tmp_path):
+    data = -80 * np.random.default_rng(2).random((128, 188))
+    out_path = str(tmp_path / 'training.png')
+
+    save_training_image(data, out_path)
+
+    np.testing.assert_array_equal(np.asarray(Image.open(out_path).convert('RGB')), render_spectrogram_array(data))
@@ -0,0 +1,81 @@
+"""頻譜矩陣存檔 (SpectrogramStoreWriter / SpectrogramStore) 的寫入與讀取測試"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.spectrogram_store import SpectrogramStoreWriter, SpectrogramStore, INDEX_FILENAME, STORE_DTYPE
+
+
+def _matrices(n, shape=(16, 12)):
+    rng = np.random.default_rng(0)
+    return [(-80 * rng.random(shape)).astype(np.float32) for _ in range(n)]
+
+
+@pytest.mark.parametrize('capacity', [10, 4, 25])
+def test_round_trip(tmp_path, capacity):
+    """預估片段數與實際相同、偏少 (溢出列) 與偏多 (縮短) 時皆能正確讀回"""
+    matrices = _matrices(10)
+    writer = SpectrogramStoreWriter(str(tmp_path), capacity, {'spec_type': 'mel', 'sr': 48000})
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(writer.write, range(len(matrices)), matrices))
+    assert writer.close() == str(tmp_path / INDEX_FILENAME)
+
+    store = SpectrogramStore.open(str(tmp_path))
+    assert len(store) == len(matrices)
+    assert store.array.shape == (len(matrices), 16, 12)
+    assert store.index['spec_type'] == 'mel'
+    for i, matrix in enumerate(matrices):
+        np.testing.assert_array_equal(store.get(i), matrix.astype(STORE_DTYPE).astype(np.float32))
+
+
+def test_missing_segments_and_shape_mismatch(tmp_path):
+    writer = SpectrogramStoreWriter(str(tmp_path), 5)
+    matrix = np.ones((4, 3), dtype=np.float32)
+    writer.write(0, matrix)
+    writer.write(2, matrix)
+    writer.write(3, np.ones((4, 2), dtype=np.float32))  # 形狀不同，略過
+    writer.close()
+
+    store = SpectrogramStore.open(str(tmp_path))
+    assert 0 in store and 2 in store
+    assert 1 not in store and 3 not in store
+    with pytest.raises(KeyError):
+        store.get(1)
+    with open(tmp_path / INDEX_FILENAME, encoding='utf-8') as f:
+        assert json.load(f)['shape'] == [3, 4, 3]
+
+
+def test_empty_writer_and_missing_store(tmp_path):
+    assert SpectrogramStoreWriter(str(tmp_path), 3).close() is None
+    assert SpectrogramStore.open(str(tmp_path)) is None
+
+
+@pytest.mark.parametrize('spec_type, sr, spec_params, seconds', [
+    ('stft', 48000, {'n_fft': 1024, 'hop_length': 512}, 2),
+    ('stft', 48000, {'n_fft': 256, 'hop_length': 32, 'f_max': 4000}, 3),
+    ('mel', 16000, {'n_fft': 512, 'hop_length': 16, 'n_mels': 64}, 3),   # 時間軸 max pooling
+    ('yamnet_log_mel', 16000, {}, 2),
+])
+def test_display_from_store_matches_audio(tmp_path, spec_type, sr, spec_params, seconds):
+    """由存檔矩陣繪製的顯示用圖與由片段音訊繪製者版面相同 (float16 只造成少量色彩差異)"""
+    pytest.importorskip('torch')
+    from PIL import Image
+    from app.audio_utils import save_spectrogram, render_display_spectrogram, render_display_from_store
+
+    n_samples = sr * seconds
+    y = np.random.default_rng(3).standard_normal(n_samples).astype(np.float32) * np.linspace(0.1, 1, n_samples, dtype=np.float32)
+    writer = SpectrogramStoreWriter(str(tmp_path), 1, {'sr': sr})
+    writer.write(0, save_spectrogram(y, sr, None, str(tmp_path / 'training.png'), spec_type, dict(spec_params)))
+    writer.close()
+
+    from_audio, from_store = str(tmp_path / 'audio.png'), str(tmp_path / 'store.png')
+    assert render_display_spectrogram(y, sr, from_audio, spec_type, spec_params, 1.0)
+    assert render_display_from_store(SpectrogramStore.open(str(tmp_path)).get(0), sr, n_samples, from_store, spec_type, spec_params, 1.0)
+
+    a = np.asarray(Image.open(from_audio).convert('RGB'), dtype=np.int16)
+    b = np.asarray(Image.open(from_store).convert('RGB'), dtype=np.int16)
+    assert a.shape == b.shape
+    assert np.mean(np.any(np.abs(a - b) > 40, axis=-1)) < 0.001